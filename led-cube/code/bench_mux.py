@@ -0,0 +1,122 @@
+"""
+Benchmark lib/mux for bigger cubes: refresh rate, PIO words per frame and
+how much of the Python loop compiling frames takes at a given framerate.
+Frames are compiled by lib/timing, with the default timing profile, as
+code.py compiles them.
+
+Runs on the cube (copy it to CIRCUITPY and `import bench_mux` at the REPL)
+or on a computer with `python3 bench_mux.py`, though only the cube's
+timings mean anything for playback. On a computer the refresh rate is
+measured by running the compiled frames on the simulator's PIO emulator
+(../sim/pio.py), as the cycles from one start of layer 0 to the next; on
+the cube, which can't watch its own pins, it's computed from the timing
+and marked with a *.
+"""
+
+import array
+import random
+import sys
+import time
+
+from lib.mux import DIRECT, SHIFT, PIO_FREQ, Mux
+from lib.timing import Timing
+
+sys.path.append(__file__.rpartition("/")[0] + "/../sim")
+try:
+    import pio
+except ImportError:
+    pio = None
+
+FRAMERATE = 30
+FRAMES = 20
+
+# (N, drive): DIRECT runs out of pins after 4x4x4 (20 pins)
+CUBES = ((3, DIRECT), (4, DIRECT), (4, SHIFT), (8, SHIFT))
+
+
+def test_frames(mux):
+    """Frames with about half their LEDs lit, a different pattern each."""
+    rng = random.Random(0)
+    return [rng.getrandbits(mux.n ** 3) for _ in range(FRAMES)]
+
+
+def compile_us(timing, frames):
+    """Mean time to compile one frame, in µs."""
+    words = array.array('I', bytes(4 * timing.frame_words() * len(frames)))
+    start = time.monotonic_ns()
+    for i, frame in enumerate(frames):
+        timing.compile_into((frame,), words, i * timing.frame_words())
+    return (time.monotonic_ns() - start) / 1000 / len(frames)
+
+
+def compiled(timing, frames):
+    words = array.array('I', bytes(4 * timing.frame_words() * len(frames)))
+    for i, frame in enumerate(frames):
+        timing.compile_into((frame,), words, i * timing.frame_words())
+    return words
+
+
+def measured_hz(mux, words, frame_words):
+    """Mean refresh rate of the frames looping on the PIO emulator.
+
+    A refresh starts when the first word of a frame (layer 0) is pulled.
+    """
+    program, (sideset_count, sideset_enable, wrap_target, wrap) = pio.parse(mux.program)
+    position = [0]
+
+    def feed():
+        i = position[0] % len(words)
+        position[0] += 1
+        return words[i], i
+
+    starts = []
+
+    def pulled():
+        if core.osr_tag % frame_words == 0:
+            starts.append(core.cycle)
+        return False
+
+    kwargs = mux.state_machine_kwargs()
+    core = pio.Core(program, feed, first_out_pin=0, out_pin_count=kwargs["out_pin_count"],
+                    first_set_pin=3, set_pin_count=kwargs.get("set_pin_count", 0),
+                    first_sideset_pin=1, sideset_pin_count=sideset_count,
+                    sideset_enable=sideset_enable,
+                    out_shift_right=kwargs["out_shift_right"],
+                    auto_pull=kwargs["auto_pull"],
+                    pull_threshold=kwargs.get("pull_threshold", 32),
+                    wrap_target=wrap_target, wrap=wrap)
+    refreshes = 2 * len(words) // frame_words
+    while len(starts) <= refreshes:
+        core.run(core.cycle + PIO_FREQ // 10, stop=pulled)
+    return PIO_FREQ * refreshes / (starts[refreshes] - starts[0])
+
+
+def run():
+    print(f"{'cube':>9} {'drive':>6} {'pins':>9} {'refresh':>9} "
+          f"{'words':>5} {'bytes':>5} {'µs/frame':>9} {'load':>6}")
+    for n, drive in CUBES:
+        outputs = n * n + n
+        for order in ("in order", "shuffled"):
+            pin_map = list(range(outputs))
+            if order == "shuffled":
+                # A board laid out for its tracks, not for the software
+                pin_map.reverse()
+            mux = Mux(n, drive, pin_map)
+            timing = Timing(mux=mux)
+            frames = test_frames(mux)
+            us = compile_us(timing, frames)
+            load = us * FRAMERATE / 10_000
+            words = timing.frame_words()
+            if pio is None:
+                refresh = f"{timing.refresh_hz(1):7.1f}Hz*"
+            else:
+                hz = measured_hz(mux, compiled(timing, frames), words)
+                refresh = f"{hz:7.1f}Hz "
+            print(f"{n}x{n}x{n:<5} {drive:>6} {order:>9} {refresh}"
+                  f"{words:5} {4 * words:5} {us:9.0f} {load:5.1f}%")
+    if pio is None:
+        print("*: computed from the timing, not measured")
+    print(f"load: share of each second spent compiling frames at {FRAMERATE} fps")
+
+
+run()
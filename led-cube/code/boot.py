@@ -1,3 +1,23 @@
+import board
+import digitalio
+import storage
 import supervisor
+import usb_cdc
+
 supervisor.runtime.autoreload = False
 print(f"{supervisor.runtime.autoreload=}")
+
+# A second serial port alongside the REPL, for live frames from
+# web-page/stream.py
+usb_cdc.enable(console=True, data=True)
+
+# Normally the computer can write to CIRCUITPY and the cube can't. Holding
+# the button while plugging the cube in swaps that round, so code.py can save
+# its boot cache (cache/animations.bin) of a newly copied animations.json.
+with digitalio.DigitalInOut(board.GP16) as button:
+    button.pull = digitalio.Pull.UP
+    cube_writable = not button.value
+
+if cube_writable:
+    storage.remount("/", readonly=False)
+print(f"{cube_writable=}")
@@ -1,66 +1,89 @@
-import array
-import board
-import digitalio
-import json
 import time
+boot_ns = time.monotonic_ns()
+
+import binascii
+import board
+import gc
+import keypad
+import os
+import supervisor
+import sys
+import usb_cdc
 
 import adafruit_pioasm
 import rp2pio
 
+from lib.animfile import load_binary, load_json, pack_animations, write_binary
+from lib.library import Library
+from lib.livestream import Receiver
+from lib.mux import PIO_FREQ, Mux
+from lib.player import AnimPlayer
+from lib.telemetry import IdleMeter, SwitchTimer, Telemetry
+from lib.timing import Timing, load_profile, merge
+from lib.transform import check_spec
+
 ################################################
-# PIO program — runs at 10 kHz (1 cycle = 0.1 ms)
-# Per-layer cycle: pull word → drive pins for 30 cycles (3 ms) → clear pins
-# Full 3-layer mux cycle ≈ 102 cycles = 10.2 ms → ~98 Hz refresh
+# PIO program — runs at 1 MHz (PIO_FREQ: 1 cycle = 1 µs)
+# Per-word cycle: pull word → drive pins for its hold time → clear pins →
+# wait out its blanking time. Binary frames are 3 words, one per layer, each
+# lit for 3.1 ms and blanked for 0.3 ms: 10.2 ms per frame → ~98 Hz refresh.
+# The timing profile (timing.json, or an animation's own "timing") changes
+# the hold and blanking in the words; see lib/timing.py.
 #
-# Word format fed by DMA:
+# Word format fed by DMA (packed by lib/mux.py):
 #   bits  0-8  → cathode states  (maps to GP4-GP12 via out pins)
 #   bits  9-11 → anode enable    (GP13=layer0, GP14=layer1, GP15=layer2)
+#   bits 12-23 → hold: pins stay lit for hold + 5 cycles
+#   bits 24-31 → blank: pins stay dark for 4 * blank + 6 cycles
+#
+# Grayscale frames use bit-angle modulation: each layer is sent as one word
+# per bit-plane, with hold times weighted 1, 2, 4, 8... so an LED's time lit
+# is proportional to its brightness. Only the last plane of a layer blanks.
 ################################################
 
-PIO_FREQ = 10_000
-
-led_mux_asm = adafruit_pioasm.assemble("""
-.program led_mux
-.wrap_target
-    pull block       ; wait for layer word (DMA keeps FIFO full)
-    out  pins, 12    ; drive cathodes (bits 0-8) + anode (bit 9-11)
-    nop  [29]        ; hold for 30 cycles = 3 ms
-    mov  osr, null   ; load zero into OSR
-    out  pins, 12    ; clear all 12 LED pins
-.wrap
-""")
-
-
-def frame_to_buf(frame, buf):
-    """Expand a 27-bit packed frame into 3 PIO output words in-place."""
-    for layer in range(3):
-        cathodes = (frame >> (layer * 9)) & 0x1FF
-        buf[layer] = cathodes | (1 << (layer + 9))
-
+# lib/mux generates the program for any size of cube; for this one it's:
+#
+#   .wrap_target
+#       pull block         ; wait for layer word (DMA keeps FIFO full)
+#       out  pins, 12      ; drive cathodes (bits 0-8) + anode (bit 9-11)
+#       out  x, 12         ; hold count
+#       out  y, 8          ; blank count
+#   hold:
+#       jmp  x-- hold      ; 1 cycle per count
+#       mov  osr, null     ; load zero into OSR
+#       out  pins, 12      ; clear all 12 LED pins
+#   blank:
+#       jmp  y-- blank [3] ; 4 cycles per count
+#   .wrap
+CUBE = Mux(3)
+led_mux_asm = adafruit_pioasm.assemble(CUBE.program)
 
-class AnimPlayer:
-    def __init__(self, buf):
-        self.buf = buf
-        self.anim = None
-        self.frame_num = 0
-        self.frame_start_time = time.monotonic()
-        self.frame_time_s = 0.1
-        self.num_frames = 0
+# The cube's timing profile; animations can override it
+TIMING_FILE = "timing.json"
 
-    def load_frames(self, frames):
-        self.anim = frames
-        self.frame_num = 0
-        self.num_frames = len(frames)
-        frame_to_buf(frames[0], self.buf)
+try:
+    TIMING = Timing(**merge(load_profile(TIMING_FILE)), mux=CUBE)
+except ValueError as e:
+    print(f"{TIMING_FILE} not used: {e}")
+    TIMING = Timing(mux=CUBE)
 
-    def set_framerate(self, framerate):
-        self.frame_time_s = 1.0 / framerate
 
-    def tick(self):
-        if time.monotonic() - self.frame_start_time >= self.frame_time_s:
-            self.frame_num = (self.frame_num + 1) % self.num_frames
-            self.frame_start_time = time.monotonic()
-            frame_to_buf(self.anim[self.frame_num], self.buf)
+def print_memory_report(animations, mem_before, mem_after):
+    total = 0
+    for anim in animations:
+        if anim.streamed:
+            size = "streamed"
+        elif anim.spec is not None:
+            size = "from spec"
+        elif anim.delta:
+            size = f"{anim.nbytes} bytes delta"
+        else:
+            size = f"{anim.nbytes} bytes"
+        print(f"{anim.name:<32} {anim.num_frames:>5} frames {size:>20}")
+        total += anim.nbytes
+    print(f"{len(animations)} animations, {total} bytes of frames")
+    print(f"mem_free: {mem_before} before load, {mem_after} after "
+          f"({mem_before - mem_after} used)")
 
 
 ################################################
@@ -71,82 +94,445 @@ sm = rp2pio.StateMachine(
     led_mux_asm,
     frequency=PIO_FREQ,
     first_out_pin=board.GP4,
-    out_pin_count=12,
-    out_shift_right=True,
-    auto_pull=False,
+    **CUBE.state_machine_kwargs(),
 )
 
 ################################################
-# BUTTON — stays as regular digitalio on GP16
+# BUTTON — GP16, scanned and debounced in the background by keypad
+# Short press: next animation. Long press: previous animation.
+# Hold for PAUSE_MS: pause or resume (fires while still held).
+# With TELEMETRY on, a second short press within CHORD_MS of the last one
+# prints the telemetry line instead of moving on again.
 ################################################
 
-button = digitalio.DigitalInOut(board.GP16)
-button.direction = digitalio.Direction.INPUT
-button.pull = digitalio.Pull.UP
+LONG_PRESS_MS = 600
+PAUSE_MS = 2000
+CHORD_MS = 400
+
+NEXT = "next"
+PREVIOUS = "previous"
+PAUSE = "pause"
+DUMP = "dump"
+
+TICKS_PERIOD = 1 << 29  # supervisor.ticks_ms() wraps around at this
+
+
+class Button:
+    """Turns the button's keypad events into gestures."""
+
+    def __init__(self, pin):
+        self.keys = keypad.Keys((pin,), value_when_pressed=False, pull=True)
+        self.event = keypad.Event()
+        self.pressed_ms = None
+        self.fired = False
+        self.tapped_ms = None
 
-DEBOUNCE_S = 0.2
+    def poll(self):
+        """Return the next gesture (NEXT, PREVIOUS, PAUSE or DUMP), or None."""
+        if self.pressed_ms is not None and not self.fired and \
+                held_ms(self.pressed_ms, supervisor.ticks_ms()) >= PAUSE_MS:
+            self.fired = True
+            return PAUSE
+        while self.keys.events.get_into(self.event):
+            if self.event.pressed:
+                self.pressed_ms = self.event.timestamp
+                self.fired = False
+                continue
+            if self.pressed_ms is None:
+                continue
+            held = held_ms(self.pressed_ms, self.event.timestamp)
+            self.pressed_ms = None
+            if self.fired or held >= PAUSE_MS:
+                # Already handled while held
+                continue
+            if held >= LONG_PRESS_MS:
+                return PREVIOUS
+            tapped = self.tapped_ms
+            self.tapped_ms = self.event.timestamp
+            if TELEMETRY and tapped is not None and \
+                    held_ms(tapped, self.event.timestamp) - held < CHORD_MS:
+                self.tapped_ms = None
+                return DUMP
+            return NEXT
+        return None
+
+
+def held_ms(start, end):
+    return (end - start) % TICKS_PERIOD
+
+
+button = Button(board.GP16)
+
+################################################
+# SLEEPING — between frames the loop sleeps instead of spinning
+################################################
+
+# Longest sleep: bounds how late a button press or a long hold is noticed
+MAX_SLEEP_NS = 20_000_000
+# Shortest sleep, and how often to look again while a swap is pending
+POLL_NS = 1_000_000
+# time.sleep() only counts whole milliseconds and can overshoot by one,
+# so wake this much early and let tick() wait out the rest
+SLEEP_MARGIN_NS = 1_000_000
+
+################################################
+# TELEMETRY — counters and timers for the main loop, printed as one line
+# every TELEMETRY_PERIOD_NS (0 for never), on a double press of the button
+# or when "t" is typed on the serial console. Turned off, the player and
+# the idle meter aren't given it, so they count nothing (see lib/telemetry.py).
+################################################
+
+TELEMETRY = False
+TELEMETRY_PERIOD_NS = 10_000_000_000
+
+telemetry = Telemetry(TELEMETRY_PERIOD_NS)
 
 ################################################
 # LOAD ANIMATIONS
 ################################################
 
-try:
-    with open("animations.json", "r") as f:
-        animations = json.load(f)
-except (OSError, ValueError):
-    animations = [
-        {
-            "name": "push through each direction",
-            "frames": [0x00001FF, 0x003FFFF, 0x7FFFFFF, 0x7FFFFFF, 0x7FFFFFF, 0x7FFFFFF, 0x7FFFE00, 0x7FC0000, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0,
-                       0x70381C0, 0x7E3F1F8, 0x7FFFFFF, 0x7FFFFFF, 0x7FFFFFF, 0x7FFFFFF, 0x0FC7E3F, 0x01C0E07, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0,
-                       0x4924924, 0x6DB6DB6, 0x7FFFFFF, 0x7FFFFFF, 0x7FFFFFF, 0x7FFFFFF, 0x36DB6DB, 0x1249249, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0],
-            "framerate": 15,
-        },
-        {
-            "name": "every-other",
-            "frames": [0xAAAAAAA, 0x5555555],
-            "framerate": 2,
-        },
-        {
-            "name": "spinning-around",
-            "frames": [0x2492492, 0x150A854, 0x0E07038, 0x4462311],
-            "framerate": 8,
-        },
-    ]
+# Skip frames to stay on schedule if playback falls behind, rather than
+# showing every frame late
+CATCH_UP = False
+
+# Loop whole animations through DMA with each frame repeated for as many
+# refreshes as it lasts, so the PIO clock times frames and Python only wakes
+# for the button. Used for animations held in RAM at up to 33 fps (and some
+# faster rates) whose unrolled loop fits in PACED_MAX_BYTES; everything else
+# is paced by AnimPlayer.tick(). 16 KB of loop lasts about 13 s.
+HARDWARE_PACED = True
+PACED_MAX_BYTES = 16 * 1024
+
+# The next animation is picked (loading it, from a library) and then
+# compiled PRELOAD_STEP frames at a time whenever the next frame is at least
+# PRELOAD_GAP_NS away, so the button switches to it at once
+PRELOAD_STEP = 4
+PRELOAD_GAP_NS = 3_000_000
+
+# Dissolve into animations held in RAM over DISSOLVE_FRAMES frames at
+# DISSOLVE_FPS when switching with the button; set False to cut straight over
+DISSOLVE = True
+DISSOLVE_FRAMES = 8
+DISSOLVE_FPS = 40
+
+# Set False to time the JSON path when animations.bin is present
+PREFER_BINARY = True
+
+# Animations in animations.bin longer than this are streamed from flash
+# rather than loaded into RAM, STREAM_CHUNK frames at a time
+STREAM_OVER = 1024
+STREAM_CHUNK = 16
+
+# A directory of animation files, with an index, used instead of
+# animations.json/.bin when it's there: each animation is only loaded when
+# it's picked, so there can be hundreds of them (see lib/library.py)
+LIBRARY_DIR = "animations"
+
+# After parsing animations.json the cube saves it in the binary format here,
+# with a key file recording which animations.json it came from, and loads
+# that on later boots instead. Only written when boot.py has given the cube
+# write access (hold the button while plugging it in).
+CACHE_DIR = "cache"
+CACHE_FILE = CACHE_DIR + "/animations.bin"
+CACHE_KEY = CACHE_DIR + "/animations.key"
+
+DEFAULT_ANIMATIONS = [
+    {
+        "name": "push through each direction",
+        "frames": [0x00001FF, 0x003FFFF, 0x7FFFFFF, 0x7FFFFFF, 0x7FFFFFF, 0x7FFFFFF, 0x7FFFE00, 0x7FC0000, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0,
+                   0x70381C0, 0x7E3F1F8, 0x7FFFFFF, 0x7FFFFFF, 0x7FFFFFF, 0x7FFFFFF, 0x0FC7E3F, 0x01C0E07, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0,
+                   0x4924924, 0x6DB6DB6, 0x7FFFFFF, 0x7FFFFFF, 0x7FFFFFF, 0x7FFFFFF, 0x36DB6DB, 0x1249249, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0],
+        "framerate": 15,
+    },
+    {
+        "name": "every-other",
+        "frames": [0xAAAAAAA, 0x5555555],
+        "framerate": 2,
+    },
+    {
+        "name": "spinning-around",
+        "frames": [0x2492492, 0x150A854, 0x0E07038, 0x4462311],
+        "framerate": 8,
+    },
+    {
+        "name": "rain",
+        "generator": "rain",
+        "framerate": 8,
+    },
+]
+
+
+def json_key(path):
+    """Size, mtime and CRC-32 of a file, as a line of text.
+
+    The CRC catches edits the size and mtime miss: CIRCUITPY timestamps only
+    have 2 second resolution, and copies don't always preserve them.
+    """
+    stat = os.stat(path)
+    crc = 0
+    buf = bytearray(512)
+    view = memoryview(buf)
+    with open(path, "rb") as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            crc = binascii.crc32(view[:n], crc)
+    return f"{stat[6]} {stat[8]} {crc:08x}"
+
+
+def load_cache(key):
+    """Animations from the boot cache, or None if it isn't for this key."""
+    try:
+        with open(CACHE_KEY) as f:
+            if f.read() != key:
+                print("boot cache is for a different animations.json")
+                return None
+        return load_binary(CACHE_FILE, STREAM_OVER)
+    except OSError:
+        return None
+    except ValueError as e:
+        print(f"boot cache not used: {e}")
+        return None
+
+
+def save_cache(animations, key):
+    """Write the boot cache, if the filesystem is writable."""
+    try:
+        try:
+            os.mkdir(CACHE_DIR)
+        except OSError:
+            pass
+        # Remove the key first, so a cache that's only half written is
+        # never mistaken for a good one
+        try:
+            os.remove(CACHE_KEY)
+        except OSError:
+            pass
+        with open(CACHE_FILE, "wb") as f:
+            write_binary(f, animations)
+        with open(CACHE_KEY, "w") as f:
+            f.write(key)
+        print(f"saved boot cache to {CACHE_FILE}")
+    except OSError:
+        # Read-only: the computer has the drive (see boot.py)
+        pass
+
+
+def load_animations():
+    """Load the animation library, preferring the binary container.
+
+    A LIBRARY_DIR directory takes precedence over both files, and is
+    returned as a Library rather than a list, loading nothing yet.
+    animations.bin is only used if it's at least as new as animations.json,
+    so a freshly copied JSON export is never shadowed by a stale conversion.
+    Failing that, the boot cache is used if it was made from this very
+    animations.json; otherwise the JSON is parsed and cached for next time.
+    Returns the animations and the name of the file they came from.
+    """
+    try:
+        os.stat(LIBRARY_DIR)
+    except OSError:
+        pass
+    else:
+        library = Library(LIBRARY_DIR, STREAM_OVER)
+        for problem in library.problems:
+            print(f"{LIBRARY_DIR}/{problem}, skipping")
+        if len(library):
+            return library, LIBRARY_DIR + "/"
+        print(f"no animations in {LIBRARY_DIR}/")
+    if PREFER_BINARY:
+        try:
+            bin_mtime = os.stat("animations.bin")[8]
+            try:
+                stale = os.stat("animations.json")[8] > bin_mtime
+            except OSError:
+                stale = False
+            if not stale:
+                return load_binary("animations.bin", STREAM_OVER), "animations.bin"
+            print("animations.bin is older than animations.json, ignoring it")
+        except OSError:
+            pass
+        except ValueError as e:
+            print(f"animations.bin not used: {e}")
+    try:
+        key = json_key("animations.json")
+    except OSError:
+        return pack_animations(DEFAULT_ANIMATIONS), "defaults"
+    if PREFER_BINARY:
+        animations = load_cache(key)
+        if animations is not None:
+            return animations, CACHE_FILE
+    try:
+        animations = load_json("animations.json")
+    except (OSError, ValueError):
+        return pack_animations(DEFAULT_ANIMATIONS), "defaults"
+    save_cache(animations, key)
+    return animations, "animations.json"
+
+
+gc.collect()
+mem_before_load = gc.mem_free()
+animations, animations_source = load_animations()
+if isinstance(animations, Library):
+    # Checked as each one is picked instead
+    library = animations
+    print(f"{len(library)} animations in {animations_source}, "
+          f"loaded as they're picked")
+else:
+    library = {anim.name: anim for anim in animations}
+    playable = []
+    for anim in animations:
+        try:
+            check_spec(anim, library)
+            playable.append(anim)
+        except ValueError as e:
+            print(f"{anim.name}: {e}, skipping")
+    animations = playable
+gc.collect()
+if not isinstance(animations, Library):
+    print_memory_report(animations, mem_before_load, gc.mem_free())
+
+
+def pick(index, step=1):
+    """Index and animation of the first playable one from index on.
+
+    Library animations are loaded (and checked) here, so a broken file is
+    skipped over, going in the direction of `step`. If none of them can be
+    played, the cube switches to DEFAULT_ANIMATIONS instead.
+    """
+    global animations, library, animations_source
+    for _ in range(len(animations)):
+        try:
+            anim = animations[index]
+            check_spec(anim, library)
+            return index, anim
+        except (OSError, ValueError, KeyError) as e:
+            print(f"animation {index}: {e}, skipping")
+        index = (index + step) % len(animations)
+    print(f"no playable animations in {animations_source}, using the defaults")
+    animations = pack_animations(DEFAULT_ANIMATIONS)
+    library = {anim.name: anim for anim in animations}
+    animations_source = "defaults"
+    player.library = library
+    return 0, animations[0]
+
 
 ################################################
-# START — DMA loops frame_buf into PIO indefinitely
+# START — DMA loops the current frame's words into PIO indefinitely
 ################################################
 
-frame_buf = array.array('L', [0, 0, 0])
-sm.background_write(loop=frame_buf)
+player = AnimPlayer(sm, library, TIMING,
+                    stream_chunk=STREAM_CHUNK, preload_step=PRELOAD_STEP,
+                    paced_max_bytes=PACED_MAX_BYTES if HARDWARE_PACED else 0,
+                    dissolve_frames=DISSOLVE_FRAMES, dissolve_fps=DISSOLVE_FPS,
+                    poll_ns=SLEEP_MARGIN_NS + POLL_NS,
+                    telemetry=telemetry if TELEMETRY else None)
+player.catch_up = CATCH_UP
 
-next_anim = False
-last_press_s = 0.0
-prev_button = True
+animation_index, anim = pick(0)
+player.load(anim)
+# Picked in the main loop's spare time, as picking can mean loading it
+preload_index = (animation_index + 1) % len(animations)
 
-player = AnimPlayer(frame_buf)
+boot_ms = (time.monotonic_ns() - boot_ns) // 1_000_000
+print(f"boot-to-first-frame: {boot_ms} ms from {animations_source}")
 
-animation_index = 0
-player.load_frames(animations[animation_index]["frames"])
-player.set_framerate(animations[animation_index]["framerate"])
+################################################
+# LIVE STREAMING — frames sent from a computer by web-page/stream.py over
+# the usb_cdc data port (turned on in boot.py) take over from the animation
+# until they stop coming
+################################################
+
+# Go back to the current animation after this long without a frame
+LIVE_TIMEOUT_NS = 2_000_000_000
+
+serial = usb_cdc.data
+receiver = None
+if serial is not None:
+    serial.timeout = 0
+    serial.write_timeout = 0
+    receiver = Receiver(serial, player.show_live, lambda: sm.pending_write)
+last_live_ns = 0
 
 ################################################
-# MAIN LOOP — PIO handles mux; Python advances frames and polls button
+# MAIN LOOP — PIO handles mux; Python advances frames, handles button
+# gestures, then sleeps until the next frame is due
+# Type "s" then Enter on the serial console to print frame timing stats, or
+# "t" for the telemetry line (see TELEMETRY)
 ################################################
 
+idle = IdleMeter(MAX_SLEEP_NS, POLL_NS, SLEEP_MARGIN_NS,
+                 telemetry if TELEMETRY else None)
+switch_timer = SwitchTimer()
+
 while True:
+    if TELEMETRY:
+        telemetry.loops += 1
+        if telemetry.due(time.monotonic_ns()):
+            telemetry.report()
     player.tick()
 
-    btn = button.value
-    now = time.monotonic()
-    if not btn and prev_button and (now - last_press_s) >= DEBOUNCE_S:
-        last_press_s = now
-        next_anim = True
-    prev_button = btn
-
-    if next_anim:
-        next_anim = False
-        animation_index = (animation_index + 1) % len(animations)
-        player.load_frames(animations[animation_index]["frames"])
-        player.set_framerate(animations[animation_index]["framerate"])
+    if receiver is not None and (player.live or serial.in_waiting):
+        if not player.live:
+            print("live stream started")
+            player.load_live()
+            # The timeout runs from the start, not from the last stream
+            last_live_ns = time.monotonic_ns()
+        if receiver.poll():
+            last_live_ns = time.monotonic_ns()
+        elif time.monotonic_ns() - last_live_ns > LIVE_TIMEOUT_NS:
+            print(f"live stream ended: {receiver.shown} frames shown, "
+                  f"{receiver.lost} lost, {receiver.coalesced} coalesced")
+            animation_index, anim = pick(animation_index)
+            player.load(anim)
+            preload_index = (animation_index + 1) % len(animations)
+
+    gesture = button.poll()
+    while gesture is not None:
+        if gesture == DUMP:
+            telemetry.report()
+        elif player.live:
+            # The stream has the LEDs until it stops
+            pass
+        elif gesture == PAUSE:
+            player.pause(not player.paused)
+            print("paused" if player.paused else "resumed")
+        else:
+            step = 1 if gesture == NEXT else -1
+            switch_ns = time.monotonic_ns()
+            animation_index, anim = pick((animation_index + step) % len(animations), step)
+            preloaded = player.is_preloaded(anim)
+            player.pause(False)
+            player.load(anim, DISSOLVE)
+            switch_timer.start(switch_ns, preloaded)
+            preload_index = (animation_index + 1) % len(animations)
+        gesture = button.poll()
+    switch_timer.poll(player)
+
+    if supervisor.runtime.serial_bytes_available:
+        command = sys.stdin.read(1)
+        if command == "s":
+            print(f"refresh {player.refresh_hz():.1f} Hz, "
+                  f"timing {player.timing.settings()}")
+            player.stats.report()
+            idle.report()
+            idle.reset()
+        elif command == "t":
+            if TELEMETRY:
+                telemetry.report()
+            else:
+                print("telemetry is off: set TELEMETRY = True in code.py")
+
+    wake_ns = player.wake_ns()
+    if wake_ns is None or wake_ns - time.monotonic_ns() > PRELOAD_GAP_NS:
+        if preload_index is not None:
+            next_index, next_anim = pick(preload_index)
+            preload_index = None
+            # With only one to play, the next is the one already playing
+            if next_index != animation_index:
+                player.preload(next_anim)
+            continue
+        if player.step_preload():
+            continue
+    idle.sleep_until(wake_ns)
@@ -0,0 +1,568 @@
+"""
+Animation storage for the LED cube.
+
+Shared between the cube (CircuitPython) and the host-side tools, so it only
+uses modules both have: array and struct.
+
+Binary container format (all fields little-endian):
+
+    header   magic b"LWCA", u16 version, u16 animation count, u32 index offset
+    index    one entry per animation:
+             32-byte NUL-padded UTF-8 name, u16 framerate, u16 flags,
+             u32 frame count, u32 byte offset of the first frame
+    frames   u32 per frame, the 27-bit packed LED states exactly as they
+             appear in animations.json
+
+The low 4 bits of flags are the animation's depth in bits per LED (0 in
+version 1 files, meaning 1). A grayscale frame of depth d is d consecutive
+27-bit bit-planes, least significant first, so LED i's brightness is made
+of bit i of each plane.
+
+The frames of each animation are contiguous, so the cube can readinto()
+them straight into an array without parsing anything.
+
+Flag DELTA (version 3 on) marks a binary animation stored as a delta
+stream instead: a u32 byte length, then that many bytes of opcodes, each
+producing the next frame from the one before (the frame before the first
+is 0):
+
+    0x00-0x3F  hold: repeat the previous frame 1-64 times
+    0x40-0x5A  flip LED (op - 0x40) and emit the frame
+    0x60-0x7A  flip LED (op - 0x60), more changes follow before the frame
+    0x80       XOR the frame with the next 4 bytes (little-endian) and emit
+    0x81-0x83  XOR layer (op - 0x81) with the next 2 bytes (little-endian,
+               9 bits used) and emit
+
+Animations that mostly hold or change a few LEDs at a time shrink to a
+byte or two per frame, and decoding one frame costs a handful of integer
+operations.
+
+Flag SPEC (version 4 on) marks an animation defined by a JSON spec rather
+than frames: a u32 byte length, then the UTF-8 JSON object. Its frame count
+is 0. Specs are the animations.json entry without name and framerate:
+
+    {"generator": "rain", "params": {...}}     procedural, see voxel.py
+    {"base": "spin", "transform": {...}}       variant, see transform.py
+    {"composite": "or", "layers": [...]}       overlay, see transform.py
+
+Version 4 files only have generator specs.
+
+Flag HOLDS (version 6 on) marks frames followed by a u16 per frame: how
+many frame periods it stays on the LEDs for. Runs of identical frames are
+folded into one held frame when animations are packed, so a pause costs
+2 bytes rather than 4 per frame (4 * depth for grayscale).
+
+Flag TIMING (version 7 on) marks an animation with its own multiplex
+timing: u16 refresh_hz, u16 blank_us, u16 compensation after everything
+else of the animation's (frames and holds, or the delta or spec bytes),
+0xFFFF meaning the cube's setting. See timing.py.
+
+In animations.json a grayscale animation has a "depth" and each frame is a
+list of 27 brightness levels (0 to 2 ** depth - 1), LED i first.
+"""
+
+import array
+import struct
+
+MAGIC = b"LWCA"
+VERSION = 7
+
+HEADER = "<4sHHI"
+HEADER_SIZE = struct.calcsize(HEADER)
+INDEX_ENTRY = "<32sHHII"
+INDEX_ENTRY_SIZE = struct.calcsize(INDEX_ENTRY)
+NAME_SIZE = 32
+
+FRAME_MASK = 0x7FFFFFF
+DEPTH_MASK = 0xF
+MAX_DEPTH = 4
+DELTA = 0x10
+SPEC = 0x20
+HOLDS = 0x40
+TIMING = 0x80
+TIMING_FORMAT = "<HHH"
+TIMING_SIZE = struct.calcsize(TIMING_FORMAT)
+TIMING_KEYS = ("refresh_hz", "blank_us", "compensation")
+UNSET = 0xFFFF
+MAX_FRAME_HOLD = 0xFFFF
+SPEC_KEYS = ("generator", "base", "composite")
+
+OP_HOLD = 0x00
+OP_FLIP = 0x40
+OP_FLIP_MORE = 0x60
+OP_XOR = 0x80
+OP_XOR_LAYER = 0x81
+MAX_HOLD = 64
+
+
+class Animation:
+    """A named animation with its 27-bit frames packed into one array.
+
+    Animations too long to hold in RAM keep `frames` as None and are
+    streamed from `path`, starting at byte `offset`, while they play.
+    Delta-encoded animations keep their encoded bytes in `frames`.
+    Procedural, variant and composite animations have no frames, just the
+    `spec` dict describing them.
+
+    `holds`, if not None, is an array of how many frame periods each frame
+    is shown for; otherwise every frame lasts one.
+
+    `timing`, if not None, is a dict overriding some of the cube's timing
+    profile for this animation (see timing.py).
+    """
+
+    def __init__(self, name, framerate, frames, num_frames=None, path=None,
+                 offset=0, depth=1, delta=False, spec=None, holds=None,
+                 timing=None):
+        self.name = name
+        self.framerate = framerate
+        self.frames = frames
+        self.depth = depth
+        self.delta = delta
+        self.spec = spec
+        if frames is None and path is None:
+            num_frames = 0
+        if num_frames is None:
+            num_frames = len(frames) // depth
+        self.num_frames = num_frames
+        self.path = path
+        self.offset = offset
+        self.holds = holds
+        self.timing = timing
+
+    @property
+    def length(self):
+        """Frame periods in one loop of the animation."""
+        return sum(self.holds) if self.holds is not None else self.num_frames
+
+    @property
+    def streamed(self):
+        return self.path is not None
+
+    @property
+    def nbytes(self):
+        if self.frames is None:
+            return 0
+        if self.delta:
+            return len(self.frames)
+        return 4 * len(self.frames) + (0 if self.holds is None else 2 * len(self.holds))
+
+
+def new_holds(count):
+    return array.array('H', bytes(2 * count))
+
+
+def new_frames(count):
+    """Allocate a zeroed array of `count` 32-bit frames."""
+    # 'I' is a 32-bit word both on the Pico and in desktop Python, where 'L'
+    # is 64-bit
+    return array.array('I', bytes(4 * count))
+
+
+def pack_animations(raw):
+    """Convert parsed animations.json entries into compact Animations.
+
+    json.load gives every frame its own int object inside a list, several
+    times the 4 bytes a frame needs. Each entry is dropped from `raw` as soon
+    as it has been packed so the garbage collector can reclaim it.
+    """
+    animations = []
+    for i, entry in enumerate(raw):
+        depth = entry.get("depth", 1)
+        timing = entry.get("timing")
+        if any(key in entry for key in SPEC_KEYS):
+            spec = {k: v for k, v in entry.items()
+                    if k not in ("name", "framerate", "timing")}
+            animations.append(Animation(entry["name"], entry["framerate"], None,
+                                        spec=spec, timing=timing))
+            raw[i] = None
+            continue
+        if depth == 1:
+            frames = array.array('I', entry["frames"])
+        else:
+            frames = new_frames(depth * len(entry["frames"]))
+            for j, levels in enumerate(entry["frames"]):
+                levels_to_planes(levels, depth, frames, j * depth)
+        holds = entry.get("holds")
+        anim = Animation(entry["name"], entry["framerate"], frames, depth=depth,
+                         holds=None if holds is None else array.array('H', holds),
+                         timing=timing)
+        fold_holds(anim)
+        animations.append(anim)
+        raw[i] = None
+    return animations
+
+
+def fold_holds(anim):
+    """Fold runs of identical frames in an in-RAM Animation into held frames."""
+    frames = anim.frames
+    depth = anim.depth
+    holds = anim.holds
+    folded = array.array('I')
+    folded_holds = array.array('H')
+    for i in range(anim.num_frames):
+        hold = 1 if holds is None else holds[i]
+        start = i * depth
+        same = len(folded_holds) > 0 and folded_holds[-1] + hold <= MAX_FRAME_HOLD
+        last = len(folded) - depth
+        for b in range(depth):
+            if not same:
+                break
+            same = frames[start + b] == folded[last + b]
+        if same:
+            folded_holds[-1] += hold
+            continue
+        for b in range(depth):
+            folded.append(frames[start + b])
+        folded_holds.append(hold)
+    if len(folded_holds) == anim.num_frames:
+        return
+    anim.frames = folded
+    anim.holds = folded_holds
+    anim.num_frames = len(folded_holds)
+
+
+def levels_to_planes(levels, depth, planes, start):
+    """Split 27 brightness levels into `depth` bit-planes at planes[start:]."""
+    for b in range(depth):
+        plane = 0
+        for i, level in enumerate(levels):
+            plane |= ((level >> b) & 1) << i
+        planes[start + b] = plane
+
+
+def load_json(path):
+    import json
+    with open(path, "r") as f:
+        return pack_animations(json.load(f))
+
+
+def read_index(f):
+    """Index entries (name, framerate, flags, frame count, offset) of an open
+    container file.
+
+    Raises ValueError if the file isn't a container this code understands.
+    """
+    header = bytearray(HEADER_SIZE)
+    if f.readinto(header) != HEADER_SIZE:
+        raise ValueError("truncated header")
+    magic, version, count, index_offset = struct.unpack(HEADER, header)
+    if magic != MAGIC:
+        raise ValueError("not an animation file")
+    if not 1 <= version <= VERSION:
+        raise ValueError(f"unsupported version {version}")
+
+    index = bytearray(count * INDEX_ENTRY_SIZE)
+    f.seek(index_offset)
+    if f.readinto(index) != len(index):
+        raise ValueError("truncated index")
+    entries = []
+    for i in range(count):
+        name, framerate, flags, num_frames, offset = struct.unpack_from(
+            INDEX_ENTRY, index, i * INDEX_ENTRY_SIZE)
+        entries.append((name.rstrip(b"\0").decode("utf-8"), framerate, flags,
+                        num_frames, offset))
+    return entries
+
+
+def load_binary(path, stream_over=None, only=None):
+    """Load every animation from a binary container file, or just entry
+    number `only`.
+
+    Animations with more than `stream_over` frames are left on flash to be
+    streamed with a FrameStream instead of being read into RAM.
+    Raises ValueError if the file isn't a container this code understands.
+    """
+    with open(path, "rb") as f:
+        entries = read_index(f)
+        if only is not None:
+            if not 0 <= only < len(entries):
+                raise ValueError(f"no animation {only} in {path}")
+            entries = entries[only:only + 1]
+
+        animations = []
+        for name, framerate, flags, num_frames, offset in entries:
+            depth = (flags & DEPTH_MASK) or 1
+            if flags & (DELTA | SPEC):
+                size = bytearray(4)
+                f.seek(offset)
+                f.readinto(size)
+                data = bytearray(struct.unpack("<I", size)[0])
+                if f.readinto(data) != len(data):
+                    raise ValueError("truncated frames")
+                timing = read_timing(f) if flags & TIMING else None
+                if flags & SPEC:
+                    import json
+                    animations.append(Animation(name, framerate, None,
+                                                spec=json.loads(data), timing=timing))
+                else:
+                    animations.append(Animation(name, framerate, data, num_frames,
+                                                delta=True, timing=timing))
+                continue
+            holds = None
+            if flags & HOLDS:
+                # Small enough to keep in RAM even for streamed animations
+                holds = new_holds(num_frames)
+                f.seek(offset + 4 * depth * num_frames)
+                if f.readinto(holds) != 2 * num_frames:
+                    raise ValueError("truncated holds")
+            timing = None
+            if flags & TIMING:
+                f.seek(offset + (4 * depth + (2 if holds is not None else 0)) * num_frames)
+                timing = read_timing(f)
+            if stream_over is not None and num_frames > stream_over:
+                animations.append(Animation(name, framerate, None, num_frames,
+                                            path, offset, depth, holds=holds,
+                                            timing=timing))
+                continue
+            frames = new_frames(depth * num_frames)
+            f.seek(offset)
+            if f.readinto(frames) != 4 * len(frames):
+                raise ValueError("truncated frames")
+            animations.append(Animation(name, framerate, frames, depth=depth,
+                                        holds=holds, timing=timing))
+        return animations
+
+
+def read_timing(f):
+    """An animation's timing overrides, read from where f is."""
+    data = bytearray(TIMING_SIZE)
+    if f.readinto(data) != TIMING_SIZE:
+        raise ValueError("truncated timing")
+    values = struct.unpack(TIMING_FORMAT, data)
+    return {key: value for key, value in zip(TIMING_KEYS, values) if value != UNSET}
+
+
+class FrameStream:
+    """Reads a streamed Animation's frames from flash, looping at the end.
+
+    Only ever holds the caller's buffer: frames are read with readinto()
+    straight into it, so memory use doesn't depend on animation length.
+    Positions are counted in words, so grayscale frames (depth words each)
+    stream the same way as binary ones.
+    """
+
+    def __init__(self, anim):
+        self.f = open(anim.path, "rb")
+        self.offset = anim.offset
+        self.num_words = anim.num_frames * anim.depth
+        self.pos = 0
+
+    def read(self, frames):
+        """Fill the `frames` array with the next len(frames) words."""
+        view = memoryview(frames)
+        filled = 0
+        while filled < len(frames):
+            n = min(len(frames) - filled, self.num_words - self.pos)
+            self.f.seek(self.offset + 4 * self.pos)
+            if self.f.readinto(view[filled:filled + n]) != 4 * n:
+                raise ValueError("truncated frames")
+            filled += n
+            self.pos = (self.pos + n) % self.num_words
+
+    def close(self):
+        self.f.close()
+
+
+class ArraySource:
+    """Frame source for AnimPlayer that loops over an array of frames.
+
+    With `holds`, frame i is returned holds[i] times in a row.
+    """
+
+    def __init__(self, frames, holds=None):
+        self.frames = frames
+        self.holds = holds
+        self.num_frames = len(frames) if holds is None else sum(holds)
+        self.pos = 0
+        self.held = 0
+
+    def next_frame(self):
+        frame = self.frames[self.pos]
+        if self.holds is not None:
+            self.held += 1
+            if self.held < self.holds[self.pos]:
+                return frame
+            self.held = 0
+        self.pos = (self.pos + 1) % len(self.frames)
+        return frame
+
+
+class StreamSource:
+    """Frame source for AnimPlayer that reads a streamed Animation in chunks."""
+
+    def __init__(self, anim, chunk=16):
+        self.stream = FrameStream(anim)
+        self.buf = new_frames(chunk)
+        self.holds = anim.holds
+        self.num_frames = anim.length
+        self.pos = chunk
+        self.index = 0
+        self.held = 0
+
+    def next_frame(self):
+        if self.pos == len(self.buf):
+            self.stream.read(self.buf)
+            self.pos = 0
+        frame = self.buf[self.pos]
+        if self.holds is not None:
+            self.held += 1
+            if self.held < self.holds[self.index]:
+                return frame
+            self.held = 0
+            self.index = (self.index + 1) % len(self.holds)
+        self.pos += 1
+        return frame
+
+    def close(self):
+        self.stream.close()
+
+
+class DeltaDecoder:
+    """Decodes a delta stream one frame at a time, looping at the end."""
+
+    def __init__(self, anim):
+        self.data = anim.frames
+        self.num_frames = anim.num_frames
+        self.restart()
+
+    def restart(self):
+        self.pos = 0
+        self.frame = 0
+        self.hold = 0
+        self.emitted = 0
+
+    def next_frame(self):
+        if self.emitted == self.num_frames:
+            self.restart()
+        self.emitted += 1
+        if self.hold:
+            self.hold -= 1
+            return self.frame
+        data = self.data
+        frame = self.frame
+        while True:
+            op = data[self.pos]
+            self.pos += 1
+            if op < OP_FLIP:
+                # The frame this hold repeats has already been emitted once
+                self.hold = op
+                return frame
+            if op < OP_FLIP_MORE:
+                frame ^= 1 << (op - OP_FLIP)
+                break
+            if op < OP_XOR:
+                frame ^= 1 << (op - OP_FLIP_MORE)
+                continue
+            p = self.pos
+            if op == OP_XOR:
+                frame ^= data[p] | data[p + 1] << 8 | data[p + 2] << 16 | data[p + 3] << 24
+                self.pos = p + 4
+            else:
+                frame ^= (data[p] | data[p + 1] << 8) << (9 * (op - OP_XOR_LAYER))
+                self.pos = p + 2
+            break
+        self.frame = frame
+        return frame
+
+
+def encode_delta(frames):
+    """Encode 27-bit frames as a delta stream (see the format above)."""
+    out = bytearray()
+    prev = 0
+    hold = 0
+    for i, frame in enumerate(frames):
+        if i and frame == prev:
+            hold += 1
+            if hold == MAX_HOLD:
+                out.append(OP_HOLD + hold - 1)
+                hold = 0
+            continue
+        if hold:
+            out.append(OP_HOLD + hold - 1)
+            hold = 0
+        changed = frame ^ prev
+        bits = [b for b in range(27) if changed >> b & 1]
+        layers = [layer for layer in range(3) if changed >> (9 * layer) & 0x1FF]
+        if 0 < len(bits) < 4:
+            for b in bits[:-1]:
+                out.append(OP_FLIP_MORE + b)
+            out.append(OP_FLIP + bits[-1])
+        elif len(layers) == 1:
+            out.append(OP_XOR_LAYER + layers[0])
+            out += struct.pack("<H", changed >> (9 * layers[0]))
+        else:
+            out.append(OP_XOR)
+            out += struct.pack("<I", changed)
+        prev = frame
+    if hold:
+        out.append(OP_HOLD + hold - 1)
+    return out
+
+
+def delta_animation(anim):
+    """Delta-encoded copy of a binary Animation, or None if it wouldn't shrink."""
+    if anim.depth != 1 or anim.frames is None or anim.delta:
+        return None
+    frames = anim.frames
+    if anim.holds is not None:
+        frames = [frame for frame, hold in zip(frames, anim.holds) for _ in range(hold)]
+    data = encode_delta(frames)
+    if len(data) + 4 >= anim.nbytes:
+        return None
+    return Animation(anim.name, anim.framerate, data, len(frames), delta=True,
+                     timing=anim.timing)
+
+
+def write_binary(f, animations):
+    """Write Animations to an open binary file as a container."""
+    count = len(animations)
+    offset = HEADER_SIZE + count * INDEX_ENTRY_SIZE
+    f.write(struct.pack(HEADER, MAGIC, VERSION, count, HEADER_SIZE))
+    blocks = []
+    for anim in animations:
+        flags = anim.depth
+        if anim.spec is not None:
+            import json
+            flags |= SPEC
+            data = json.dumps(anim.spec).encode("utf-8")
+            size = len(data)
+        elif anim.delta:
+            flags |= DELTA
+            data = anim.frames
+            size = len(data)
+        else:
+            data = anim.frames
+            size = None
+            if anim.holds is not None:
+                flags |= HOLDS
+        timing = None
+        if anim.timing:
+            flags |= TIMING
+            timing = struct.pack(TIMING_FORMAT, *(anim.timing.get(key, UNSET)
+                                                  for key in TIMING_KEYS))
+        f.write(struct.pack(INDEX_ENTRY, encode_name(anim.name), anim.framerate,
+                            flags, anim.num_frames, offset))
+        offset += anim.nbytes if size is None else 4 + size
+        if timing is not None:
+            offset += TIMING_SIZE
+        blocks.append((size, data, anim.holds if size is None else None, timing))
+    for size, data, holds, timing in blocks:
+        if size is not None:
+            f.write(struct.pack("<I", size))
+        # Both the Pico and the hosts we build on are little-endian, so an
+        # array's own bytes are already in file order
+        f.write(data)
+        if holds is not None:
+            f.write(holds)
+        if timing is not None:
+            f.write(timing)
+
+
+def encode_name(name):
+    """UTF-8 encode a name, dropping whole characters until it fits."""
+    encoded = name.encode("utf-8")
+    while len(encoded) > NAME_SIZE:
+        name = name[:-1]
+        encoded = name.encode("utf-8")
+    return encoded
@@ -0,0 +1,263 @@
+"""
+A library of animations kept as a directory of files, loaded one at a time.
+
+animations/ on CIRCUITPY can hold any number of animation files: binary
+containers from web-page/convert.py (.bin) and animator exports (.json),
+each with one or more animations. index.bin in the same directory lists
+every animation in them, files in name order (all fields little-endian):
+
+    header   magic b"LWCI", u16 version, u16 animation count, u16 file count
+    files    per file: 32-byte NUL-padded file name, u32 size in bytes and
+             u32 modification time, as os.stat gave them
+    entries  one per animation: 32-byte NUL-padded name, u16 framerate,
+             u16 flags (as in the container's index; 0 for JSON), u32 frame
+             count, u16 file number, u16 animation number within the file
+
+Library reads index entries from flash as they're needed rather than
+keeping the index in RAM, and only loads an animation when it's asked for,
+keeping the last KEEP it loaded. So boot time and RAM stay the same however
+many animations there are; only the flash used grows.
+
+The index is rebuilt, reading every file, when the files in the directory
+aren't the ones it lists, or any of them has a different size or
+modification time (or an animation isn't where it says). It's saved
+if the cube can write to its drive; otherwise the new index is kept in RAM
+until the next boot. Files with names over 32 bytes are left out.
+"""
+
+import os
+import struct
+
+from lib.animfile import NAME_SIZE, encode_name, load_binary, load_json, read_index
+
+INDEX_NAME = "index.bin"
+INDEX_MAGIC = b"LWCI"
+INDEX_VERSION = 2
+INDEX_HEADER = "<4sHHH"
+INDEX_HEADER_SIZE = struct.calcsize(INDEX_HEADER)
+FILE_NAME_SIZE = 32
+FILE_RECORD = "<32sII"
+FILE_RECORD_SIZE = struct.calcsize(FILE_RECORD)
+INDEX_RECORD = "<32sHHIHH"
+INDEX_RECORD_SIZE = struct.calcsize(INDEX_RECORD)
+# Index entries read at a time when looking an animation up by name
+SCAN_RECORDS = 32
+
+# Animations kept loaded: the one playing, the next one and one it's a
+# variant of, say
+KEEP = 3
+
+
+def list_files(directory):
+    """The animation files in a library directory, in name order."""
+    names = []
+    for name in os.listdir(directory):
+        if name == INDEX_NAME or len(name.encode("utf-8")) > FILE_NAME_SIZE:
+            continue
+        if name.endswith(".bin") or name.endswith(".json"):
+            names.append(name)
+    names.sort()
+    return names
+
+
+def file_stamp(directory, file_name):
+    """(size, modification time) of a file, to tell if it's changed."""
+    stat = os.stat(directory + "/" + file_name)
+    return stat[6] & 0xFFFFFFFF, int(stat[8]) & 0xFFFFFFFF
+
+
+def build_index(directory, files):
+    """Index for the given files in directory, and a list of problems with
+    the files that couldn't be read."""
+    records = bytearray()
+    problems = []
+    count = 0
+    for number, file_name in enumerate(files):
+        path = directory + "/" + file_name
+        try:
+            if file_name.endswith(".json"):
+                entries = [(a.name, a.framerate, 0, a.num_frames)
+                           for a in load_json(path)]
+            else:
+                with open(path, "rb") as f:
+                    entries = [entry[:4] for entry in read_index(f)]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            problems.append(f"{file_name}: {e}")
+            continue
+        for k, (name, framerate, flags, num_frames) in enumerate(entries):
+            records.extend(struct.pack(INDEX_RECORD, encode_name(name), framerate,
+                                       flags, num_frames, number, k))
+            count += 1
+    data = bytearray(struct.pack(INDEX_HEADER, INDEX_MAGIC, INDEX_VERSION,
+                                 count, len(files)))
+    for file_name in files:
+        data.extend(struct.pack(FILE_RECORD, file_name.encode("utf-8"),
+                                *file_stamp(directory, file_name)))
+    data.extend(records)
+    return data, problems
+
+
+def write_index(directory):
+    """Build and save a library directory's index; return the problems."""
+    data, problems = build_index(directory, list_files(directory))
+    with open(directory + "/" + INDEX_NAME, "wb") as f:
+        f.write(data)
+    return problems
+
+
+class Library:
+    """The animations in a library directory, by position or by name.
+
+    library[i] and library[name] load the animation if it isn't loaded
+    already; len(library) and `name in library` only read the index.
+    Raises OSError or ValueError if an animation can't be loaded.
+    """
+
+    def __init__(self, directory, stream_over=None):
+        self.directory = directory
+        self.path = directory + "/" + INDEX_NAME
+        self.stream_over = stream_over
+        self.data = None
+        self.loaded = []
+        self.problems = []
+        self.rebuilt = False
+        files = list_files(directory)
+        try:
+            self.read_header()
+            stale = self.files() != files or any(
+                self.file_stamp(n) != file_stamp(directory, name)
+                for n, name in enumerate(files))
+        except (OSError, ValueError):
+            stale = True
+        if stale:
+            self.rebuild(files)
+
+    def rebuild(self, files):
+        self.data, self.problems = build_index(self.directory, files)
+        self.rebuilt = True
+        try:
+            with open(self.path, "wb") as f:
+                f.write(self.data)
+            self.data = None
+        except OSError:
+            # Read-only: the computer has the drive (see boot.py)
+            pass
+        self.read_header()
+
+    def read(self, offset, size):
+        if self.data is not None:
+            return self.data[offset:offset + size]
+        buf = bytearray(size)
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            if f.readinto(buf) != size:
+                raise ValueError("truncated index")
+        return buf
+
+    def read_header(self):
+        magic, version, count, file_count = struct.unpack(
+            INDEX_HEADER, self.read(0, INDEX_HEADER_SIZE))
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError("not a library index")
+        self.count = count
+        self.file_count = file_count
+        self.records_at = INDEX_HEADER_SIZE + file_count * FILE_RECORD_SIZE
+
+    def files(self):
+        return [self.file_name(n) for n in range(self.file_count)]
+
+    def file_name(self, n):
+        data = self.read(INDEX_HEADER_SIZE + n * FILE_RECORD_SIZE, FILE_NAME_SIZE)
+        return bytes(data).rstrip(b"\0").decode("utf-8")
+
+    def file_stamp(self, n):
+        """(size, modification time) of file n when the index was made."""
+        data = self.read(INDEX_HEADER_SIZE + n * FILE_RECORD_SIZE + FILE_NAME_SIZE, 8)
+        return struct.unpack("<II", data)
+
+    def __len__(self):
+        return self.count
+
+    def entry(self, i):
+        """(name, framerate, flags, frame count, file number, number in file)."""
+        record = self.read(self.records_at + i * INDEX_RECORD_SIZE, INDEX_RECORD_SIZE)
+        name, framerate, flags, num_frames, file_number, number = struct.unpack(
+            INDEX_RECORD, record)
+        return (bytes(name).rstrip(b"\0").decode("utf-8"), framerate, flags,
+                num_frames, file_number, number)
+
+    def index_of(self, name):
+        """Position of the animation called name, or None."""
+        key = encode_name(name)
+        for start in range(0, self.count, SCAN_RECORDS):
+            n = min(SCAN_RECORDS, self.count - start)
+            data = self.read(self.records_at + start * INDEX_RECORD_SIZE,
+                             n * INDEX_RECORD_SIZE)
+            for k in range(n):
+                at = k * INDEX_RECORD_SIZE
+                if bytes(data[at:at + NAME_SIZE]).rstrip(b"\0") == key:
+                    return start + k
+        return None
+
+    def __contains__(self, name):
+        return self.index_of(name) is not None
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            anim = self.cached(key)
+            if anim is not None:
+                return anim
+            i = self.index_of(key)
+            if i is None:
+                raise KeyError(key)
+            return self.load(i)
+        if not 0 <= key < self.count:
+            raise IndexError("library index out of range")
+        return self.load(key)
+
+    def cached(self, name):
+        """The animation called name if it's loaded, now the latest used."""
+        for anim in self.loaded:
+            if anim.name == name:
+                self.loaded.remove(anim)
+                self.loaded.append(anim)
+                return anim
+        return None
+
+    def load(self, i):
+        name = self.entry(i)[0]
+        anim = self.cached(name)
+        if anim is not None:
+            return anim
+        try:
+            anim = self.load_entry(i)
+        except (OSError, ValueError):
+            if self.rebuilt:
+                raise
+            # The files have changed under the index: rebuild it and retry
+            self.rebuild(list_files(self.directory))
+            i = self.index_of(name)
+            if i is None:
+                raise ValueError(f"{name} is no longer in {self.directory}")
+            anim = self.load_entry(i)
+        self.loaded.append(anim)
+        if len(self.loaded) > KEEP:
+            # Let go of the one used longest ago
+            self.loaded.pop(0)
+        return anim
+
+    def load_entry(self, i):
+        name, _, _, _, file_number, number = self.entry(i)
+        file_name = self.file_name(file_number)
+        path = self.directory + "/" + file_name
+        if file_name.endswith(".json"):
+            animations = load_json(path)
+            if number >= len(animations):
+                raise ValueError(f"no animation {number} in {path}")
+            anim = animations[number]
+        else:
+            anim = load_binary(path, self.stream_over, number)[0]
+        if encode_name(anim.name) != encode_name(name):
+            raise ValueError(f"{path} has changed since {INDEX_NAME} was made")
+        return anim
+
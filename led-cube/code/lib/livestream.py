@@ -0,0 +1,137 @@
+"""
+Live frame streaming to the LED cube over its second USB serial port.
+
+Shared between the cube (CircuitPython) and web-page/stream.py, so it only
+uses struct. boot.py turns on usb_cdc.data, which shows up on the computer
+as a second serial port next to the REPL one.
+
+Packets (all fields little-endian), each ending in a checksum byte (the
+sum of the bytes after the sync, modulo 256):
+
+    frame  sync b"\\xA5\\x5A", u16 sequence number, u32 packed frame (27
+           bits, as in animations.json), u32 sender timestamp in µs, u8 sum
+    ack    sync, u16 sequence number, u32 the frame's sender timestamp,
+           u16 frames lost, u16 frames coalesced, u8 sum
+
+The sender numbers frames from 0, which also starts a new count of
+losses (so numbers wrap round from 65535 to 1), and sends them at its
+own pace. The cube shows the newest frame it has as soon as the previous
+one has reached the LEDs, and acknowledges each frame once it's on the
+LEDs: the sender times the whole round trip from the echoed timestamp.
+Frames lost are gaps in the sequence numbers (packets that never arrived
+intact); frames coalesced arrived fine but were replaced by a newer one
+before the cube could show them.
+"""
+
+import struct
+
+SYNC = b"\xA5\x5A"
+FRAME = "<2sHIIB"
+FRAME_SIZE = struct.calcsize(FRAME)
+ACK = "<2sHIHHB"
+ACK_SIZE = struct.calcsize(ACK)
+
+# The cube's refresh rate: frames sent faster than this can't all be shown
+MAX_FPS = 98
+
+
+def checksum(buf, start, end):
+    total = 0
+    for i in range(start, end):
+        total += buf[i]
+    return total & 0xFF
+
+
+def pack_into(fmt, buf, *fields):
+    """Pack a packet into buf, filling in the sync and checksum."""
+    struct.pack_into(fmt, buf, 0, SYNC, *fields, 0)
+    buf[len(buf) - 1] = checksum(buf, 2, len(buf) - 1)
+
+
+class PacketReader:
+    """Picks packets of one format out of a byte stream.
+
+    Bytes that don't start a packet with a good checksum are skipped one at
+    a time, so the reader resynchronises after garbage or a partial packet.
+    """
+
+    def __init__(self, fmt, count=8):
+        self.fmt = fmt
+        self.size = struct.calcsize(fmt)
+        self.buf = bytearray(count * self.size)
+        self.view = memoryview(self.buf)
+        self.n = 0
+
+    def read(self, stream):
+        """Read what's waiting on stream; return the complete packets in it."""
+        n = stream.readinto(self.view[self.n:])
+        if n:
+            self.n += n
+        buf = self.buf
+        size = self.size
+        packets = []
+        i = 0
+        while self.n - i >= size:
+            if buf[i] != 0xA5 or buf[i + 1] != 0x5A or \
+                    checksum(buf, i + 2, i + size - 1) != buf[i + size - 1]:
+                i += 1
+                continue
+            packets.append(struct.unpack_from(self.fmt, buf, i))
+            i += size
+        if i:
+            # Keep the start of any packet that's still arriving
+            buf[:self.n - i] = buf[i:self.n]
+            self.n -= i
+        return packets
+
+
+class Receiver:
+    """The cube's end of a live stream.
+
+    show(frame) queues a frame for the LEDs, returning False if it can't yet;
+    busy() is true until a queued frame has reached the LEDs.
+    """
+
+    def __init__(self, stream, show, busy):
+        self.stream = stream
+        self.show = show
+        self.busy = busy
+        self.reader = PacketReader(FRAME)
+        self.ack = bytearray(ACK_SIZE)
+        self.reset()
+
+    def reset(self):
+        self.expected = None
+        self.lost = 0
+        self.coalesced = 0
+        self.shown = 0
+        self.frame = None
+        self.seq = 0
+        self.stamp = 0
+        self.waiting = None
+
+    def poll(self):
+        """Handle whatever has arrived; return True if any packets had."""
+        packets = self.reader.read(self.stream)
+        for _, seq, frame, stamp, _ in packets:
+            if seq == 0:
+                self.reset()
+            elif self.expected is not None:
+                self.lost += (seq - self.expected) & 0xFFFF
+            self.expected = (seq + 1) & 0xFFFF or 1
+            if self.frame is not None:
+                self.coalesced += 1
+            self.frame = frame
+            self.seq = seq
+            self.stamp = stamp
+
+        if self.waiting is not None and not self.busy():
+            pack_into(ACK, self.ack, self.waiting[0], self.waiting[1],
+                      self.lost & 0xFFFF, self.coalesced & 0xFFFF)
+            self.stream.write(self.ack)
+            self.waiting = None
+        if self.frame is not None and self.waiting is None and self.show(self.frame):
+            self.waiting = (self.seq, self.stamp)
+            self.frame = None
+            self.shown += 1
+        return bool(packets)
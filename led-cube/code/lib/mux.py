@@ -0,0 +1,239 @@
+"""
+Layer multiplexing for LED cubes of any size N x N x N.
+
+A frame of an N-cube is an int of N ** 3 bits with LED (x, y, z) at bit
+x + N * y + N * N * z, as on the 3x3x3 cube, so z is the layer.
+
+Mux describes how a cube is wired to the pico: it generates the PIO
+program, and packs a layer's outputs and timing into the words DMA feeds
+that program. lib/timing.py works out how long each layer is lit and
+compiles whole frames through Mux.pack(), so every cube, this one
+included, has the one encoder. Two ways of wiring a cube are supported:
+
+DIRECT  every cathode and anode has its own pin: N * N + N consecutive
+        pins from first_out_pin, 12 for N = 3 and 20 for N = 4. With up to
+        12 pins each layer is a single word, pins in the low bits and the
+        timing above them (the 3x3x3 cube's format); otherwise it's a pins
+        word followed by a timing word.
+
+SHIFT   cathodes and anodes are clocked into a chain of 74HC595 shift
+        registers: data on one out pin, clock and latch on two side-set
+        pins, and the registers' output enable on a set pin. Each layer is
+        a control word then the chain's bits, most significant (the far end
+        of the chain) first. Outputs are turned off while the next layer
+        shifts in, so a layer's blanking is the control word's blank count
+        plus the time the chain takes to shift.
+
+pin_map says what each output carries: entry k is the LED-in-layer index
+(0 to N * N - 1) whose cathode is on pin k (DIRECT) or register output k
+(SHIFT, 0 being the first output of the register nearest the Pico), or
+N * N + z for layer z's anode, or None if the output is unused. The
+default is all the cathodes in order, then the anodes.
+"""
+
+DIRECT = "direct"
+SHIFT = "shift"
+
+PIO_FREQ = 1_000_000
+
+DIRECT_ONE_WORD = """
+.program cube_direct
+.wrap_target
+    pull block
+    out  pins, {pins}
+    out  x, 12
+    out  y, 8
+hold:
+    jmp  x-- hold
+    mov  osr, null
+    out  pins, {pins}
+blank:
+    jmp  y-- blank [3]
+.wrap
+"""
+
+DIRECT_TWO_WORDS = """
+.program cube_direct
+.wrap_target
+    pull block
+    out  pins, {pins}
+    pull block
+    out  x, 16
+    out  y, 16
+hold:
+    jmp  x-- hold
+    mov  osr, null
+    out  pins, {pins}
+blank:
+    jmp  y-- blank [3]
+.wrap
+"""
+
+# Side-set bit 0 is the shift clock, bit 1 the latch. Autopull brings in
+# each word as the last one runs out, so a layer is just a run of words: a
+# control word of bits to shift - 1 (8 bits), blank count (8) and hold
+# count (16), then the data.
+SHIFT_CHAIN = """
+.program cube_shift
+.side_set 2
+.wrap_target
+    out  x, 8          side 0b00
+    out  y, 8          side 0b00
+    set  pins, 1       side 0b00
+blank:
+    jmp  y-- blank     side 0b00 [3]
+    out  y, 16         side 0b00
+shift:
+    out  pins, 1       side 0b00
+    jmp  x-- shift     side 0b01
+    nop                side 0b10
+    set  pins, 0       side 0b00
+hold:
+    jmp  y-- hold      side 0b00
+.wrap
+"""
+
+
+class Mux:
+    """PIO program, state machine settings and word format for an N-cube.
+
+    Each layer (each bit-plane of one, for grayscale) is lit for `on` PIO
+    cycles and then dark for `blank`, which pack() rounds down to a whole
+    4 cycles. min_on, max_on, min_blank and max_blank are the times its
+    words can hold.
+    """
+
+    def __init__(self, n, drive=DIRECT, pin_map=None):
+        self.n = n
+        self.layer_leds = n * n
+        self.drive = drive
+        if pin_map is None:
+            pin_map = list(range(self.layer_leds + n))
+        self.pin_map = pin_map
+        # With the default map a layer's pins are just its LED bits with the
+        # anode above them, no shuffling needed
+        self.in_order = pin_map == list(range(self.layer_leds + n))
+        self.outputs = len(pin_map)
+        # (LED bit, output) pairs and each layer's anode outputs, so
+        # shuffling doesn't have to look anything up per output
+        self.cathodes = [(signal, k) for k, signal in enumerate(pin_map)
+                         if signal is not None and signal < self.layer_leds]
+        self.anodes = [0] * n
+        for k, signal in enumerate(pin_map):
+            if signal is not None and signal >= self.layer_leds:
+                self.anodes[signal - self.layer_leds] |= 1 << k
+
+        if drive == DIRECT:
+            if self.outputs > 32:
+                raise ValueError(f"{self.outputs} pins won't fit one PIO word: "
+                                 f"use shift registers")
+            self.one_word = self.outputs <= 12
+            template = DIRECT_ONE_WORD if self.one_word else DIRECT_TWO_WORDS
+            self.program = template.format(pins=self.outputs)
+            self.layer_words = 1 if self.one_word else 2
+            hold_bits = 12 if self.one_word else 16
+            blank_bits = 8 if self.one_word else 16
+            # Lit for hold + 5 cycles (one word) or + 6 (two); dark for
+            # 4 * blank + 6
+            self.lit_cycles = 5 if self.one_word else 6
+            self.dark_cycles = 6
+            # The word of a layer's group with the blank count, and where
+            self.blank_word = 0 if self.one_word else 1
+            self.blank_shift = 24 if self.one_word else 16
+        elif drive == SHIFT:
+            self.one_word = False
+            self.data_words = (self.outputs + 31) // 32
+            self.data_bits = 32 * self.data_words
+            if self.data_bits > 256:
+                raise ValueError(f"{self.outputs} outputs won't fit the control "
+                                 f"word's 8-bit shift count")
+            self.program = SHIFT_CHAIN
+            self.layer_words = 1 + self.data_words
+            hold_bits = 16
+            blank_bits = 8
+            # Lit for the set that turns the outputs on, the hold loop
+            # (hold + 1) and the next layer's two outs; dark for the set,
+            # the blank loop (4 * blank + 4), an out, 2 cycles per bit
+            # shifted and the latch
+            self.lit_cycles = 4
+            self.dark_cycles = 2 * self.data_bits + 7
+            self.blank_word = 0
+            self.blank_shift = 16
+        else:
+            raise ValueError(f"drive must be {DIRECT!r} or {SHIFT!r}")
+        self.max_blank_count = (1 << blank_bits) - 1
+        self.min_on = self.lit_cycles
+        self.max_on = (1 << hold_bits) - 1 + self.lit_cycles
+        self.min_blank = self.dark_cycles
+        self.max_blank = 4 * self.max_blank_count + self.dark_cycles
+
+    def state_machine_kwargs(self):
+        """rp2pio.StateMachine settings besides the program, frequency and pins.
+
+        DIRECT needs first_out_pin; SHIFT needs first_out_pin (data),
+        first_sideset_pin (clock, then latch on the next pin) and
+        first_set_pin (output enable).
+        """
+        if self.drive == DIRECT:
+            return {"out_pin_count": self.outputs, "out_shift_right": True,
+                    "auto_pull": False}
+        return {"out_pin_count": 1, "sideset_pin_count": 2, "set_pin_count": 1,
+                "out_shift_right": False, "auto_pull": True, "pull_threshold": 32}
+
+    def layer_cycles(self, on, blank):
+        """PIO cycles a layer packed with these times takes."""
+        return on + self.dark_cycles + 4 * ((blank - self.dark_cycles) // 4)
+
+    def layer_outputs(self, frame, z):
+        """What each output should be for layer z of a frame, as an int."""
+        n2 = self.layer_leds
+        layer = (frame >> (z * n2)) & ((1 << n2) - 1)
+        if self.in_order:
+            return layer | (1 << (n2 + z))
+        value = self.anodes[z]
+        for bit, k in self.cathodes:
+            value |= ((layer >> bit) & 1) << k
+        return value
+
+    def pack(self, outputs, on, blank, words, i):
+        """Write a layer's words, from words[i], for it to show `outputs`
+        for `on` cycles and then go dark for `blank`. Returns the index
+        after them."""
+        hold = on - self.lit_cycles
+        count = (blank - self.dark_cycles) // 4
+        if self.drive == DIRECT:
+            if self.one_word:
+                words[i] = outputs | (hold << 12) | (count << 24)
+                return i + 1
+            words[i] = outputs
+            words[i + 1] = hold | (count << 16)
+            return i + 2
+        words[i] = ((self.data_bits - 1) << 24) | (count << 16) | hold
+        # Most significant word first: its top bit goes furthest down the
+        # chain
+        for w in range(self.data_words):
+            shift = 32 * (self.data_words - 1 - w)
+            words[i + 1 + w] = (outputs >> shift) & 0xFFFFFFFF
+        return i + 1 + self.data_words
+
+    def cycles_of(self, words, i):
+        """PIO cycles the layer whose words start at words[i] takes."""
+        word = words[i + self.blank_word]
+        hold = (word >> 12 if self.one_word else word) & (self.max_on - self.lit_cycles)
+        count = (word >> self.blank_shift) & self.max_blank_count
+        return hold + self.lit_cycles + self.dark_cycles + 4 * count
+
+    def leds_of(self, words, i):
+        """The LED bits lit by the layer whose words start at words[i]."""
+        if self.drive == DIRECT:
+            outputs = words[i] & ((1 << self.outputs) - 1)
+        else:
+            outputs = 0
+            for w in range(self.data_words):
+                outputs = (outputs << 32) | words[i + 1 + w]
+        if self.in_order:
+            return outputs & ((1 << self.layer_leds) - 1)
+        leds = 0
+        for bit, k in self.cathodes:
+            leds |= ((outputs >> k) & 1) << bit
+        return leds
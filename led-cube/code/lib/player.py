@@ -0,0 +1,669 @@
+"""
+Playing animations on the cube: compiling them into PIO words (Compiled)
+and feeding those to the mux state machine by DMA (AnimPlayer).
+
+code.py makes one AnimPlayer and calls its tick() from the main loop; the
+settings it's made with are the ones at the top of code.py. Nothing here
+touches a pin, so anything with rp2pio's background_write(), stop and
+pending_write will do for the state machine, such as the simulator's.
+"""
+
+import array
+import gc
+import time
+
+from lib.animfile import ArraySource, DeltaDecoder, FrameStream, StreamSource, new_frames
+from lib.mux import PIO_FREQ
+from lib.telemetry import LatenessStats
+from lib.timing import Timing, merge
+from lib.transform import Composite, Dissolve, TransformSource, transform_for
+from lib.voxel import Procedural
+
+_timings = {}
+
+
+def timing_for(anim, default):
+    """Timing for an animation: the cube's profile, default, with its overrides."""
+    if not anim.timing:
+        return default
+    settings = merge(default.settings(), anim.timing)
+    key = (settings["refresh_hz"], settings["blank_us"], settings["compensation"])
+    if key not in _timings:
+        try:
+            _timings[key] = Timing(**settings, mux=default.mux)
+        except ValueError as e:
+            print(f"{anim.name}: timing not used: {e}")
+            _timings[key] = default
+    return _timings[key]
+
+
+def paced_timing(timing, depth, framerate, num_frames, max_bytes):
+    """Refreshes per frame and PIO cycles per unstretched refresh for pacing.
+
+    None if the framerate is too fast to pace in hardware or the unrolled
+    loop would need over max_bytes.
+    """
+    mux = timing.mux
+    bits = timing.layer_bits(depth)
+    # Cycles for one refresh as the timing profile has it: pacing only ever
+    # adds to its blanking, so it still keeps ghosting at bay
+    base = timing.refresh_cycles(depth)
+    room = mux.max_blank_count - max(bits[e] >> mux.blank_shift & mux.max_blank_count
+                                     for e in timing.blank_words(depth))
+    repeats = PIO_FREQ // (framerate * base)
+    if not repeats or PIO_FREQ // (framerate * repeats) - base > mux.n * 4 * room:
+        return None
+    if 4 * timing.frame_words(depth) * repeats * num_frames > max_bytes:
+        return None
+    return repeats, base
+
+
+class Compiled:
+    """An animation held in RAM, compiled into PIO words a few frames per step().
+
+    Hardware-paced animations are compiled into one self-timed DMA loop:
+    each frame is written out once per refresh it's shown for, and the
+    blanking after each layer is stretched so those refreshes add up to
+    exactly the frame time (to the nearest 4 PIO cycles, with the error
+    carried over rather than accumulated). Looped by DMA, the animation then
+    plays at the PIO clock's accuracy with no help from Python. Others get
+    one copy of each frame, for AnimPlayer to step through.
+
+    Compiling in steps lets the next animation be prepared between frames
+    of the current one, so switching to it is just a DMA buffer swap.
+    Animations are only hardware-paced if their loop fits in
+    paced_max_bytes (0 for never).
+    """
+
+    def __init__(self, anim, frames, depth, timing, holds=None, transform=None,
+                 paced_max_bytes=0):
+        self.anim = anim
+        self.timing = timing
+        self.frames = frames
+        self.depth = depth
+        self.holds = holds
+        self.apply = transform.apply if transform is not None else None
+        self.num_frames = len(frames) // depth
+        self.length = self.num_frames if holds is None else sum(holds)
+        self.frame_words = self.timing.frame_words(depth)
+        timing = paced_timing(self.timing, depth, anim.framerate, self.length,
+                              paced_max_bytes) if paced_max_bytes else None
+        self.repeats, self.base = timing or (0, 0)
+        self.ends = self.timing.blank_words(depth)
+        # Paced, a held frame is written out once per refresh of its hold
+        self.words = array.array('I', bytes(4 * self.frame_words * (
+            self.repeats * self.length if self.repeats else self.num_frames)))
+        self.done = 0
+        self.pos = 0
+        self.refreshes = 0
+        self.elapsed = 0
+
+    @property
+    def finished(self):
+        return self.done == self.num_frames
+
+    def step(self, count):
+        """Compile up to `count` more frames."""
+        depth = self.depth
+        end = min(self.done + count, self.num_frames)
+        for f in range(self.done, end):
+            planes = self.frames[f * depth:(f + 1) * depth]
+            if self.apply is not None:
+                # A variant of another animation: transform as we go
+                planes = [self.apply(p) for p in planes]
+            self.timing.compile_into(planes, self.words, self.pos, depth)
+            if self.repeats:
+                hold = 1 if self.holds is None else self.holds[f]
+                self.pace(self.repeats * hold)
+            else:
+                self.pos += self.frame_words
+        self.done = end
+
+    def pace(self, refreshes):
+        """Repeat the frame just compiled for each refresh it's shown for."""
+        words = self.words
+        frame_words = self.frame_words
+        framerate = self.anim.framerate
+        mux = self.timing.mux
+        i = self.pos
+        plain = [words[i + e] for e in self.ends]
+        for r in range(refreshes):
+            if r:
+                words[i:i + frame_words] = words[i - frame_words:i]
+            self.refreshes += 1
+            blank = (self.refreshes * PIO_FREQ // (framerate * self.repeats)
+                     - self.elapsed - self.base) // 4
+            for k, e in enumerate(self.ends):
+                count = (blank + k) // mux.n
+                words[i + e] = plain[k] + (count << mux.blank_shift)
+            self.elapsed += self.base + 4 * blank
+            i += frame_words
+        self.pos = i
+
+
+def release_source(source):
+    """Close any files a source (or the sources inside it) has open."""
+    if hasattr(source, "close"):
+        source.close()
+    for inner in getattr(source, "sources", ()):
+        release_source(inner)
+    if hasattr(source, "source"):
+        release_source(source.source)
+
+
+def source_for(anim, library):
+    """Frame source that plays any binary animation one frame at a time."""
+    spec = anim.spec
+    if spec is None:
+        if anim.delta:
+            return DeltaDecoder(anim)
+        if anim.streamed:
+            return StreamSource(anim)
+        return ArraySource(anim.frames, anim.holds)
+    if "generator" in spec:
+        return Procedural(spec["generator"], spec.get("params"))
+    if "base" in spec:
+        return TransformSource(source_for(library[spec["base"]], library),
+                               transform_for(spec.get("transform", {})))
+    layers = [library[name] for name in spec["layers"]]
+    return Composite(spec["composite"], [source_for(a, library) for a in layers],
+                     [a.framerate for a in layers], anim.framerate)
+
+
+class AnimPlayer:
+    """Steps through a precompiled animation by swapping DMA loop buffers.
+
+    The front buffer is the 3-word slice DMA is currently looping into the
+    PIO; the back buffer is the next frame's slice, queued with
+    background_write(loop=...). rp2pio only switches to a pending loop buffer
+    once the current one has been written out in full, so a frame change can
+    never tear across layers.
+
+    Animations held in RAM are compiled in full before they play (see
+    Compiled); preload() prepares the next one in steps between frames so
+    that switching to it doesn't hold up the display.
+
+    Streamed animations play out of a ring of 2 * stream_chunk compiled
+    frames. As soon as playback moves into one half of the ring, the other
+    half is refilled from flash, a whole chunk ahead of when it's needed.
+
+    Animations that produce frames one at a time (delta-encoded, procedural
+    and composite ones) are played from a source: each frame is pulled with
+    source.next_frame() and compiled into whichever of two one-frame buffers
+    DMA isn't looping, then swapped in.
+
+    Frames are scheduled against absolute integer deadlines from
+    time.monotonic_ns(), so loop latency never accumulates into drift. If
+    playback falls a whole frame behind, catch_up skips frames to get back on
+    schedule; otherwise every frame is shown and the schedule restarts from
+    now.
+
+    Hardware-paced animations are one DMA loop, too long to queue anything
+    behind: leave_paced() hands over from it at the end of a refresh by
+    working out where the PIO is from when the loop started.
+
+    timing is the cube's timing profile, which animations' own settings
+    override. Animations are hardware-paced if their loop fits in
+    paced_max_bytes (0 to pace them all with Python), preloaded
+    preload_step frames at a time, and dissolved into over dissolve_frames
+    frames at dissolve_fps. While it waits on DMA, wake_ns() is poll_ns
+    away. With a Telemetry, it counts what tick() does.
+    """
+
+    # Words DMA has read ahead of the PIO: the TX FIFO's depth
+    FIFO_WORDS = 4
+
+    def __init__(self, sm, library, timing, *, stream_chunk, preload_step,
+                 paced_max_bytes, dissolve_frames, dissolve_fps, poll_ns,
+                 telemetry=None):
+        self.sm = sm
+        self.library = library
+        self.cube_timing = timing
+        self.stream_chunk = stream_chunk
+        self.preload_step = preload_step
+        self.paced_max_bytes = paced_max_bytes
+        self.dissolve_frames = dissolve_frames
+        self.dissolve_fps = dissolve_fps
+        self.poll_ns = poll_ns
+        self.telemetry = telemetry
+        self.words = None
+        self.frames = None
+        self.front = None
+        self.back = None
+        self.stream = None
+        self.stream_buf = None
+        self.source = None
+        self.depth = 1
+        self.refill_slot = None
+        self.slot = 0
+        self.slots = 0
+        self.frame_words = timing.frame_words()
+        self.frame_num = 0
+        self.frame_time_ns = 100_000_000
+        self.deadline_ns = time.monotonic_ns()
+        self.catch_up = False
+        self.stats = LatenessStats()
+        self.num_frames = 0
+        self.paused = False
+        self.paced = False
+        self.paced_start_ns = 0
+        self.paced_cycles = 0
+        self.resume_word = 0
+        self.live = False
+        self.next = None
+        self.after = None
+        self.holds = None
+        self.source_frame = 0
+        self.timing = timing
+        self.paced_hz = 0
+
+    def compiled_for(self, anim):
+        """Compiled (with nothing compiled yet) for an animation in RAM, or None.
+
+        Only animations whose frames are all in memory, or variants of them,
+        are compiled; the rest play from a source or stream as they go.
+        """
+        spec = anim.spec
+        if spec is None:
+            if anim.delta or anim.streamed:
+                return None
+            return Compiled(anim, anim.frames, anim.depth,
+                            timing_for(anim, self.cube_timing), anim.holds,
+                            paced_max_bytes=self.paced_max_bytes)
+        if "base" in spec:
+            base = self.library[spec["base"]]
+            if base.frames is not None and not base.delta and base.spec is None:
+                return Compiled(anim, base.frames, base.depth,
+                                timing_for(anim, self.cube_timing), base.holds,
+                                transform_for(spec.get("transform", {})),
+                                self.paced_max_bytes)
+        return None
+
+    def load(self, anim, dissolve=False):
+        """Switch to anim, dissolving into it from the frame on the LEDs.
+
+        Uses the animation preload() has been preparing if it's this one.
+        Only animations compiled into RAM dissolve; others start at once.
+        """
+        compiled = self.next if self.is_preloaded(anim) else None
+        self.next = None
+        if compiled is None:
+            compiled = self.compiled_for(anim)
+        if compiled is not None:
+            compiled.step(compiled.num_frames)
+            if dissolve and self.front is not None:
+                self.dissolve_into(compiled)
+            else:
+                self.load_compiled(compiled)
+                self.set_framerate(anim.framerate)
+            depth = compiled.depth
+        else:
+            self.timing = timing_for(anim, self.cube_timing)
+            if anim.spec is not None or anim.delta:
+                self.load_source(source_for(anim, self.library))
+            else:
+                self.load_stream(anim)
+            self.set_framerate(anim.framerate)
+            depth = self.depth
+        timing = compiled.timing if compiled is not None else self.timing
+        hz = timing.refresh_hz(depth)
+        if compiled is not None and compiled.repeats:
+            pacing = f"hardware-paced, {compiled.repeats} refreshes/frame"
+            hz = anim.framerate * compiled.repeats
+        else:
+            pacing = "paced by Python"
+        print(f"{anim.name}: {depth}-bit, {timing.frame_words(depth)} PIO words/frame, "
+              f"refresh {hz:.1f} Hz, {pacing}, timing {timing.settings()}")
+
+    def preload(self, anim):
+        """Start preparing anim to be switched to; step_preload() continues."""
+        self.next = None
+        gc.collect()
+        try:
+            self.next = self.compiled_for(anim)
+        except MemoryError:
+            # No room for two at once: it'll be compiled when it's needed
+            gc.collect()
+
+    def step_preload(self):
+        """Compile a few more frames of the preload; False once there's none to do."""
+        if self.next is None or self.next.finished:
+            return False
+        self.next.step(self.preload_step)
+        return True
+
+    def is_preloaded(self, anim):
+        return self.next is not None and self.next.anim is anim
+
+    def load_compiled(self, compiled):
+        self.release()
+        self.timing = compiled.timing
+        self.depth = compiled.depth
+        self.words = compiled.words
+        self.frames = memoryview(self.words)
+        self.frame_words = compiled.frame_words
+        self.num_frames = compiled.num_frames
+        if compiled.repeats:
+            # One self-timed loop: tick() has nothing to do. Holds are
+            # unrolled in it, so count frames in frame periods
+            self.num_frames = compiled.length
+            self.paced = True
+            # Blanking is stretched to fit the frames, so the refresh rate
+            # is the framerate times refreshes per frame
+            self.paced_hz = compiled.anim.framerate * compiled.repeats
+            self.paced_cycles = compiled.elapsed
+            self.play_paced(0)
+        else:
+            self.holds = compiled.holds
+            self.slots = self.num_frames
+            self.restart()
+
+    def dissolve_into(self, compiled):
+        """Play a Dissolve to compiled's first frame, then compiled itself."""
+        # Settle on a frame first: a paced loop plays on until it's left
+        self.release()
+        start = self.showing()
+        end = compiled.timing.frame_of(compiled.words, 0, compiled.depth)
+        self.timing = compiled.timing
+        self.load_source(Dissolve(start, end, self.dissolve_frames))
+        self.set_framerate(self.dissolve_fps)
+        self.after = compiled
+
+    def load_stream(self, anim):
+        self.release()
+        self.stream = FrameStream(anim)
+        # A fresh ring each time: the previous one may still be on the pins
+        self.depth = anim.depth
+        self.stream_buf = new_frames(self.stream_chunk * anim.depth)
+        self.frame_words = self.timing.frame_words(anim.depth)
+        self.words = array.array('I', bytes(4 * 2 * self.stream_chunk * self.frame_words))
+        self.frames = memoryview(self.words)
+        self.num_frames = anim.num_frames
+        self.holds = anim.holds
+        self.slots = 2 * self.stream_chunk
+        self.fill(0)
+        self.restart()
+        self.refill_slot = self.stream_chunk
+
+    def load_source(self, source):
+        """Play binary frames pulled one at a time from source.next_frame().
+
+        source.num_frames is the length of one loop, or 0 if it never ends.
+        """
+        self.release()
+        self.source = source
+        self.depth = 1
+        self.frame_words = self.timing.frame_words()
+        self.words = array.array('I', bytes(8 * self.frame_words))
+        self.frames = memoryview(self.words)
+        self.num_frames = source.num_frames
+        self.slots = 2
+        self.source_frame = self.pull(1)
+        self.timing.compile_into((self.source_frame,), self.words, 0)
+        self.restart()
+
+    def load_live(self):
+        """Show frames only as they're handed to show_live()."""
+        self.release()
+        self.live = True
+        self.timing = self.cube_timing
+        self.depth = 1
+        self.frame_words = self.timing.frame_words()
+        self.words = array.array('I', bytes(8 * self.frame_words))
+        self.frames = memoryview(self.words)
+        self.num_frames = 0
+        self.slots = 2
+        self.slot = 0
+        self.show(0)
+
+    def show_live(self, frame):
+        """Queue a live frame; False if the last one isn't on the LEDs yet."""
+        if self.sm.pending_write:
+            return False
+        self.slot ^= 1
+        self.timing.compile_into((frame,), self.words, self.slot * self.frame_words)
+        self.show(self.slot)
+        return True
+
+    def restart(self):
+        self.frame_num = 0
+        self.slot = 0
+        self.show(0)
+        self.deadline_ns = time.monotonic_ns() + self.hold_ns(0)
+
+    def release(self):
+        """Let go of whatever the previous animation was playing from."""
+        if self.paced and not self.paused:
+            # A write queued behind a paced loop would wait for the whole
+            # loop to play out: hand over at the end of a refresh instead
+            self.leave_paced()
+        self.holds = None
+        self.paced = False
+        self.live = False
+        self.after = None
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+            self.refill_slot = None
+        if self.source is not None:
+            release_source(self.source)
+            self.source = None
+
+    def fill(self, slot):
+        """Read and compile the next chunk of a stream into the ring at `slot`."""
+        self.stream.read(self.stream_buf)
+        telemetry = self.telemetry
+        if telemetry is not None:
+            start_ns = time.monotonic_ns()
+        self.timing.compile_into(self.stream_buf, self.words, slot * self.frame_words, self.depth)
+        if telemetry is not None:
+            telemetry.compiled(time.monotonic_ns() - start_ns)
+
+    def pull(self, steps):
+        """Advance the source `steps` frames and return the last."""
+        for _ in range(steps):
+            frame = self.source.next_frame()
+        return frame
+
+    def hold_ns(self, frame_num):
+        """How long frame `frame_num` (wrapping round) stays on the LEDs."""
+        if self.holds is None:
+            return self.frame_time_ns
+        return self.holds[frame_num % self.num_frames] * self.frame_time_ns
+
+    def set_framerate(self, framerate):
+        # Re-anchor the pending deadline so a new framerate applies at once
+        hold = 1 if self.holds is None else self.holds[self.frame_num % self.num_frames]
+        self.deadline_ns += hold * (1_000_000_000 // framerate - self.frame_time_ns)
+        self.frame_time_ns = 1_000_000_000 // framerate
+
+    def show(self, slot):
+        # Keep references to both the queued slice and the one it replaces:
+        # DMA goes on reading the old one until the swap actually happens
+        self.back = self.front
+        start = slot * self.frame_words
+        self.front = self.frames[start:start + self.frame_words]
+        self.sm.background_write(loop=self.front)
+
+    def pause(self, paused):
+        """Freeze on the current frame; DMA keeps looping it meanwhile."""
+        if self.paced and paused != self.paused:
+            self.pause_paced(paused)
+        elif self.paused and not paused:
+            self.deadline_ns = time.monotonic_ns() + self.frame_time_ns
+        self.paused = paused
+
+    def paced_cycle(self):
+        # The PIO keeps perfect time, so where it is in the loop follows
+        # from when the loop started
+        elapsed = time.monotonic_ns() - self.paced_start_ns
+        return max(elapsed, 0) * PIO_FREQ // 1_000_000_000
+
+    def play_paced(self, start):
+        """Loop the paced animation, playing it out from word `start` (the
+        first word of a refresh) the first time round.
+
+        The loop is queued behind what's on the LEDs, so it starts at the end
+        of a refresh; waiting for that to happen gives paced_start_ns.
+        """
+        before = self.front
+        self.back = before
+        self.front = self.frames
+        self.sm.background_write(once=self.frames[start:] if start else None,
+                                 loop=self.front)
+        now = time.monotonic_ns()
+        while self.sm.pending_write:
+            now = time.monotonic_ns()
+        # DMA has just read the loop's first word: the PIO gets to it once
+        # the words ahead of it in the FIFO have played
+        ahead = 0
+        if before is not None:
+            for k in range(-self.FIFO_WORDS, 0):
+                ahead += self.timing.mux.cycles_of(before, k % len(before))
+        ahead -= start // self.frame_words * PIO_FREQ // self.paced_hz
+        self.paced_start_ns = now + ahead * 1_000_000_000 // PIO_FREQ
+
+    def leave_paced(self):
+        """Stop the paced loop at the end of a refresh and loop that refresh.
+
+        DMA is stopped while the PIO plays the word FIFO_WORDS + 1 before a
+        refresh ends, so the FIFO is left holding the rest of that refresh;
+        the refresh is then looped, and whatever is written next swaps in at
+        a refresh boundary as usual. Refresh q of the loop starts
+        q * PIO_FREQ // paced_hz cycles in (to within 4: see Compiled.pace).
+        Returns the first word of the refresh the loop had got to.
+        """
+        frames = self.frames
+        n = len(self.words)
+        frame_words = self.frame_words
+        hz = self.paced_hz
+        at = self.paced_cycle()
+        loop = at - at % self.paced_cycles
+        end = (at - loop) * hz // PIO_FREQ + 1
+        while True:
+            word = end * frame_words - self.FIFO_WORDS - 1
+            refresh = word // frame_words
+            start = loop + refresh * PIO_FREQ // hz
+            for i in range(refresh * frame_words, word):
+                start += self.timing.mux.cycles_of(frames, i % n)
+            if start >= at:
+                break
+            end += 1
+        # Stop halfway through the word, well clear of either end of it
+        start += self.timing.mux.cycles_of(frames, word % n) // 2
+        stop_ns = self.paced_start_ns + start * 1_000_000_000 // PIO_FREQ
+        while time.monotonic_ns() < stop_ns:
+            pass
+        self.sm.stop_background_write()
+        last = (end - 1) * frame_words % n
+        self.back = self.front
+        self.front = frames[last:last + frame_words]
+        self.sm.background_write(loop=self.front)
+        return end * frame_words % n
+
+    def showing(self):
+        """The frame on the LEDs (its most significant plane, if grayscale)."""
+        view = self.front
+        if self.paced and not self.paused:
+            refresh = self.paced_cycle() % self.paced_cycles * self.paced_hz // PIO_FREQ
+            start = refresh * self.frame_words % len(self.words)
+            view = self.frames[start:start + self.frame_words]
+        return self.timing.frame_of(view, 0, self.depth)
+
+    def pause_paced(self, paused):
+        if paused:
+            self.resume_word = self.leave_paced()
+        else:
+            # Play out the rest of the loop from where it stopped, then loop
+            # it all
+            self.play_paced(self.resume_word)
+
+    def refresh_hz(self):
+        """The refresh rate the LEDs are getting now."""
+        if self.paced:
+            return self.paced_hz
+        return self.timing.refresh_hz(self.depth)
+
+    def wake_ns(self):
+        """When tick() next has anything to do."""
+        if self.live or self.refill_slot is not None or self.sm.pending_write:
+            # Waiting on DMA to reach the end of the frame, or on the next
+            # live frame: nap for poll_ns, then look again
+            return time.monotonic_ns() + self.poll_ns
+        if self.paused or self.paced:
+            return None
+        return self.deadline_ns
+
+    def tick(self):
+        # Refill the half of the ring playback has just left, once DMA has
+        # moved off its last frame (nothing pending means it has)
+        if self.refill_slot is not None and not self.sm.pending_write:
+            self.fill(self.refill_slot)
+            self.refill_slot = None
+
+        if self.paused or self.paced or self.live:
+            return
+        telemetry = self.telemetry
+        if telemetry is not None:
+            telemetry.ticks += 1
+        now = time.monotonic_ns()
+        late = now - self.deadline_ns
+        if late < 0:
+            return
+        # A swap is still waiting for the current mux cycle to finish;
+        # queueing another would block, so try again next tick.
+        if self.sm.pending_write:
+            if telemetry is not None:
+                telemetry.pending += 1
+            return
+        if self.after is not None and self.source.done:
+            # The dissolve has finished: on to the animation itself
+            compiled = self.after
+            self.load_compiled(compiled)
+            self.set_framerate(compiled.anim.framerate)
+            return
+        self.stats.add(late)
+
+        # Deadlines fall only where the frame changes: a held frame is
+        # shown once and costs nothing until its hold is over
+        steps = 1
+        span = self.hold_ns(self.frame_num + 1)
+        if late >= span:
+            if self.catch_up:
+                # Never skip past the half of a stream's ring that's been read
+                limit = self.stream_chunk - self.slot % self.stream_chunk \
+                    if self.stream is not None else None
+                while late >= span and steps != limit:
+                    late -= span
+                    self.deadline_ns += span
+                    steps += 1
+                    span = self.hold_ns(self.frame_num + steps)
+                self.stats.skipped += steps - 1
+            else:
+                self.deadline_ns = now
+        self.deadline_ns += span
+
+        self.frame_num += steps
+        if self.num_frames:
+            self.frame_num %= self.num_frames
+        if self.source is not None:
+            frame = self.pull(steps)
+            if frame == self.source_frame:
+                # Sources repeat frames too: leave the LEDs as they are
+                if telemetry is not None:
+                    telemetry.changed(time.monotonic_ns() - now)
+                return
+            self.source_frame = frame
+            self.slot ^= 1
+            if telemetry is not None:
+                start_ns = time.monotonic_ns()
+            self.timing.compile_into((frame,), self.words, self.slot * self.frame_words)
+            if telemetry is not None:
+                telemetry.compiled(time.monotonic_ns() - start_ns)
+        else:
+            self.slot = (self.slot + steps) % self.slots
+        self.show(self.slot)
+        if self.stream is not None and self.slot % self.stream_chunk == 0:
+            self.refill_slot = (self.slot + self.stream_chunk) % self.slots
+        if telemetry is not None:
+            telemetry.changed(time.monotonic_ns() - now)
@@ -0,0 +1,213 @@
+"""
+Measuring the cube's main loop: how late frame changes are, how long a
+switch takes to reach the LEDs, how much of the time it sleeps, and the
+telemetry counters.
+
+The player (lib/player.py) keeps a LatenessStats and code.py makes the
+rest. They only depend on time and gc, so they work the same on a
+computer, and everything is kept as running totals or fixed-size
+histograms, so they can run for days in constant memory.
+"""
+
+import array
+import gc
+import time
+
+
+class LatenessStats:
+    """Running statistics of how late frame changes happen, in nanoseconds.
+
+    Keeps a fixed histogram rather than every sample so it can run for days
+    in constant memory; p99 is reported as the upper edge of its bucket.
+    """
+
+    BUCKET_NS = 100_000
+    BUCKETS = 100
+
+    def __init__(self):
+        self.histogram = array.array('I', bytes(4 * (self.BUCKETS + 1)))
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self.histogram)):
+            self.histogram[i] = 0
+        self.count = 0
+        self.total_ns = 0
+        self.min_ns = None
+        self.max_ns = 0
+        self.skipped = 0
+
+    def add(self, late_ns):
+        self.count += 1
+        self.total_ns += late_ns
+        if self.min_ns is None or late_ns < self.min_ns:
+            self.min_ns = late_ns
+        if late_ns > self.max_ns:
+            self.max_ns = late_ns
+        self.histogram[min(late_ns // self.BUCKET_NS, self.BUCKETS)] += 1
+
+    def percentile_ns(self, pct):
+        target = self.count * pct // 100
+        seen = 0
+        for i, n in enumerate(self.histogram):
+            seen += n
+            if seen > target:
+                return (i + 1) * self.BUCKET_NS if i < self.BUCKETS else self.max_ns
+        return self.max_ns
+
+    def report(self):
+        if not self.count:
+            print("lateness: no frames yet")
+            return
+        print(f"lateness over {self.count} frames: "
+              f"min {self.min_ns / 1e6:.2f} ms, "
+              f"mean {self.total_ns / self.count / 1e6:.2f} ms, "
+              f"max {self.max_ns / 1e6:.2f} ms, "
+              f"p99 <= {self.percentile_ns(99) / 1e6:.2f} ms, "
+              f"{self.skipped} frames skipped")
+
+
+class SwitchTimer:
+    """Times a switch from the button to the new animation on the LEDs.
+
+    load() only queues the first frame: it's on the LEDs once its write
+    stops pending, and after a dissolve the animation itself comes later.
+    """
+
+    def __init__(self):
+        self.start_ns = None
+
+    def start(self, start_ns, preloaded):
+        self.start_ns = start_ns
+        self.shown_ns = None
+        self.dissolved = False
+        self.preloaded = preloaded
+
+    def poll(self, player):
+        """Print the times once the switch has reached the LEDs."""
+        if self.start_ns is None or player.sm.pending_write:
+            return
+        now = time.monotonic_ns()
+        if self.shown_ns is None:
+            self.shown_ns = now
+        if player.after is not None:
+            # Still dissolving into it
+            self.dissolved = True
+            return
+        message = f"switched in {(self.shown_ns - self.start_ns) / 1e6:.1f} ms"
+        if self.dissolved:
+            message += f", dissolved in {(now - self.start_ns) / 1e6:.1f} ms"
+        print(message + (" (preloaded)" if self.preloaded else ""))
+        self.start_ns = None
+
+
+class IdleMeter:
+    """Sleeps until a deadline and measures the fraction of time spent idle.
+
+    Sleeps are at most max_sleep_ns, end margin_ns early (time.sleep()
+    only counts whole milliseconds and can overshoot by one), and aren't
+    taken at all if they'd be under poll_ns. Time asleep is also added to
+    telemetry, if given one.
+    """
+
+    def __init__(self, max_sleep_ns, poll_ns, margin_ns, telemetry=None):
+        self.max_sleep_ns = max_sleep_ns
+        self.poll_ns = poll_ns
+        self.margin_ns = margin_ns
+        self.telemetry = telemetry
+        self.reset()
+
+    def reset(self):
+        self.start_ns = time.monotonic_ns()
+        self.idle_ns = 0
+
+    def sleep_until(self, wake_ns):
+        now = time.monotonic_ns()
+        limit = now + self.max_sleep_ns
+        if wake_ns is None or wake_ns > limit:
+            wake_ns = limit
+        wait = wake_ns - now - self.margin_ns
+        if wait < self.poll_ns:
+            return
+        time.sleep(wait / 1e9)
+        slept = time.monotonic_ns() - now
+        self.idle_ns += slept
+        if self.telemetry is not None:
+            self.telemetry.idle_ns += slept
+
+    def report(self):
+        elapsed = time.monotonic_ns() - self.start_ns
+        if elapsed:
+            print(f"idle: {100 * self.idle_ns / elapsed:.1f}% of "
+                  f"{elapsed / 1e9:.1f} s asleep")
+
+
+class Telemetry:
+    """What the main loop has been doing since the last report.
+
+    Memory is sampled once per frame change: a rise in gc.mem_free() since
+    the last sample means the garbage collector has run in between.
+    CircuitPython doesn't count collections itself. due() is true every
+    period_ns (never, if 0).
+    """
+
+    def __init__(self, period_ns):
+        self.period_ns = period_ns
+        self.reset()
+
+    def reset(self):
+        self.start_ns = time.monotonic_ns()
+        self.loops = 0
+        self.ticks = 0
+        self.pending = 0
+        self.changes = 0
+        self.change_ns = 0
+        self.change_max_ns = 0
+        self.compiles = 0
+        self.compile_ns = 0
+        self.compile_max_ns = 0
+        self.idle_ns = 0
+        self.collections = 0
+        self.free = gc.mem_free()
+        self.free_min = self.free
+
+    def changed(self, ns):
+        """A frame change that took ns, from tick() noticing it was due."""
+        self.changes += 1
+        self.change_ns += ns
+        if ns > self.change_max_ns:
+            self.change_max_ns = ns
+        free = gc.mem_free()
+        if free > self.free:
+            self.collections += 1
+        if free < self.free_min:
+            self.free_min = free
+        self.free = free
+
+    def compiled(self, ns):
+        """Frames compiled into PIO words in ns."""
+        self.compiles += 1
+        self.compile_ns += ns
+        if ns > self.compile_max_ns:
+            self.compile_max_ns = ns
+
+    def due(self, now):
+        return self.period_ns and now - self.start_ns >= self.period_ns
+
+    def report(self):
+        """Print the counters as one line and start counting afresh.
+
+        loop and tick are per second; frame and compile are
+        count mean/max ms; gc is collections seen; free is bytes now/lowest.
+        """
+        elapsed = time.monotonic_ns() - self.start_ns
+        seconds = elapsed / 1e9 or 1
+        change_ms = self.change_ns / self.changes / 1e6 if self.changes else 0
+        compile_ms = self.compile_ns / self.compiles / 1e6 if self.compiles else 0
+        print(f"T {seconds:.1f}s loop {self.loops / seconds:.0f}/s "
+              f"tick {self.ticks / seconds:.0f}/s pending {self.pending} "
+              f"frame {self.changes} {change_ms:.2f}/{self.change_max_ns / 1e6:.2f}ms "
+              f"compile {self.compiles} {compile_ms:.2f}/{self.compile_max_ns / 1e6:.2f}ms "
+              f"gc {self.collections} free {gc.mem_free()}/{self.free_min} "
+              f"idle {100 * self.idle_ns / elapsed if elapsed else 0:.0f}%")
+        self.reset()
@@ -0,0 +1,230 @@
+"""
+Multiplex timing profiles, and compiling frames into PIO words with them.
+
+A profile is a dict with any of:
+
+    refresh_hz    times a second every layer is lit (98 by default: faster
+                  flickers less on camera and under mains lighting)
+    blank_us      dark time after each layer, so the last layer's LEDs are
+                  fully off before the next layer's anode turns on (less
+                  ghosting, but less time lit)
+    compensation  percent more on-time a layer gets per LED lit in it, to
+                  even out layers that look dimmer for sharing their anode
+                  current between more LEDs (0, the default, to turn off)
+
+The cube-wide profile lives in timing.json on CIRCUITPY; an animation can
+override any of it with a "timing" object in animations.json.
+
+The PIO program reads each layer's hold and blanking from its words, so a
+profile only changes the words frames compile to. Timing works out the
+times; the cube's Mux (lib/mux.py, the 3x3x3 cube's by default) packs them
+and the LEDs into words. With compensation on, each frame's layers share
+the same refresh time between them in proportion to
+100 + compensation * LEDs lit, worked out when the frame is compiled, so a
+refresh takes the same time whatever is lit.
+"""
+
+import array
+
+from lib.mux import PIO_FREQ, Mux
+
+KEYS = ("refresh_hz", "blank_us", "compensation")
+DEFAULTS = {"refresh_hz": 98, "blank_us": 300, "compensation": 0}
+
+MAX_COMPENSATION = 100
+# Deepest grayscale a profile has to leave room for (animfile.MAX_DEPTH)
+MAX_DEPTH = 4
+
+# LEDs lit in each possible layer of 9
+POPCOUNT = bytes(bin(i).count("1") for i in range(512))
+
+
+def popcount(bits):
+    return POPCOUNT[bits] if bits < 512 else bin(bits).count("1")
+
+
+def load_profile(path):
+    """The profile in a JSON file, {} if there isn't one.
+
+    Raises ValueError if it's there but isn't a JSON object.
+    """
+    import json
+    try:
+        with open(path, "r") as f:
+            profile = json.load(f)
+    except OSError:
+        return {}
+    if not isinstance(profile, dict):
+        raise ValueError("expected a JSON object")
+    return profile
+
+
+def merge(*profiles):
+    """Full settings from DEFAULTS overridden by each profile in turn."""
+    settings = dict(DEFAULTS)
+    for profile in profiles:
+        if profile:
+            for key in KEYS:
+                if key in profile:
+                    settings[key] = profile[key]
+    return settings
+
+
+class Timing:
+    """Compiles frames into PIO words for one timing profile and Mux.
+
+    Raises ValueError if the mux's word format can't do the settings.
+    """
+
+    def __init__(self, refresh_hz=98, blank_us=300, compensation=0, mux=None):
+        for key, value in (("refresh_hz", refresh_hz), ("blank_us", blank_us),
+                           ("compensation", compensation)):
+            if not isinstance(value, int) or value < 0:
+                raise ValueError(f"{key} must be a whole number")
+        self.mux = mux = mux or Mux(3)
+        n = mux.n
+        if not 1 <= refresh_hz <= PIO_FREQ // n:
+            raise ValueError("refresh_hz is out of range")
+        if not mux.min_blank <= blank_us <= mux.max_blank:
+            raise ValueError(f"blank_us must be {mux.min_blank} to {mux.max_blank}")
+        if compensation > MAX_COMPENSATION:
+            raise ValueError(f"compensation must be 0 to {MAX_COMPENSATION}%")
+        self.refresh = refresh_hz
+        self.blank = blank_us
+        self.compensation = compensation
+        self.on = PIO_FREQ // (n * refresh_hz) - blank_us
+        # A refresh's lit time goes furthest to a layer with all its LEDs
+        # lit when the others have none lit, and least to one with none lit
+        # when the others are all lit; the shortest bit-plane of the deepest
+        # grayscale still has to fit a word
+        leds = mux.layer_leds * compensation
+        planes = (1 << MAX_DEPTH) - 1
+        most = n * self.on * (100 + leds) // (100 * n + leds)
+        least = n * (self.on // planes) * planes * 100 // (100 * n + (n - 1) * leds)
+        with_comp = f" with compensation {compensation}" if compensation else ""
+        if most > mux.max_on:
+            raise ValueError(f"refresh_hz {refresh_hz} is too slow{with_comp}")
+        if least // planes < mux.min_on:
+            raise ValueError(f"refresh_hz {refresh_hz} is too fast for blank_us "
+                             f"{blank_us}{with_comp}")
+        # One word per layer with the LEDs in the low bits: compile_into()
+        # ORs them straight into layer_bits()
+        self.direct = mux.one_word and mux.in_order
+        self._layer_bits = {}
+
+    def settings(self):
+        return {"refresh_hz": self.refresh, "blank_us": self.blank,
+                "compensation": self.compensation}
+
+    def frame_words(self, depth=1):
+        """PIO words in a frame of the given depth."""
+        return self.mux.n * depth * self.mux.layer_words
+
+    def plane_times(self, depth):
+        """(on, blank) cycles of each bit-plane of a layer, least significant
+        first. Only the last plane blanks for the profile's time."""
+        unit = self.on // ((1 << depth) - 1)
+        return [(unit << b, self.blank if b == depth - 1 else self.mux.min_blank)
+                for b in range(depth)]
+
+    def layer_bits(self, depth):
+        """A frame's words with no LEDs lit: the anodes and timing alone."""
+        if depth not in self._layer_bits:
+            mux = self.mux
+            bits = array.array('I', bytes(4 * self.frame_words(depth)))
+            i = 0
+            for z in range(mux.n):
+                for on, blank in self.plane_times(depth):
+                    i = mux.pack(mux.layer_outputs(0, z), on, blank, bits, i)
+            self._layer_bits[depth] = bits
+        return self._layer_bits[depth]
+
+    def blank_words(self, depth):
+        """Where in a frame's words each layer's blank count is."""
+        mux = self.mux
+        return [((z + 1) * depth - 1) * mux.layer_words + mux.blank_word
+                for z in range(mux.n)]
+
+    def refresh_cycles(self, depth):
+        """PIO cycles one refresh of frames of the given depth takes."""
+        return self.mux.n * sum(self.mux.layer_cycles(on, blank)
+                                for on, blank in self.plane_times(depth))
+
+    def refresh_hz(self, depth):
+        """Refresh rate the PIO achieves for frames of the given depth."""
+        return PIO_FREQ / self.refresh_cycles(depth)
+
+    def frame_of(self, words, start, depth=1):
+        """The frame compiled at words[start] (its most significant plane)."""
+        mux = self.mux
+        frame = 0
+        i = start + (depth - 1) * mux.layer_words
+        for z in range(mux.n):
+            frame |= mux.leds_of(words, i) << (z * mux.layer_leds)
+            i += depth * mux.layer_words
+        return frame
+
+    def compile_into(self, frames, words, start, depth=1):
+        """Compile frames into an existing word array from word index `start`."""
+        if self.compensation:
+            self.compile_compensated(frames, words, start, depth)
+            return
+        mux = self.mux
+        i = start
+        if not self.direct:
+            times = self.plane_times(depth)
+            for f in range(0, len(frames), depth):
+                for z in range(mux.n):
+                    for b in range(depth):
+                        on, blank = times[b]
+                        i = mux.pack(mux.layer_outputs(frames[f + b], z), on, blank, words, i)
+            return
+        bits = self.layer_bits(depth)
+        if depth == 1 and mux.n == 3:
+            bits0, bits1, bits2 = bits
+            for frame in frames:
+                words[i] = (frame & 0x1FF) | bits0
+                words[i + 1] = ((frame >> 9) & 0x1FF) | bits1
+                words[i + 2] = ((frame >> 18) & 0x1FF) | bits2
+                i += 3
+            return
+        n2 = mux.layer_leds
+        mask = (1 << n2) - 1
+        for f in range(0, len(frames), depth):
+            for z in range(mux.n):
+                shift = z * n2
+                for b in range(depth):
+                    words[i] = ((frames[f + b] >> shift) & mask) | bits[z * depth + b]
+                    i += 1
+
+    def compile_compensated(self, frames, words, start, depth):
+        mux = self.mux
+        n = mux.n
+        n2 = mux.layer_leds
+        mask = (1 << n2) - 1
+        blanks = [blank for _, blank in self.plane_times(depth)]
+        planes = (1 << depth) - 1
+        total = n * (self.on // planes) * planes
+        comp = self.compensation
+        weights = [0] * n
+        i = start
+        for f in range(0, len(frames), depth):
+            for z in range(n):
+                shift = z * n2
+                lit = 0
+                for b in range(depth):
+                    lit += popcount((frames[f + b] >> shift) & mask) << b
+                weights[z] = 100 * planes + comp * lit
+            weight = sum(weights)
+            left = total
+            for z in range(n):
+                # The last layer gets what's left, so rounding never changes
+                # how long a refresh takes
+                on = left if z == n - 1 else total * weights[z] // weight
+                left -= on
+                held = 0
+                for b in range(depth):
+                    hold = on - held if b == depth - 1 else (on << b) // planes
+                    held += hold
+                    i = mux.pack(mux.layer_outputs(frames[f + b], z), hold, blanks[b],
+                                 words, i)
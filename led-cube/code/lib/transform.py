@@ -0,0 +1,235 @@
+"""
+Rotating, mirroring and overlaying LED cube animations on the fly.
+
+Any of the cube's 48 symmetries (24 rotations, each optionally mirrored)
+is applied with three lookups into 512-entry tables, one per layer: the
+table for layer z maps that layer's 9 LEDs to where they land in the whole
+transformed frame, so
+
+    transformed = t0[frame & 0x1FF] | t1[(frame >> 9) & 0x1FF] | t2[frame >> 18]
+
+instead of moving 27 bits one at a time.
+
+An animations.json entry can make a variant of another animation:
+
+    {"name": "spin sideways", "base": "spinning-around",
+     "transform": {"rotate": {"x": 1}, "mirror": ["y"]}, "framerate": 8}
+
+"rotate" gives quarter turns about each axis (applied x, then y, then z),
+"mirror" the axes to flip after rotating. Or overlay several animations,
+each at its own framerate:
+
+    {"name": "rainy spin", "composite": "or",
+     "layers": ["rain", "spinning-around"], "framerate": 24}
+
+"or" lights an LED if any layer does, "xor" if an odd number do, and "and"
+if all of them do, so later layers mask earlier ones.
+
+Dissolve makes the transition when the cube switches animation.
+"""
+
+import array
+import random
+
+from lib.voxel import check_params
+
+AXES = {"x": 0, "y": 1, "z": 2}
+OPS = ("or", "xor", "and")
+
+IDENTITY = ((1, 0, 0), (0, 1, 0), (0, 0, 1))
+
+
+def matmul(a, b):
+    return tuple(tuple(sum(a[i][k] * b[k][j] for k in range(3)) for j in range(3))
+                 for i in range(3))
+
+
+def quarter_turn(axis):
+    """Matrix rotating a quarter turn about axis 0, 1 or 2."""
+    i, j = [(1, 2), (2, 0), (0, 1)][axis]
+    m = [list(row) for row in IDENTITY]
+    m[i][i] = m[j][j] = 0
+    m[i][j] = -1
+    m[j][i] = 1
+    return tuple(tuple(row) for row in m)
+
+
+def mirror(axis):
+    m = [list(row) for row in IDENTITY]
+    m[axis][axis] = -1
+    return tuple(tuple(row) for row in m)
+
+
+def spec_matrix(spec):
+    """Matrix for a transform spec like {"rotate": {"x": 1}, "mirror": ["y"]}."""
+    m = IDENTITY
+    rotate = spec.get("rotate", {})
+    for name in ("x", "y", "z"):
+        for _ in range(rotate.get(name, 0) % 4):
+            m = matmul(quarter_turn(AXES[name]), m)
+    for name in spec.get("mirror", ()):
+        m = matmul(mirror(AXES[name]), m)
+    return m
+
+
+class Transform:
+    """One cube symmetry, as three 512-entry per-layer lookup tables."""
+
+    def __init__(self, matrix):
+        self.tables = []
+        for z in range(3):
+            targets = []
+            for i in range(9):
+                p = (i % 3 - 1, i // 3 - 1, z - 1)
+                x, y, z2 = (sum(matrix[r][c] * p[c] for c in range(3)) + 1 for r in range(3))
+                targets.append(1 << (x + 3 * y + 9 * z2))
+            table = array.array('I', bytes(4 * 512))
+            # Entries with top bit j are the entry without it plus LED j
+            for j in range(9):
+                step = 1 << j
+                for m in range(step, 2 * step):
+                    table[m] = table[m - step] | targets[j]
+            self.tables.append(table)
+
+    def apply(self, frame):
+        t0, t1, t2 = self.tables
+        return t0[frame & 0x1FF] | t1[(frame >> 9) & 0x1FF] | t2[frame >> 18]
+
+
+_transforms = {}
+
+
+def transform_for(spec):
+    """Cached Transform for a transform spec."""
+    matrix = spec_matrix(spec)
+    if matrix not in _transforms:
+        _transforms[matrix] = Transform(matrix)
+    return _transforms[matrix]
+
+
+class TransformSource:
+    """Frame source applying a Transform to another source's frames."""
+
+    def __init__(self, source, transform):
+        self.source = source
+        self.apply = transform.apply
+        self.num_frames = source.num_frames
+
+    def next_frame(self):
+        return self.apply(self.source.next_frame())
+
+
+class Composite:
+    """Frame source overlaying several sources, each at its own framerate.
+
+    Composite time advances by one of its own frames per next_frame(); each
+    layer moves on whenever its own next frame falls due by then.
+    """
+
+    num_frames = 0
+
+    def __init__(self, op, sources, framerates, framerate):
+        self.op = OPS.index(op)
+        self.sources = sources
+        self.periods = [1_000_000_000 // rate for rate in framerates]
+        self.due = [0] * len(sources)
+        self.frames = [0] * len(sources)
+        self.step = 1_000_000_000 // framerate
+        self.now = 0
+
+    def next_frame(self):
+        for i, source in enumerate(self.sources):
+            while self.due[i] <= self.now:
+                self.frames[i] = source.next_frame()
+                self.due[i] += self.periods[i]
+        self.now += self.step
+        # Keep the clocks small so they stay cheap machine-sized ints
+        if self.now >= 1 << 29:
+            for i in range(len(self.due)):
+                self.due[i] -= self.now
+            self.now = 0
+
+        result = self.frames[0]
+        for frame in self.frames[1:]:
+            if self.op == 0:
+                result |= frame
+            elif self.op == 1:
+                result ^= frame
+            else:
+                result &= frame
+        return result
+
+
+class Dissolve:
+    """Frame source dissolving one frame into another in random order.
+
+    The LEDs that differ between the two frames are shuffled and uncovered
+    a few at a time through a growing random bit mask, so after `steps`
+    frames only `end` is left.
+    """
+
+    def __init__(self, start, end, steps):
+        order = [i for i in range(27) if (start ^ end) >> i & 1]
+        for i in range(len(order) - 1, 0, -1):
+            j = random.randrange(i + 1)
+            order[i], order[j] = order[j], order[i]
+        self.masks = []
+        for step in range(1, steps + 1):
+            mask = 0
+            for i in order[:len(order) * step // steps]:
+                mask |= 1 << i
+            self.masks.append(mask)
+        self.start = start
+        self.end = end
+        self.num_frames = steps
+        self.pos = 0
+
+    @property
+    def done(self):
+        return self.pos == self.num_frames
+
+    def next_frame(self):
+        mask = self.masks[min(self.pos, self.num_frames - 1)]
+        if self.pos < self.num_frames:
+            self.pos += 1
+        return (self.start & ~mask) | (self.end & mask)
+
+
+def check_spec(anim, library, depth=0):
+    """Raise ValueError if a spec'd animation can't be played from library."""
+    spec = anim.spec
+    if depth > 8:
+        raise ValueError("animations refer to each other in a loop")
+    if spec is None:
+        return
+    if "generator" in spec:
+        check_params(spec["generator"], spec.get("params"))
+        return
+    if "base" in spec:
+        names = [spec["base"]]
+        transform = spec.get("transform", {})
+        if any(a not in AXES for a in transform.get("rotate", {})) or \
+                any(a not in AXES for a in transform.get("mirror", ())):
+            raise ValueError("transform axes must be x, y or z")
+    elif "composite" in spec:
+        if spec["composite"] not in OPS:
+            raise ValueError(f"composite must be one of {', '.join(OPS)}")
+        names = spec.get("layers", [])
+        if not names:
+            raise ValueError("composite has no layers")
+    else:
+        raise ValueError("unknown kind of animation")
+    for name in names:
+        if name not in library:
+            raise ValueError(f"no animation called {name!r}")
+        base = library[name]
+        if base.depth != 1 and ("composite" in spec or base.streamed):
+            raise ValueError("grayscale animations can only be transformed, "
+                             "and only when they fit in memory")
+        # Only a variant of the grayscale animation itself is played in
+        # grayscale; anything built on that variant would get its bit-planes
+        inner = base.spec.get("base") if base.spec is not None else None
+        if inner is not None and inner in library and library[inner].depth != 1:
+            raise ValueError(f"{name!r} is a variant of grayscale {inner!r}, "
+                             "so it can't be transformed again or layered")
+        check_spec(base, library, depth + 1)
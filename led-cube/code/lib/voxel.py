@@ -0,0 +1,222 @@
+"""
+Bit-parallel voxel operations and procedural animations for the LED cube.
+
+A frame is a 27-bit int with LED (x, y, z) at bit x + 3 * y + 9 * z, so
+z is the layer. Every operation here works on all 27 LEDs at once with a
+few integer operations: shifting a frame moves every lit LED one step
+along an axis, and neighbour counts are kept as bit-sliced numbers (one
+27-bit plane per binary digit) added together with bitwise adders.
+
+Procedural animations are generator functions that yield frames forever.
+animations.json entries can use one instead of a frame list:
+
+    {"name": "rain", "generator": "rain", "params": {"density": 0.3},
+     "framerate": 8}
+"""
+
+import random
+
+FULL = 0x7FFFFFF
+
+# LEDs on each face of the cube
+X0 = 0x1249249
+X2 = 0x4924924
+Y0 = 0x01C0E07
+Y2 = 0x70381C0
+Z0 = 0x00001FF
+Z2 = 0x7FC0000
+
+
+def voxel(x, y, z):
+    return 1 << (x + 3 * y + 9 * z)
+
+
+def shift(frame, axis, step):
+    """Move every lit LED one place along axis 0, 1 or 2 (x, y, z).
+
+    LEDs pushed off the face of the cube are dropped.
+    """
+    if axis == 0:
+        return (frame << 1) & ~X0 & FULL if step > 0 else (frame >> 1) & ~X2
+    if axis == 1:
+        return (frame << 3) & ~Y0 & FULL if step > 0 else (frame >> 3) & ~Y2
+    return (frame << 9) & FULL if step > 0 else frame >> 9
+
+
+def add(a, b):
+    """Add two bit-sliced numbers (lists of planes, least significant first)."""
+    if len(a) < len(b):
+        a, b = b, a
+    total = []
+    carry = 0
+    for i, x in enumerate(a):
+        y = b[i] if i < len(b) else 0
+        total.append(x ^ y ^ carry)
+        carry = (x & y) | (carry & (x ^ y))
+    if carry:
+        total.append(carry)
+    return total
+
+
+def box_sum(planes, axis):
+    """Sum each LED's bit-sliced value with its two neighbours along an axis."""
+    return add(add(planes, [shift(p, axis, 1) for p in planes]),
+               [shift(p, axis, -1) for p in planes])
+
+
+def count_box(frame):
+    """Bit-sliced count of lit LEDs in each LED's 3x3x3 box, itself included."""
+    return box_sum(box_sum(box_sum([frame], 0), 1), 2)
+
+
+def equals(planes, n):
+    """Frame of the LEDs whose bit-sliced value is exactly n."""
+    match = FULL
+    for i, p in enumerate(planes):
+        match &= p if n >> i & 1 else ~p
+    return match & FULL if n < 1 << len(planes) else 0
+
+
+def any_of(planes, values):
+    match = 0
+    for n in values:
+        match |= equals(planes, n)
+    return match
+
+
+def random_frame(density):
+    frame = 0
+    for i in range(27):
+        if random.random() < density:
+            frame |= 1 << i
+    return frame
+
+
+################################################
+# Procedural animations
+################################################
+
+def rain(density=0.3):
+    """Drops appear on the top layer and fall one layer per frame."""
+    frame = 0
+    while True:
+        frame = shift(frame, 2, -1) | (random_frame(density) & Z2)
+        yield frame
+
+
+def life(birth=(5, 6, 7), survive=(4, 5, 6), density=0.4, generations=40):
+    """3D Game of Life, reseeded when it dies out, stalls or runs too long."""
+    frame = random_frame(density)
+    previous = None
+    age = 0
+    while True:
+        yield frame
+        # A lit LED's box count includes itself, so it has one neighbour fewer
+        counts = count_box(frame)
+        following = ((any_of(counts, birth) & ~frame)
+                     | (any_of(counts, [n + 1 for n in survive]) & frame))
+        age += 1
+        if not following or following in (frame, previous) or age >= generations:
+            following = random_frame(density)
+            age = 0
+        previous = frame
+        frame = following
+
+
+def snake(length=5):
+    """A snake wandering the cube without crossing itself."""
+    body = [(1, 1, 1)]
+    while True:
+        x, y, z = body[-1]
+        moves = []
+        for axis in range(3):
+            for step in (-1, 1):
+                pos = [x, y, z]
+                pos[axis] += step
+                pos = tuple(pos)
+                if 0 <= pos[axis] <= 2 and pos not in body:
+                    moves.append(pos)
+        if not moves:
+            body = body[-1:]
+            continue
+        body.append(moves[random.randrange(len(moves))])
+        if len(body) > length:
+            body.pop(0)
+        frame = 0
+        for pos in body:
+            frame |= voxel(*pos)
+        yield frame
+
+
+def sweep(axis=2, bounce=True):
+    """A plane of LEDs sweeping through the cube along an axis."""
+    planes = [(X0, 0x2492492, X2), (Y0, 0x0E07038, Y2), (Z0, 0x003FE00, Z2)][axis]
+    order = (0, 1, 2, 1) if bounce else (0, 1, 2)
+    while True:
+        for i in order:
+            yield planes[i]
+
+
+GENERATORS = {
+    "rain": rain,
+    "life": life,
+    "snake": snake,
+    "sweep": sweep,
+}
+
+# The params each generator takes: (type, lowest, highest), where a list is
+# a list of whole numbers in that range
+PARAMS = {
+    "rain": {"density": (float, 0, 1)},
+    "life": {"birth": (list, 0, 26), "survive": (list, 0, 26),
+             "density": (float, 0, 1), "generations": (int, 1, None)},
+    "snake": {"length": (int, 1, 27)},
+    "sweep": {"axis": (int, 0, 2), "bounce": (bool, None, None)},
+}
+
+
+def _in_range(value, low, high):
+    return (low is None or value >= low) and (high is None or value <= high)
+
+
+def check_params(name, params):
+    """Raise ValueError unless generator `name` takes these params."""
+    if name not in GENERATORS:
+        raise ValueError(f"unknown generator {name!r}")
+    if params is None:
+        return
+    if not isinstance(params, dict):
+        raise ValueError("generator params must be an object")
+    takes = PARAMS[name]
+    for key, value in params.items():
+        if key not in takes:
+            raise ValueError(f"{name} has no param {key!r} (it takes {', '.join(takes)})")
+        kind, low, high = takes[key]
+        if kind is bool:
+            ok = isinstance(value, bool)
+        elif kind is list:
+            ok = isinstance(value, list) and all(
+                isinstance(v, int) and not isinstance(v, bool) and _in_range(v, low, high)
+                for v in value)
+        else:
+            ok = isinstance(value, (int, float) if kind is float else int) \
+                and not isinstance(value, bool) and _in_range(value, low, high)
+        if not ok:
+            what = {bool: "true or false", list: "a list of whole numbers",
+                    int: "a whole number", float: "a number"}[kind]
+            if low is not None:
+                what += f" from {low}" + (f" to {high}" if high is not None else " up")
+            raise ValueError(f"{name} param {key!r} must be {what}")
+
+
+class Procedural:
+    """Frame source for AnimPlayer that runs a named generator."""
+
+    num_frames = 0
+
+    def __init__(self, name, params=None):
+        check_params(name, params)
+        self.frames = GENERATORS[name](**(params or {}))
+
+    def next_frame(self):
+        return next(self.frames)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Benchmark code.py on the simulated cube: one simulate.py run per scenario,
+each in its own Python so nothing carries over, and a table of what the
+LEDs showed. Runs are deterministic, so a change in any column is a change
+in code.py (or lib/), not noise. Scenarios in CHECKS also check what the
+cube printed, and say what went wrong after the table row.
+
+    python3 sim/bench.py
+    python3 sim/bench.py --seconds 30 --only paced grayscale
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+SIM = Path(__file__).resolve().parent
+CODE = SIM.parent / 'code'
+sys.path.insert(0, str(CODE))
+
+from lib.livestream import FRAME, FRAME_SIZE, pack_into  # noqa: E402
+
+FULL = (1 << 27) - 1
+
+ANIMATIONS = {
+    # Too fast to pace in hardware, so Python swaps frames on time
+    'fast.json': [
+        {'name': 'fast', 'framerate': 40, 'frames': [1 << (3 * i) for i in range(9)]},
+    ],
+    'grayscale.json': [
+        {'name': 'glow', 'depth': 4, 'framerate': 10,
+         'frames': [[(i + f) % 16 for i in range(27)] for f in range(6)]},
+    ],
+    'procedural.json': [
+        {'name': 'sweep', 'generator': 'sweep', 'params': {'axis': 2}, 'framerate': 12},
+    ],
+    'transformed.json': [
+        {'name': 'blinking spin', 'composite': 'xor',
+         'layers': ['spin sideways', 'blink'], 'framerate': 24},
+        {'name': 'spinning-around', 'framerate': 8,
+         'frames': [0o777, 0o777000, 0o777000000, 0o444222111]},
+        {'name': 'spin sideways', 'base': 'spinning-around',
+         'transform': {'rotate': {'x': 1}, 'mirror': ['y']}, 'framerate': 8},
+        {'name': 'blink', 'framerate': 3, 'frames': [FULL, 0]},
+    ],
+}
+
+# A live stream: frames every 50 ms from 3 s, the first one arriving in two
+# pieces 30 ms apart, as USB can deliver it
+LIVE_FRAMES = 21
+
+
+def live_stream():
+    sends = []
+    packet = bytearray(FRAME_SIZE)
+    for seq in range(LIVE_FRAMES):
+        at_ms = 3000 + 50 * seq
+        pack_into(FRAME, packet, seq, 1 << (seq % 27), at_ms * 1000)
+        if seq == 0:
+            sends += [f'--send={at_ms}:{packet[:6].hex()}',
+                      f'--send={at_ms + 30}:{packet[6:].hex()}']
+        else:
+            sends.append(f'--send={at_ms}:{packet.hex()}')
+    return sends
+
+
+def check_live(report):
+    """The stream runs once, start to end, and every frame reaches the LEDs."""
+    events = [line for line in report['console'] if line.startswith('live stream')]
+    expected = ['live stream started',
+                f'live stream ended: {LIVE_FRAMES} frames shown, 0 lost, 0 coalesced']
+    if events != expected:
+        return f'printed {events}, not {expected}'
+    return None
+
+
+# name: (simulate.py arguments, framerate to measure jitter against)
+SCENARIOS = {
+    'paced': ([], 8),
+    'python-paced': (['--animations', '{tmp}/fast.json'], 40),
+    'grayscale': (['--animations', '{tmp}/grayscale.json'], 10),
+    'procedural': (['--animations', '{tmp}/procedural.json'], 12),
+    'composite': (['--animations', '{tmp}/transformed.json'], None),
+    'buttons': ([f'--press={ms}' for ms in range(2000, 60000, 2000)], None),
+    'timing': (['--timing', '{"refresh_hz": 200, "blank_us": 200, "compensation": 10}'], 8),
+    'library': (['--library', '{tmp}/library'] +
+                [f'--press={ms}' for ms in range(2000, 60000, 2000)], None),
+    'live': (live_stream(), None),
+}
+
+# name: check(report), returning what's wrong or None
+CHECKS = {
+    'live': check_live,
+}
+
+
+def simulate(args, seconds, fps):
+    command = [sys.executable, str(SIM / 'simulate.py'), '--json', '--quiet',
+               '--seconds', str(seconds)] + args
+    if fps:
+        command += ['--fps', str(fps)]
+    # Same hash order every run, so sets and dicts iterate the same way too
+    env = dict(os.environ, PYTHONHASHSEED='0')
+    result = subprocess.run(command, capture_output=True, text=True, env=env)
+    if not result.stdout:
+        raise SystemExit(result.stderr)
+    return json.loads(result.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=10, help='virtual seconds per scenario')
+    parser.add_argument('--only', nargs='+', choices=SCENARIOS, help='scenarios to run')
+    parser.add_argument('--json', action='store_true', help='print the reports as JSON')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, animations in ANIMATIONS.items():
+            (Path(tmp) / name).write_text(json.dumps(animations))
+        library = Path(tmp) / 'library'
+        library.mkdir()
+        for name in ('animations.json', 'fast.json', 'grayscale.json'):
+            source = CODE / name if name == 'animations.json' else Path(tmp) / name
+            (library / name).write_text(source.read_text())
+
+        reports = {}
+        if not args.json:
+            print(f"{'scenario':<13} {'refresh Hz':>13} {'torn':>4} {'stalls':>6} "
+                  f"{'frames':>6} {'jitter ms':>11} {'skipped':>7} {'host s':>6}")
+        for name in args.only or SCENARIOS:
+            scenario, fps = SCENARIOS[name]
+            report = simulate([a.replace('{tmp}', tmp) for a in scenario], args.seconds, fps)
+            reports[name] = report
+            if name in CHECKS and not report['error']:
+                report['error'] = CHECKS[name](report)
+            if args.json:
+                continue
+            hz = report['refresh_hz'] or {'mean': 0, 'min': 0}
+            jitter = report['jitter_ms']
+            jitter = f"{jitter['mean']:5.2f}/{jitter['max']:5.2f}" if jitter and fps else 'n/a'
+            print(f"{name:<13} {hz['mean']:6.1f}/{hz['min']:6.1f} {report['torn']:4} "
+                  f"{report['stalls']:6} {report['frame_changes']:6} {jitter:>11} "
+                  f"{report['skipped_frames'] if fps else 'n/a':>7} "
+                  f"{report['host_seconds']:6.1f}"
+                  + (f"  {report['error']}" if report['error'] else ''))
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        print('refresh Hz: mean/lowest; jitter: mean/worst error of a frame change '
+              'against the framerate')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+"""Stand-in for adafruit_pioasm, assembling with the simulator's pio module."""
+
+import pio
+
+
+def assemble(program_text):
+    return pio.assemble(program_text)
+
+
+class Program:
+    def __init__(self, text_program, *, build_debuginfo=False):
+        self.assembled, (count, enable, wrap_target, wrap) = pio.parse(text_program)
+        self.pio_kwargs = {}
+        if count:
+            self.pio_kwargs["sideset_pin_count"] = count
+            self.pio_kwargs["sideset_enable"] = enable
+        if wrap_target is not None:
+            self.pio_kwargs["wrap_target"] = wrap_target
+        if wrap is not None:
+            self.pio_kwargs["wrap"] = wrap
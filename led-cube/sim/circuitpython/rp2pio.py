@@ -0,0 +1,154 @@
+"""
+Stand-in for CircuitPython's rp2pio: a state machine running on the
+simulator's PIO emulator, fed by a model of background_write()'s DMA.
+
+background_write(once, loop) plays `once` and then `loop` over and over.
+Called again while that's playing, the new write is pending until the
+current buffer (once or a pass of loop) has been read to its end, then
+replaces it; called again while one is already pending, it waits for that
+one to start. DMA reads words into the 4-word TX FIFO as it empties, from
+the buffer as it is at that moment, and tags each with
+(write number, "once" or "loop", index) for the pin trace.
+"""
+
+import array
+
+import hardware
+import pio
+
+
+def words_of(buf):
+    if isinstance(buf, array.array) and buf.itemsize == 4:
+        return buf
+    return memoryview(buf).cast("B").cast("I")
+
+
+class StateMachine:
+    def __init__(self, program, frequency, *, first_out_pin=None, out_pin_count=1,
+                 first_set_pin=None, set_pin_count=1, first_sideset_pin=None,
+                 sideset_pin_count=1, sideset_enable=False, out_shift_right=True,
+                 auto_pull=False, pull_threshold=32, wrap_target=0, wrap=-1, **kwargs):
+        self.frequency = frequency
+        self.first_out_pin = first_out_pin.number if first_out_pin else 0
+        self.out_pin_count = out_pin_count if first_out_pin else 0
+        self.core = pio.Core(
+            program, self.feed,
+            first_out_pin=self.first_out_pin, out_pin_count=self.out_pin_count,
+            first_set_pin=first_set_pin.number if first_set_pin else 0,
+            set_pin_count=set_pin_count if first_set_pin else 0,
+            first_sideset_pin=first_sideset_pin.number if first_sideset_pin else 0,
+            sideset_pin_count=sideset_pin_count if first_sideset_pin else 0,
+            sideset_enable=sideset_enable, out_shift_right=out_shift_right,
+            auto_pull=auto_pull, pull_threshold=pull_threshold,
+            wrap_target=wrap_target, wrap=None if wrap == -1 else wrap)
+        self.start_ns = hardware.clock.now
+        # What DMA is reading: [words, write number, part, next index]
+        self.current = None
+        self.loop = None
+        self.next_write = None
+        self.writes = 0
+        self.swaps = 0
+        self.swap_ns = []
+        self.running = True
+        hardware.state_machines.append(self)
+        hardware.clock.listeners.append(self.sync)
+
+    # Time
+
+    def cycle_at(self, ns):
+        return (ns - self.start_ns) * self.frequency // 1_000_000_000
+
+    def ns_at(self, cycle):
+        return self.start_ns + -(-cycle * 1_000_000_000 // self.frequency)
+
+    def sync(self, now_ns):
+        if self.running:
+            self.core.run(self.cycle_at(now_ns))
+
+    def wait_until(self, done):
+        """Let the PIO run on, moving the clock with it, until done()."""
+        clock = hardware.clock
+        self.sync(clock.now)
+        while not done():
+            self.core.run(self.core.cycle + self.frequency, stop=done)
+            clock.advance_to(self.ns_at(self.core.cycle))
+
+    # DMA
+
+    def feed(self):
+        while self.current is not None:
+            words, write, part, i = self.current
+            if i < len(words):
+                self.current[3] = i + 1
+                return words[i], (write, part, i)
+            if self.next_write is not None:
+                self.start(*self.next_write)
+                self.next_write = None
+                self.swaps += 1
+                self.swap_ns.append(self.ns_at(self.core.cycle))
+            elif self.loop is not None and len(self.loop[0]):
+                self.current = [self.loop[0], self.loop[1], "loop", 0]
+            else:
+                self.current = None
+        return None
+
+    def start(self, once, loop, write):
+        self.loop = (loop, write) if loop is not None else None
+        if once is not None and len(once):
+            self.current = [once, write, "once", 0]
+        elif loop is not None:
+            self.current = [loop, write, "loop", 0]
+        else:
+            self.current = None
+
+    def background_write(self, once=None, *, loop=None, swap=False):
+        self.sync(hardware.clock.now)
+        if self.next_write is not None:
+            self.wait_until(lambda: self.next_write is None)
+        self.writes += 1
+        once = words_of(once) if once is not None else None
+        loop = words_of(loop) if loop is not None else None
+        if self.current is None:
+            self.start(once, loop, self.writes)
+            self.core.refill()
+        else:
+            self.next_write = (once, loop, self.writes)
+
+    def write(self, buffer, *, start=0, end=None, swap=False):
+        self.background_write(once=memoryview(words_of(buffer))[start:end])
+        self.wait_until(lambda: self.current is None and not self.core.fifo)
+
+    def stop_background_write(self):
+        self.sync(hardware.clock.now)
+        self.current = None
+        self.loop = None
+        self.next_write = None
+
+    @property
+    def pending_write(self):
+        self.sync(hardware.clock.now)
+        return self.next_write is not None
+
+    @property
+    def pending(self):
+        return self.pending_write
+
+    @property
+    def writing(self):
+        return self.current is not None
+
+    def clear_txstall(self):
+        pass
+
+    def restart(self):
+        pass
+
+    def deinit(self):
+        self.stop_background_write()
+        self.running = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.deinit()
@@ -0,0 +1,55 @@
+"""Stand-in for CircuitPython's storage: the simulated drive is read-only to
+code.py, as CIRCUITPY is while the computer has it, unless boot.py remounts
+it. Writes to it then raise OSError 30 (EROFS), as they do on a pico."""
+
+import builtins
+import contextlib
+import errno
+import os
+
+readonly = True
+
+
+def remount(mount_path, readonly=False, *, disable_concurrent_write_protection=False):
+    globals()["readonly"] = readonly
+
+
+def _check(drive, *paths):
+    if not readonly:
+        return
+    for path in paths:
+        if isinstance(path, int):
+            continue
+        full = os.path.abspath(os.fsdecode(path))
+        if full == drive or full.startswith(drive + os.sep):
+            raise OSError(errno.EROFS, "Read-only filesystem")
+
+
+@contextlib.contextmanager
+def mounted(drive):
+    """Make writes under drive follow readonly while the block runs."""
+    drive = os.path.abspath(drive)
+    real = {name: getattr(os, name)
+            for name in ("mkdir", "rmdir", "remove", "unlink", "rename", "replace")}
+    real_open = builtins.open
+
+    def guard(name, count):
+        def call(*args, **kwargs):
+            _check(drive, *args[:count])
+            return real[name](*args, **kwargs)
+        return call
+
+    def open_(file, mode="r", *args, **kwargs):
+        if any(c in mode for c in "wax+"):
+            _check(drive, file)
+        return real_open(file, mode, *args, **kwargs)
+
+    for name in real:
+        setattr(os, name, guard(name, 2 if name in ("rename", "replace") else 1))
+    builtins.open = open_
+    try:
+        yield
+    finally:
+        for name, function in real.items():
+            setattr(os, name, function)
+        builtins.open = real_open
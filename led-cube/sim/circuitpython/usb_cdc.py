@@ -0,0 +1,61 @@
+"""Stand-in for CircuitPython's usb_cdc: the data port gets the bytes
+scripted for the run (simulate.py --send), and what the cube writes to it
+is kept in `written`; the console port is idle."""
+
+import hardware
+
+console = None
+data = None
+
+
+class Serial:
+    def __init__(self, scripted=False):
+        self.timeout = 1
+        self.write_timeout = None
+        self.connected = True
+        self.scripted = scripted
+        self.written = bytearray()
+
+    @property
+    def in_waiting(self):
+        return hardware.script.data_available() if self.scripted else 0
+
+    @property
+    def out_waiting(self):
+        return 0
+
+    def read(self, size=1):
+        return hardware.script.read_data(size) if self.scripted else b""
+
+    def readinto(self, buf):
+        data = self.read(len(buf))
+        if not data:
+            return None
+        buf[:len(data)] = data
+        return len(data)
+
+    def readline(self, size=-1):
+        return b""
+
+    def write(self, buf):
+        self.written += buf
+        return len(buf)
+
+    def reset_input_buffer(self):
+        pass
+
+    def reset_output_buffer(self):
+        pass
+
+    def flush(self):
+        pass
+
+
+def enable(*, console=True, data=False):
+    globals()["console"] = Serial() if console else None
+    globals()["data"] = Serial(scripted=True) if data else None
+    return True
+
+
+def disable():
+    enable(console=False, data=False)
@@ -0,0 +1,68 @@
+"""
+The simulated cube's shared state: a virtual clock, and the button presses,
+serial console input and data port bytes scripted for a run.
+
+The clock, the button and the console are the ones every Pico project's
+simulator has, from pico-sim/picosim.py, as are the stand-ins for board,
+digitalio, keypad and supervisor; the cube's own stand-ins in
+circuitpython/ work from these too. Nothing takes real time: the clock only
+moves when code.py sleeps, or by CALL_NS for each call into a built-in
+module (mostly reading the clock), standing in for the Python it runs
+between calls. So a run gives the same results every time, however fast
+or busy the computer is.
+"""
+
+import sys
+from pathlib import Path
+
+PICO_SIM = Path(__file__).resolve().parent.parent.parent / 'pico-sim'
+sys.path.insert(0, str(PICO_SIM))
+
+import picosim  # noqa: E402
+from picosim import Clock, SimulationDone  # noqa: E402, F401
+
+# Clock advance per call into a built-in module, by default
+CALL_NS = 20_000
+# What gc.mem_free() says: about what a Pico has free after loading
+MEM_FREE = 150_000
+
+clock = None
+script = None
+state_machines = []
+
+
+class Script(picosim.Script):
+    """What happens to the cube from outside during a run.
+
+    presses maps a pin name ("GP16") to (press_ms, release_ms) pairs;
+    typed is (at_ms, text) pairs typed on the serial console; sent is
+    (at_ms, bytes) pairs arriving on the usb_cdc data port.
+    """
+
+    def __init__(self, presses=None, typed=(), sent=()):
+        super().__init__({pin_name: [(start * 1_000_000, end * 1_000_000, 0)
+                                     for start, end in pin_presses]
+                          for pin_name, pin_presses in (presses or {}).items()}, typed)
+        self.sent = sorted(sent)
+        self.data = b''
+
+    def data_available(self):
+        now_ms = clock.now // 1_000_000
+        while self.sent and self.sent[0][0] <= now_ms:
+            self.data += self.sent.pop(0)[1]
+        return len(self.data)
+
+    def read_data(self, n):
+        """Up to n bytes from the data port, without waiting."""
+        self.data_available()
+        data, self.data = self.data[:n], self.data[n:]
+        return data
+
+
+def install(new_clock, new_script):
+    """Make time, gc, random and sys.stdin behave as they do on the cube."""
+    global clock, script
+    clock = new_clock
+    script = new_script
+    state_machines.clear()
+    picosim.install(clock, script, MEM_FREE)
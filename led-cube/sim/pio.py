@@ -0,0 +1,326 @@
+"""
+A small RP2040 PIO assembler and emulator, enough for the cube's programs.
+
+assemble() turns pioasm text into 16-bit instruction words, the same as
+adafruit_pioasm.assemble(). Core runs those words cycle-accurately: jmp,
+out, pull, mov, set and nop (mov y, y), with side-set, delays, wrap and
+autopull. wait, irq, in and push aren't needed by the cube and raise
+NotImplementedError. Counted self-loops (jmp x-- to itself) are skipped
+over in one step, so a second of a 1 MHz state machine is a few thousand
+instructions of Python rather than a million.
+"""
+
+import array
+from collections import deque
+
+JMP, WAIT, IN, OUT, PUSH_PULL, MOV, IRQ, SET = range(8)
+CONDITIONS = ("", "!x", "x--", "!y", "y--", "x!=y", "pin", "!osre")
+OUT_DESTINATIONS = ("pins", "x", "y", "null", "pindirs", "pc", "isr", "exec")
+MOV_DESTINATIONS = ("pins", "x", "y", None, "exec", "pc", "isr", "osr")
+MOV_SOURCES = ("pins", "x", "y", "null", None, "status", "isr", "osr")
+MOV_OPS = {"!": 1, "~": 1, "::": 2}
+SET_DESTINATIONS = ("pins", "x", "y", None, "pindirs")
+MASK32 = 0xFFFFFFFF
+
+TX_FIFO_DEPTH = 4
+
+
+def assemble(text):
+    """Assemble pioasm text into an array of 16-bit instructions.
+
+    Like adafruit_pioasm.assemble(), only the instructions come back: the
+    state machine is told about .wrap and .side_set separately.
+    """
+    return parse(text)[0]
+
+
+def parse(text):
+    """Instructions, and (sideset_count, sideset_enable, wrap_target, wrap)."""
+    lines = []
+    labels = {}
+    sideset_count = 0
+    sideset_enable = False
+    wrap_target = None
+    wrap = None
+    for raw in text.splitlines():
+        line = raw.split(";", 1)[0].strip()
+        if not line or line.startswith(".program"):
+            continue
+        if line.startswith(".side_set"):
+            words = line.split()
+            sideset_count = int(words[1])
+            sideset_enable = "opt" in words[2:]
+        elif line == ".wrap_target":
+            wrap_target = len(lines)
+        elif line == ".wrap":
+            wrap = len(lines) - 1
+        elif line.startswith("."):
+            raise SyntaxError(f"directive not supported: {line}")
+        elif line.endswith(":"):
+            labels[line[:-1].replace("public ", "")] = len(lines)
+        else:
+            lines.append(line)
+
+    delay_bits = 5 - sideset_count - sideset_enable
+    program = array.array('H')
+    for line in lines:
+        words = line.replace(",", " ").split()
+        delay = 0
+        if words[-1].startswith("[") and words[-1].endswith("]"):
+            delay = int(words.pop()[1:-1], 0)
+            if delay >= 1 << delay_bits:
+                raise SyntaxError(f"delay too long: {line}")
+        if len(words) > 2 and words[-2] == "side":
+            side = int(words.pop(), 0)
+            words.pop()
+            if side >= 1 << sideset_count:
+                raise SyntaxError(f"side-set value too large: {line}")
+            delay |= side << delay_bits
+            if sideset_enable:
+                delay |= 0x10
+        elif sideset_count and not sideset_enable:
+            raise SyntaxError(f"side-set is required: {line}")
+        program.append(encode(words, labels, line) | (delay << 8))
+    return program, (sideset_count, sideset_enable, wrap_target, wrap)
+
+
+def encode(words, labels, line):
+    op = words[0]
+    if op == "nop":
+        return (MOV << 13) | (2 << 5) | 2
+    if op == "jmp":
+        target = words[-1]
+        address = labels[target] if target in labels else int(target, 0)
+        condition = CONDITIONS.index(words[1]) if len(words) == 3 else 0
+        return (JMP << 13) | (condition << 5) | address
+    if op == "out":
+        count = int(words[2], 0)
+        return (OUT << 13) | (OUT_DESTINATIONS.index(words[1]) << 5) | (count & 31)
+    if op in ("pull", "push"):
+        flags = set(words[1:])
+        bits = 0x80 if op == "pull" else 0
+        if "ifempty" in flags or "iffull" in flags:
+            bits |= 0x40
+        if "noblock" not in flags:
+            bits |= 0x20
+        return (PUSH_PULL << 13) | bits
+    if op == "mov":
+        source = words[2]
+        operation = 0
+        for prefix, value in MOV_OPS.items():
+            if source.startswith(prefix):
+                operation = value
+                source = source[len(prefix):]
+        return (MOV << 13) | (MOV_DESTINATIONS.index(words[1]) << 5) \
+            | (operation << 3) | MOV_SOURCES.index(source)
+    if op == "set":
+        return (SET << 13) | (SET_DESTINATIONS.index(words[1]) << 5) | (int(words[2], 0) & 31)
+    raise SyntaxError(f"instruction not supported: {line}")
+
+
+class Core:
+    """One state machine running a program against a TX FIFO.
+
+    feed() is called whenever the FIFO has room and should return the next
+    (word, tag) to go in, or None if there's nothing to send; tags are
+    passed through to the pin trace so every change of the pins can be
+    traced back to the word that caused it. `trace` is a list of
+    (cycle, gpio, tag) for every change of the GPIO outputs; `stalls`
+    counts the times it waited on an empty FIFO, for `stall_cycles` in all.
+    """
+
+    def __init__(self, program, feed, first_out_pin=0, out_pin_count=0,
+                 first_set_pin=0, set_pin_count=0, first_sideset_pin=0,
+                 sideset_pin_count=0, sideset_enable=False, out_shift_right=True,
+                 auto_pull=False, pull_threshold=32, wrap_target=0, wrap=None):
+        self.program = list(program)
+        self.feed = feed
+        self.out_pins = (first_out_pin, out_pin_count)
+        self.set_pins = (first_set_pin, set_pin_count)
+        self.side_pins = (first_sideset_pin, sideset_pin_count)
+        self.sideset_enable = sideset_enable
+        self.delay_bits = 5 - sideset_pin_count - sideset_enable
+        self.shift_right = out_shift_right
+        self.auto_pull = auto_pull
+        self.threshold = pull_threshold or 32
+        self.wrap_target = wrap_target
+        self.wrap = len(self.program) - 1 if wrap is None else wrap
+        self.fifo = deque()
+        self.pc = 0
+        self.x = 0
+        self.y = 0
+        self.osr = 0
+        self.osr_count = 32
+        self.osr_tag = None
+        self.cycle = 0
+        self.gpio = 0
+        self.trace = [(0, 0, None)]
+        self.stalled = False
+        self.stalls = 0
+        self.stall_cycles = 0
+        self.pulls = 0
+
+    def refill(self):
+        while len(self.fifo) < TX_FIFO_DEPTH:
+            item = self.feed()
+            if item is None:
+                return
+            self.fifo.append(item)
+
+    def write_pins(self, pins, value, tag):
+        base, count = pins
+        if not count:
+            return
+        mask = ((1 << count) - 1) << base
+        gpio = (self.gpio & ~mask) | ((value << base) & mask)
+        if gpio != self.gpio:
+            self.gpio = gpio
+            self.trace.append((self.cycle, gpio, tag))
+
+    def pull(self):
+        """Move a word from the FIFO to the OSR; False if there isn't one."""
+        self.refill()
+        if not self.fifo:
+            return False
+        self.osr, self.osr_tag = self.fifo.popleft()
+        self.osr_count = 0
+        self.pulls += 1
+        self.refill()
+        return True
+
+    def run(self, until_cycle, stop=None):
+        """Run until until_cycle, or until stop() is true after a pull."""
+        program = self.program
+        while self.cycle < until_cycle:
+            instruction = program[self.pc]
+            op = instruction >> 13
+            delay_side = (instruction >> 8) & 0x1F
+            arg = instruction & 0xFF
+            pulls = self.pulls
+            delay = delay_side & ((1 << self.delay_bits) - 1)
+
+            # A counted loop on itself: run all of it that fits at once
+            if op == JMP and (arg & 31) == self.pc and not self.side_pins[1]:
+                condition = arg >> 5
+                if condition in (2, 4):
+                    count = self.x if condition == 2 else self.y
+                    n = min(count, (until_cycle - self.cycle) // (delay + 1))
+                    if n:
+                        if condition == 2:
+                            self.x -= n
+                        else:
+                            self.y -= n
+                        self.cycle += n * (delay + 1)
+                        continue
+
+            if not self.execute(op, arg):
+                # Stalled on an empty FIFO: nothing happens until it's fed
+                # (not counting the wait for the very first word)
+                if self.pulls:
+                    if not self.stalled:
+                        self.stalls += 1
+                    self.stall_cycles += until_cycle - self.cycle
+                self.stalled = True
+                self.cycle = until_cycle
+                return
+            self.stalled = False
+            if self.side_pins[1] and (not self.sideset_enable or delay_side & 0x10):
+                self.write_pins(self.side_pins, delay_side >> self.delay_bits & (
+                    (1 << self.side_pins[1]) - 1), self.osr_tag)
+            self.cycle += 1 + delay
+            if stop is not None and self.pulls != pulls and stop():
+                return
+
+    def execute(self, op, arg):
+        """Carry out one instruction; False if it stalls."""
+        pc = self.pc
+        jump = None
+        if op == JMP:
+            condition = arg >> 5
+            x, y = self.x, self.y
+            if condition == 2:
+                self.x = (x - 1) & MASK32
+            elif condition == 4:
+                self.y = (y - 1) & MASK32
+            if (condition == 0 or (condition == 1 and x == 0) or (condition == 2 and x)
+                    or (condition == 3 and y == 0) or (condition == 4 and y)
+                    or (condition == 5 and x != y)
+                    or (condition == 7 and self.osr_count < self.threshold)):
+                jump = arg & 31
+        elif op == OUT:
+            if self.auto_pull and self.osr_count >= self.threshold and not self.pull():
+                return False
+            count = arg & 31 or 32
+            mask = (1 << count) - 1
+            if self.shift_right:
+                data = self.osr & mask
+                self.osr = self.osr >> count
+            else:
+                data = self.osr >> (32 - count)
+                self.osr = (self.osr << count) & MASK32
+            self.osr_count = min(32, self.osr_count + count)
+            destination = arg >> 5
+            if destination == 0:
+                self.write_pins(self.out_pins, data, self.osr_tag)
+            elif destination == 1:
+                self.x = data
+            elif destination == 2:
+                self.y = data
+            elif destination == 5:
+                jump = data & 31
+            elif destination not in (3, 4):
+                raise NotImplementedError(f"out {OUT_DESTINATIONS[destination]}")
+        elif op == PUSH_PULL:
+            if not arg & 0x80:
+                raise NotImplementedError("push")
+            if arg & 0x40 and self.osr_count < self.threshold:
+                pass
+            elif not self.pull():
+                if arg & 0x20:
+                    return False
+                self.osr = self.x
+                self.osr_count = 0
+        elif op == MOV:
+            source = arg & 7
+            value = {1: self.x, 2: self.y, 7: self.osr}.get(source, 0)
+            operation = (arg >> 3) & 3
+            if operation == 1:
+                value = ~value & MASK32
+            elif operation == 2:
+                value = int(f"{value:032b}"[::-1], 2)
+            destination = arg >> 5
+            if destination == 0:
+                self.write_pins(self.out_pins, value, self.osr_tag)
+            elif destination == 1:
+                self.x = value
+            elif destination == 2:
+                self.y = value
+            elif destination == 5:
+                jump = value & 31
+            elif destination == 7:
+                self.osr = value
+                self.osr_count = 0
+                if source == 3:
+                    self.osr_tag = None
+            else:
+                raise NotImplementedError(f"mov {MOV_DESTINATIONS[destination]}")
+        elif op == SET:
+            destination = arg >> 5
+            data = arg & 31
+            if destination == 0:
+                self.write_pins(self.set_pins, data, self.osr_tag)
+            elif destination == 1:
+                self.x = data
+            elif destination == 2:
+                self.y = data
+        else:
+            raise NotImplementedError(("jmp", "wait", "in", "out", "push/pull",
+                                       "mov", "irq", "set")[op])
+
+        if jump is not None:
+            self.pc = jump
+        elif pc == self.wrap:
+            self.pc = self.wrap_target
+        else:
+            self.pc = pc + 1
+        return True
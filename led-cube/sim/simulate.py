@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Run the cube's code.py on a computer against simulated hardware.
+
+code.py runs unmodified, on a copy of led-cube/code as its CIRCUITPY
+drive, with stand-ins for rp2pio, storage, usb_cdc and adafruit_pioasm (in
+circuitpython/) and board, digitalio, keypad and supervisor (shared with
+the macropad's simulator, in pico-sim/circuitpython/). The PIO program
+runs cycle for cycle on an emulator (pio.py), fed by a model of
+background_write()'s DMA, and every change of the LED pins is recorded.
+Time is virtual (see hardware.py), so a run gives the same results every
+time and ten seconds of cube take well under ten seconds of computer.
+
+At the end it reports what was on the LEDs: how often a whole refresh
+(every layer in turn) was drawn, refreshes that were torn (layers out of
+order, or made of words from different writes or frames), and when the
+picture changed, with each change's timing error against the framerate.
+
+    python3 sim/simulate.py --seconds 10
+    python3 sim/simulate.py --animations my.json --press 3000 --type 5000:s
+    python3 sim/simulate.py --send 3000:a55a000001000000000000000001
+"""
+
+import argparse
+import contextlib
+import csv
+import json
+import os
+import re
+import runpy
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SIM = Path(__file__).resolve().parent
+sys.path.insert(0, str(SIM))
+
+import hardware  # noqa: E402
+
+CODE = SIM.parent / 'code'
+BUTTON = 'GP16'
+# A press with no length given is a short one
+PRESS_MS = 100
+# Refreshes listed individually in reports
+EXAMPLES = 5
+
+
+class Console:
+    """stdout for the cube: each line stamped with the virtual time.
+
+    Everything printed is also kept in `lines`, for the report.
+    """
+
+    def __init__(self, out, quiet=False):
+        self.out = out
+        self.quiet = quiet
+        self.at_start = True
+        self.lines = []
+        self.line = ''
+
+    def write(self, text):
+        for line in text.splitlines(keepends=True):
+            self.line += line.rstrip('\n')
+            if line.endswith('\n'):
+                self.lines.append(self.line)
+                self.line = ''
+        if self.quiet:
+            return len(text)
+        for line in text.splitlines(keepends=True):
+            if self.at_start:
+                self.out.write(f'[{hardware.clock.now / 1e9:8.3f}] ')
+            self.out.write(line)
+            self.at_start = line.endswith('\n')
+        return len(text)
+
+    def flush(self):
+        self.out.flush()
+
+
+def make_drive(drive, args):
+    """Copy code/ to drive, with the run's own animations and settings."""
+    shutil.copytree(args.code, drive, ignore=shutil.ignore_patterns('cache', '__pycache__'))
+    if args.animations:
+        for name in ('animations.json', 'animations.bin'):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(drive / name)
+        shutil.copy(args.animations, drive / args.animations.name)
+        if args.animations.suffix in ('.json', '.bin'):
+            os.replace(drive / args.animations.name, drive / f'animations{args.animations.suffix}')
+    if args.library:
+        shutil.copytree(args.library, drive / 'animations')
+    if args.timing:
+        (drive / 'timing.json').write_text(args.timing)
+    code_py = drive / 'code.py'
+    source = code_py.read_text()
+    for setting in args.set:
+        name, _, value = setting.partition('=')
+        source, n = re.subn(rf'^{name} = .*$', f'{name} = {value}', source, count=1,
+                            flags=re.MULTILINE)
+        if not n:
+            raise SystemExit(f'code.py has no setting {name}')
+    code_py.write_text(source)
+
+
+def run(args):
+    """Run boot.py and code.py on the simulated cube until time is up."""
+    presses = {}
+    for press in args.press:
+        start, _, held = press.partition(':')
+        presses.setdefault(args.button, []).append(
+            (int(start), int(start) + int(held or PRESS_MS)))
+    typed = []
+    for entry in args.type:
+        at_ms, _, text = entry.partition(':')
+        typed.append((int(at_ms), text + '\n'))
+    sent = []
+    for entry in args.send:
+        at_ms, _, data = entry.partition(':')
+        sent.append((int(at_ms), bytes.fromhex(data)))
+    clock = hardware.Clock(int(args.seconds * 1e9), int(args.call_us * 1000))
+    hardware.install(clock, hardware.Script(presses, typed, sent))
+
+    error = None
+    with tempfile.TemporaryDirectory() as tmp:
+        drive = Path(tmp) / 'CIRCUITPY'
+        make_drive(drive, args)
+        cwd = os.getcwd()
+        os.chdir(drive)
+        sys.path[:0] = [str(drive), str(SIM / 'circuitpython'),
+                        str(hardware.PICO_SIM / 'circuitpython')]
+        import storage
+        console = Console(sys.stderr if args.json else sys.stdout, args.quiet)
+        host_start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(console), storage.mounted(drive):
+                for script in ('boot.py', 'code.py'):
+                    runpy.run_path(str(drive / script), run_name='__main__')
+            error = 'code.py finished'
+        except hardware.SimulationDone:
+            pass
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            error = f'{type(e).__name__}: {e}'
+        finally:
+            host_s = time.perf_counter() - host_start
+            os.chdir(cwd)
+    return clock, host_s, error, console.lines
+
+
+################################################
+# ANALYSIS — from the pin trace back to refreshes and frames
+################################################
+
+def layer_visits(sm, end_cycle):
+    """Each time a layer was lit: [layer, start cycle, [(cathodes, cycles, tag)]].
+
+    A layer's bit-planes (grayscale) are one visit, as the dark gaps between
+    them are only the PIO clearing the pins.
+    """
+    outputs = sm.out_pin_count
+    n = next((n for n in range(1, 9) if n * n + n == outputs), None)
+    if n is None:
+        raise SystemExit(f'{outputs} out pins is not a cube the simulator knows')
+    cathode_mask = (1 << (n * n)) - 1
+    trace = sm.core.trace
+    visits = []
+    overlaps = 0
+    for k, (cycle, gpio, tag) in enumerate(trace):
+        end = trace[k + 1][0] if k + 1 < len(trace) else end_cycle
+        bits = (gpio >> sm.first_out_pin) & ((1 << outputs) - 1)
+        anodes = bits >> (n * n)
+        if not anodes or end <= cycle:
+            continue
+        if anodes & (anodes - 1):
+            overlaps += 1
+        layer = anodes.bit_length() - 1
+        if visits and visits[-1][0] == layer:
+            visits[-1][2].append((bits & cathode_mask, end - cycle, tag))
+        else:
+            visits.append([layer, cycle, [(bits & cathode_mask, end - cycle, tag)]])
+    return n, visits, overlaps
+
+
+def torn_words(tags):
+    """Whether a refresh's words aren't one frame of one write, in order."""
+    first = tags[0]
+    for k, tag in enumerate(tags):
+        if tag is None or tag[:2] != first[:2] or tag[2] != first[2] + k:
+            return True
+    return False
+
+
+def refreshes(n, visits):
+    """Complete refreshes as (start cycle, picture), and the torn ones' starts."""
+    done = []
+    torn = []
+    current = None
+    for layer, start, segments in visits:
+        if layer == 0:
+            if current is not None:
+                torn.append(current[0])
+            current = [start, []]
+        elif current is None or len(current[1]) != layer:
+            # Out of order
+            if current is not None:
+                torn.append(current[0])
+            current = None
+            continue
+        current[1].append(segments)
+        if len(current[1]) == n:
+            start, layers = current
+            tags = [tag for segments in layers for _, _, tag in segments]
+            if torn_words(tags):
+                torn.append(start)
+            else:
+                picture = tuple(cathodes for segments in layers
+                                for cathodes, _, _ in segments)
+                done.append((start, picture))
+            current = None
+    return done, torn
+
+
+def spread(values):
+    if not values:
+        return None
+    return {'mean': statistics.fmean(values), 'min': min(values),
+            'median': statistics.median(values), 'max': max(values)}
+
+
+def analyse(sm, end_ns, fps=None):
+    """What the LEDs showed during the run, from the state machine's trace."""
+    end_cycle = sm.cycle_at(end_ns)
+    us = 1e6 / sm.frequency
+    n, visits, overlaps = layer_visits(sm, end_cycle)
+    done, torn = refreshes(n, visits)
+    starts = [start for start, _ in done]
+    refresh_hz = [sm.frequency / (b - a) for a, b in zip(starts, starts[1:])]
+
+    changes = [start for k, (start, picture) in enumerate(done)
+               if k and picture != done[k - 1][1]]
+    intervals = [(b - a) * us / 1000 for a, b in zip(changes, changes[1:])]
+    period_ms = 1000 / fps if fps else (statistics.median(intervals) if intervals else None)
+    errors = []
+    skipped = 0
+    if period_ms and changes:
+        for change in changes:
+            t = (change - changes[0]) * us / 1000
+            periods = round(t / period_ms)
+            errors.append(abs(t - periods * period_ms))
+        skipped = sum(max(0, round(i / period_ms) - 1) for i in intervals)
+
+    return {
+        'seconds': end_ns / 1e9,
+        'refreshes': len(done),
+        'refresh_hz': spread(refresh_hz),
+        'torn': len(torn),
+        'torn_at_ms': [round(c * us / 1000, 3) for c in torn[:EXAMPLES]],
+        'layer_overlaps': overlaps,
+        'stalls': sm.core.stalls,
+        'stall_ms': sm.core.stall_cycles * us / 1000,
+        'writes': sm.writes,
+        'swaps': sm.swaps,
+        'frame_changes': len(changes),
+        'frame_interval_ms': spread(intervals),
+        'frame_period_ms': period_ms,
+        'jitter_ms': spread(errors),
+        'skipped_frames': skipped,
+    }
+
+
+def write_trace(sm, end_ns, path):
+    """Every time the LED pins changed, as CSV."""
+    end_cycle = sm.cycle_at(end_ns)
+    trace = sm.core.trace
+    with open(path, 'w', newline='') as f:
+        out = csv.writer(f)
+        out.writerow(['start_cycle', 'cycles', 'pins', 'write', 'part', 'index'])
+        for k, (cycle, gpio, tag) in enumerate(trace):
+            end = trace[k + 1][0] if k + 1 < len(trace) else end_cycle
+            pins = (gpio >> sm.first_out_pin) & ((1 << sm.out_pin_count) - 1)
+            out.writerow([cycle, end - cycle, f'{pins:03x}'] + list(tag or ('', '', '')))
+
+
+def print_report(report, host_s):
+    def ms(spread, digits=2):
+        if spread is None:
+            return 'n/a'
+        return (f"mean {spread['mean']:.{digits}f} min {spread['min']:.{digits}f} "
+                f"median {spread['median']:.{digits}f} max {spread['max']:.{digits}f}")
+
+    print(f"simulated {report['seconds']:.1f} s in {host_s:.1f} s")
+    print(f"refreshes: {report['refreshes']}, Hz {ms(report['refresh_hz'], 1)}")
+    print(f"torn refreshes: {report['torn']}"
+          + (f" (at ms {report['torn_at_ms']})" if report['torn'] else ''))
+    print(f"PIO: {report['writes']} writes, {report['swaps']} swaps, "
+          f"{report['stalls']} stalls ({report['stall_ms']:.1f} ms dark)"
+          + (f", {report['layer_overlaps']} layer overlaps" if report['layer_overlaps'] else ''))
+    print(f"frame changes: {report['frame_changes']}, interval ms {ms(report['frame_interval_ms'])}")
+    if report['frame_period_ms']:
+        print(f"jitter against {report['frame_period_ms']:.2f} ms frames: "
+              f"ms {ms(report['jitter_ms'])}, {report['skipped_frames']} skipped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=10, help='virtual seconds to run for')
+    parser.add_argument('--code', type=Path, default=CODE, help='the CIRCUITPY files to run')
+    parser.add_argument('--animations', type=Path,
+                        help='use this animations.json (or animations.bin) instead')
+    parser.add_argument('--library', type=Path, help='copy this directory to animations/')
+    parser.add_argument('--timing', help='timing.json contents, e.g. \'{"refresh_hz": 150}\'')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='change a setting in code.py, e.g. TELEMETRY=True')
+    parser.add_argument('--press', action='append', default=[], metavar='MS[:HELD_MS]',
+                        help=f'press the button at MS for HELD_MS (default {PRESS_MS})')
+    parser.add_argument('--button', default=BUTTON, help='the button pin')
+    parser.add_argument('--type', action='append', default=[], metavar='MS:TEXT',
+                        help='type a line on the serial console at MS, e.g. 5000:s')
+    parser.add_argument('--send', action='append', default=[], metavar='MS:HEX',
+                        help='bytes arriving on the usb_cdc data port at MS, in hex')
+    parser.add_argument('--call-us', type=float, default=hardware.CALL_NS / 1000,
+                        help='µs a call into a built-in module takes, mostly reading the clock')
+    parser.add_argument('--fps', type=float,
+                        help='framerate to measure jitter against (default: the median)')
+    parser.add_argument('--trace', type=Path, help='write the LED pin trace to this CSV')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('--quiet', action='store_true', help="hide the cube's console")
+    args = parser.parse_args()
+
+    clock, host_s, error, console = run(args)
+    if not hardware.state_machines:
+        raise SystemExit(f'no state machine was started: {error}')
+    sm = hardware.state_machines[0]
+    report = analyse(sm, clock.now, args.fps)
+    report['host_seconds'] = host_s
+    report['error'] = error
+    report['console'] = console
+    if args.trace:
+        write_trace(sm, clock.now, args.trace)
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print_report(report, host_s)
+    if error:
+        raise SystemExit(f'stopped early: {error}')
+
+
+if __name__ == '__main__':
+    main()
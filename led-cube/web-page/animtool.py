@@ -0,0 +1,627 @@
+#!/usr/bin/env python3
+"""
+Bulk work on animations.json files, with every frame in NumPy arrays.
+
+    check    find problems in any number of files at once
+    stats    how much repetition there is, and what it would pack down to
+    merge    combine files into one animations.json, dropping duplicates
+    reorder  rewrite files with their frames in the other bit order
+    pack     write animations.bin, or a library directory, like convert.py
+
+The animator holds frames with LED 1 as bit 0 and bit-reverses them when it
+exports (reverseBits27 in index.html), so animations.json has LED 1 as bit
+26: the order the cube uses. --order animator reads files written in the
+animator's own order instead. A million frames take a fraction of a second,
+most of it parsing the JSON. Needs NumPy (pip install numpy).
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:
+    sys.exit('animtool.py needs NumPy: pip install numpy')
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'code'))
+
+from convert import validate, write_library  # noqa: E402
+from lib.animfile import (FRAME_MASK, MAX_FRAME_HOLD, MAX_HOLD, OP_FLIP,  # noqa: E402
+                          OP_FLIP_MORE, OP_HOLD, OP_XOR, OP_XOR_LAYER, SPEC_KEYS,
+                          Animation, fold_holds, new_frames, write_binary)
+from lib.transform import check_spec  # noqa: E402
+
+CUBE = 'cube'
+ANIMATOR = 'animator'
+
+# Problems listed per animation before the rest are left out
+MAX_LISTED = 5
+
+# Per 9-bit layer: the layer bit-reversed, and how many LEDs it lights
+REVERSED9 = np.array([int(f'{i:09b}'[::-1], 2) for i in range(512)], dtype=np.uint32)
+POPCOUNT9 = np.array([bin(i).count('1') for i in range(512)], dtype=np.uint8)
+
+
+def reverse_bits27(frames):
+    """reverseBits27 for a whole array: LED i moves to bit 26 - i.
+
+    Reversing 27 bits is reversing the order of the three layers and the
+    bits within each, so it's three table lookups.
+    """
+    frames = frames.astype(np.uint32)
+    return (REVERSED9[frames & 511] << 18) | (REVERSED9[(frames >> 9) & 511] << 9) \
+        | REVERSED9[frames >> 18]
+
+
+def popcount27(frames):
+    return POPCOUNT9[frames & 511] + POPCOUNT9[(frames >> 9) & 511] \
+        + POPCOUNT9[(frames >> 18) & 511]
+
+
+def listed(indices):
+    text = ', '.join(str(i) for i in indices[:MAX_LISTED])
+    return text + (f' and {len(indices) - MAX_LISTED} more' if len(indices) > MAX_LISTED else '')
+
+
+class Batch:
+    """Animations from any number of animations.json files.
+
+    Each entry keeps its JSON fields other than frames and holds. The frames
+    of every on/off animation are in one array, `frames`, in the cube's bit
+    order, with `holds` alongside; animation i's are at
+    start[i]:start[i] + count[i] (count is 0 for the rest). Grayscale
+    frames are in `levels`, an (n, 27) array per animation.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.sources = []
+        self.files = []
+        self.wheres = []
+        self.problems = []
+        self.levels = {}
+        self.level_holds = {}
+        self.had_holds = set()
+
+    @classmethod
+    def load(cls, paths, order=CUBE):
+        batch = cls()
+        flat = []
+        holds = []
+        counts = []
+        places = []
+        for file_number, path in enumerate(paths):
+            try:
+                raw = json.loads(Path(path).read_text())
+            except (OSError, ValueError) as e:
+                batch.problems.append(f'{path}: {e}')
+                continue
+            if not isinstance(raw, list):
+                batch.problems.append(f'{path}: expected a list of animations')
+                continue
+            for k, entry in enumerate(raw):
+                where = f'{path}: animation {k}'
+                if not isinstance(entry, dict):
+                    batch.problems.append(f'{where}: expected an object')
+                    continue
+                where += f' ({entry.get("name", "?")!r})'
+                frames = entry.get('frames')
+                meta = {key: value for key, value in entry.items()
+                        if key not in ('frames', 'holds')}
+                # The rest of the checks, with frames and holds checked here
+                stub = dict(meta, frames=[0] if entry.get('depth', 1) == 1 else [[0] * 27])
+                prefix = f'animation 0 ({entry.get("name", "?")!r})'
+                for problem in validate([stub]):
+                    batch.problems.append(where + problem[len(prefix):])
+                i = len(batch.entries)
+                batch.entries.append(meta)
+                batch.sources.append(str(path))
+                batch.files.append(file_number)
+                batch.wheres.append(where)
+                count = 0
+                entry_holds = entry.get('holds')
+                if entry_holds is not None:
+                    batch.had_holds.add(i)
+                if any(key in entry for key in SPEC_KEYS):
+                    pass
+                elif not isinstance(frames, list) or not frames:
+                    batch.problems.append(f'{where}: no frames')
+                elif entry.get('depth', 1) != 1:
+                    if batch.load_levels(i, where, frames, entry.get('depth'), order):
+                        good = batch.check_holds(where, entry_holds, len(frames))
+                        batch.level_holds[i] = np.array(
+                            entry_holds if good and entry_holds else [1] * len(frames),
+                            dtype=np.uint32)
+                else:
+                    count = len(frames)
+                    flat.extend(frames)
+                    places.append((i, where))
+                    good = batch.check_holds(where, entry_holds, count)
+                    holds.extend(entry_holds if good and entry_holds else [1] * count)
+                counts.append(count)
+
+        batch.count = np.array(counts, dtype=np.int64)
+        batch.start = np.cumsum(batch.count) - batch.count
+        batch.frames = batch.to_frames(flat, places, order)
+        batch.holds = np.array(holds, dtype=np.uint32)
+        names = set()
+        for i, meta in enumerate(batch.entries):
+            key = (batch.files[i], meta.get('name'))
+            if key in names:
+                batch.problems.append(f'{batch.wheres[i]}: same name as an animation before it')
+            names.add(key)
+        return batch
+
+    def to_frames(self, flat, places, order):
+        """The on/off frames as one array, with any that aren't 27-bit reported."""
+        if set(map(type, flat)) - {int}:
+            for i, where in places:
+                frames = flat[self.start[i]:self.start[i] + self.count[i]]
+                bad = [k for k, f in enumerate(frames) if type(f) is not int]
+                if bad:
+                    self.problems.append(f'{where}: frames {listed(bad)} are not whole numbers')
+            flat = [f if type(f) is int else 0 for f in flat]
+        try:
+            frames = np.array(flat, dtype=np.int64)
+        except OverflowError:
+            frames = np.array([f if -1 << 62 < f < 1 << 62 else -1 for f in flat],
+                              dtype=np.int64)
+        bad = np.flatnonzero((frames < 0) | (frames > FRAME_MASK))
+        if len(bad):
+            owners = np.searchsorted(self.start, bad, side='right') - 1
+            for i, where in places:
+                mine = bad[owners == i] - self.start[i]
+                if len(mine):
+                    self.problems.append(f'{where}: frames {listed(mine.tolist())} '
+                                         f'are not 27-bit (first: {flat[self.start[i] + mine[0]]})')
+            frames[bad] = 0
+        frames = frames.astype(np.uint32)
+        return reverse_bits27(frames) if order == ANIMATOR else frames
+
+    def load_levels(self, i, where, frames, depth, order):
+        if not isinstance(depth, int) or not 1 < depth <= 4:
+            # validate() has said so
+            return False
+        try:
+            levels = np.array(frames, dtype=np.int64)
+        except (ValueError, TypeError, OverflowError):
+            levels = None
+        if levels is None or levels.ndim != 2 or levels.shape[1] != 27:
+            self.problems.append(f'{where}: frames must be lists of 27 levels')
+            return False
+        bad = np.flatnonzero(((levels < 0) | (levels >= 1 << depth)).any(axis=1))
+        if len(bad):
+            self.problems.append(f'{where}: frames {listed(bad.tolist())} have levels '
+                                 f'outside 0 to {(1 << depth) - 1}')
+            levels = np.clip(levels, 0, (1 << depth) - 1)
+        levels = levels.astype(np.uint8)
+        self.levels[i] = levels[:, ::-1] if order == ANIMATOR else levels
+        return True
+
+    def check_holds(self, where, holds, count):
+        if holds is None:
+            return True
+        if not isinstance(holds, list) or len(holds) != count \
+                or not all(type(h) is int for h in holds):
+            self.problems.append(f'{where}: holds must be one whole number per frame')
+            return False
+        values = np.array(holds, dtype=np.int64)
+        if ((values < 1) | (values > MAX_FRAME_HOLD)).any():
+            self.problems.append(f'{where}: holds must be 1 to {MAX_FRAME_HOLD}')
+            return False
+        return True
+
+    # Per-animation views
+
+    def frames_of(self, i):
+        return self.frames[self.start[i]:self.start[i] + self.count[i]]
+
+    def holds_of(self, i):
+        return self.holds[self.start[i]:self.start[i] + self.count[i]]
+
+    def plain(self):
+        """Indices of the on/off animations with frames."""
+        return np.flatnonzero(self.count)
+
+    def grayscale_levels(self, i):
+        """A grayscale animation's levels and holds."""
+        return self.levels[i], self.level_holds[i]
+
+    def counts_of(self, values):
+        """Sum of values (one per frame) for each animation."""
+        sums = np.zeros(len(self.count), dtype=np.int64)
+        plain = self.plain()
+        if len(plain):
+            sums[plain] = np.add.reduceat(values.astype(np.int64), self.start[plain])
+        return sums
+
+    # Folding and delta encoding, all animations at once
+
+    def fold(self):
+        """Frames and holds with repeats folded in, as the cube packs them.
+
+        Returns (frames, holds, start, count) like the Batch's own. Runs
+        too long for one hold are left for animfile.fold_holds to split.
+        """
+        n = len(self.frames)
+        first = np.zeros(n, dtype=bool)
+        first[self.start[self.count > 0]] = True
+        repeat = np.zeros(n, dtype=bool)
+        repeat[1:] = self.frames[1:] == self.frames[:-1]
+        keep = ~repeat | first
+        runs = np.flatnonzero(keep)
+        holds = np.add.reduceat(self.holds.astype(np.int64), runs) if n else self.holds
+        count = self.counts_of(keep)
+        return self.frames[runs], holds.astype(np.uint32), np.cumsum(count) - count, count
+
+    def delta_streams(self):
+        """Every on/off animation delta-encoded exactly as animfile.encode_delta
+        would, holds played out: the bytes, and each animation's start in them.
+        """
+        frames = np.repeat(self.frames, self.holds)
+        count = self.counts_of(self.holds)
+        start = np.cumsum(count) - count
+        n = len(frames)
+        first = np.zeros(n, dtype=bool)
+        first[start[count > 0]] = True
+        prev = np.zeros(n, dtype=np.uint32)
+        prev[1:] = frames[:-1]
+        prev[first] = 0
+        hold = ~first & (frames == prev)
+        changed = frames ^ prev
+        bits = popcount27(changed).astype(np.int64)
+        layer_lit = np.stack([((changed >> (9 * layer)) & 511) != 0 for layer in range(3)])
+        flip = ~hold & (bits > 0) & (bits < 4)
+        one_layer = ~hold & ~flip & (layer_lit.sum(axis=0) == 1)
+        xor = ~hold & ~flip & ~one_layer
+
+        # A run of holds is a byte per 64, and one for what's left
+        index = np.arange(n)
+        run_start = np.maximum.accumulate(np.where(hold, 0, index))
+        k = index - run_start
+        run_end = hold.copy()
+        run_end[:-1] &= ~hold[1:]
+        hold_byte = hold & ((k % MAX_HOLD == 0) | run_end)
+
+        length = np.select([hold, flip, one_layer], [hold_byte.astype(np.int64), bits, 3], 5)
+        offset = np.cumsum(length) - length
+        out = np.zeros(int(length.sum()), dtype=np.uint8)
+        out[offset[hold_byte]] = OP_HOLD + (k[hold_byte] - 1) % MAX_HOLD
+
+        at = offset[xor]
+        out[at] = OP_XOR
+        for b in range(4):
+            out[at + 1 + b] = (changed[xor] >> (8 * b)) & 0xFF
+
+        layer = np.argmax(layer_lit[:, one_layer], axis=0)
+        value = changed[one_layer] >> (9 * layer).astype(np.uint32)
+        at = offset[one_layer]
+        out[at] = OP_XOR_LAYER + layer
+        out[at + 1] = value & 0xFF
+        out[at + 2] = value >> 8
+
+        # Up to three flips, lowest LED first; the last one emits the frame
+        rest = changed[flip].astype(np.int64)
+        left = bits[flip]
+        at = offset[flip]
+        for _ in range(3):
+            live = left > 0
+            low = rest & -rest
+            led = np.log2(np.where(live, low, 1)).astype(np.uint8)
+            out[at[live]] = np.where(left[live] == 1, OP_FLIP, OP_FLIP_MORE) + led[live]
+            rest &= rest - 1
+            left = left - 1
+            at = at + 1
+
+        ends = np.append(offset, len(out))
+        return out, ends[start], ends[start + count]
+
+    # Content
+
+    def content_key(self, i, folded, meta=None):
+        """Hash of what the cube would play for entry i: equal for duplicates.
+
+        meta, if given, stands in for the entry's own fields.
+        """
+        meta = {key: value for key, value in (meta or self.entries[i]).items()
+                if key != 'name'}
+        digest = hashlib.sha1(json.dumps(meta, sort_keys=True).encode())
+        frames, holds, start, count = folded
+        if self.count[i]:
+            digest.update(frames[start[i]:start[i] + count[i]].tobytes())
+            digest.update(holds[start[i]:start[i] + count[i]].tobytes())
+        elif i in self.levels:
+            levels, level_holds = self.grayscale_levels(i)
+            digest.update(levels.tobytes())
+            digest.update(level_holds.tobytes())
+        return digest.hexdigest()
+
+    def to_json(self, i, order=CUBE):
+        """Entry i as it goes in animations.json."""
+        entry = dict(self.entries[i])
+        if self.count[i]:
+            frames = self.frames_of(i)
+            entry['frames'] = (reverse_bits27(frames) if order == ANIMATOR else frames).tolist()
+            if i in self.had_holds:
+                entry['holds'] = self.holds_of(i).tolist()
+        elif i in self.levels:
+            levels, holds = self.grayscale_levels(i)
+            entry['frames'] = (levels[:, ::-1] if order == ANIMATOR else levels).tolist()
+            if i in self.had_holds:
+                entry['holds'] = holds.tolist()
+        return entry
+
+    def animations(self, folded=None):
+        """lib.animfile Animations, as pack_animations would make them."""
+        frames, holds, start, count = folded or self.fold()
+        animations = []
+        for i, meta in enumerate(self.entries):
+            timing = meta.get('timing')
+            if any(key in meta for key in SPEC_KEYS):
+                spec = {k: v for k, v in meta.items() if k not in ('name', 'framerate', 'timing')}
+                animations.append(Animation(meta['name'], meta['framerate'], None,
+                                            spec=spec, timing=timing))
+                continue
+            if i in self.levels:
+                levels, level_holds = self.grayscale_levels(i)
+                depth = meta['depth']
+                planes = np.stack([((levels >> b) & 1).astype(np.uint32)
+                                   @ (np.uint32(1) << np.arange(27, dtype=np.uint32))
+                                   for b in range(depth)], axis=1).astype(np.uint32)
+                anim_frames = new_frames(0)
+                anim_frames.frombytes(planes.astype('<u4').tobytes())
+                anim = Animation(meta['name'], meta['framerate'], anim_frames, depth=depth,
+                                 holds=to_array('H', level_holds)
+                                 if i in self.had_holds else None, timing=timing)
+                fold_holds(anim)
+                animations.append(anim)
+                continue
+            run = slice(start[i], start[i] + count[i])
+            anim_holds = holds[run]
+            if (anim_holds > MAX_FRAME_HOLD).any():
+                # Too long to hold in one: let fold_holds split it
+                anim = Animation(meta['name'], meta['framerate'],
+                                 to_array('I', self.frames_of(i)),
+                                 holds=to_array('H', self.holds_of(i)), timing=timing)
+                fold_holds(anim)
+            else:
+                folded_any = count[i] != self.count[i] or i in self.had_holds
+                anim = Animation(meta['name'], meta['framerate'], to_array('I', frames[run]),
+                                 holds=to_array('H', anim_holds) if folded_any else None,
+                                 timing=timing)
+            animations.append(anim)
+        return animations
+
+
+def to_array(typecode, values):
+    import array
+    out = array.array(typecode)
+    out.frombytes(values.astype('<u4' if typecode == 'I' else '<u2').tobytes())
+    return out
+
+
+################################################
+# COMMANDS
+################################################
+
+def check(batch, args):
+    for problem in batch.problems:
+        print(problem)
+    if not batch.problems:
+        animations = batch.animations()
+        library = {anim.name: anim for anim in animations}
+        for anim in animations:
+            try:
+                check_spec(anim, library)
+            except ValueError as e:
+                print(f'{anim.name!r}: {e}')
+                batch.problems.append(e)
+    frames = int(batch.count.sum()) + sum(len(batch.grayscale_levels(i)[0]) for i in batch.levels)
+    print(f'{len(batch.entries)} animations, {frames} frames, {len(batch.problems)} problems')
+    return 1 if batch.problems else 0
+
+
+def stats(batch, args):
+    folded = batch.fold()
+    _, folded_holds, folded_start, folded_count = folded
+    delta, delta_start, delta_end = batch.delta_streams()
+    plain = batch.plain()
+    lit = popcount27(batch.frames)
+    # Different frames in each animation, from one sort of them all
+    owner = np.repeat(np.arange(len(batch.count)), batch.count)
+    keys = np.sort((owner << 27) | batch.frames.astype(np.int64))
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    unique = np.bincount(keys[first] >> 27, minlength=len(batch.count))
+
+    rows = []
+    lit_sums = batch.counts_of(lit)
+    for i in plain:
+        raw = 4 * int(batch.count[i]) + (2 * int(batch.count[i]) if i in batch.had_holds else 0)
+        held = 4 * int(folded_count[i]) + (
+            2 * int(folded_count[i]) if folded_count[i] != batch.count[i] or i in batch.had_holds
+            else 0)
+        delta_bytes = 4 + int(delta_end[i] - delta_start[i])
+        rows.append((i, {
+            'frames': int(batch.count[i]),
+            'unique': int(unique[i]),
+            'repeats': int(batch.count[i] - folded_count[i]),
+            'lit': int(lit_sums[i]) / int(batch.count[i]),
+            'raw': raw,
+            'held': held,
+            'delta': delta_bytes,
+            'packed': min(held, delta_bytes),
+        }))
+
+    keys = {}
+    duplicates = 0
+    for i in range(len(batch.entries)):
+        key = batch.content_key(i, folded)
+        if key in keys:
+            duplicates += 1
+        keys.setdefault(key, i)
+
+    if args.animations:
+        print(f"{'animation':<32} {'frames':>7} {'unique':>7} {'repeats':>7} "
+              f"{'lit':>5} {'raw B':>8} {'held B':>8} {'delta B':>8}")
+        for i, row in rows:
+            print(f"{batch.entries[i].get('name', '?')[:32]:<32} {row['frames']:7} "
+                  f"{row['unique']:7} {row['repeats']:7} {row['lit']:5.1f} "
+                  f"{row['raw']:8} {row['held']:8} {row['delta']:8}")
+        print()
+
+    total = {key: sum(row[key] for _, row in rows)
+             for key in ('frames', 'repeats', 'raw', 'held', 'delta', 'packed')}
+    ordered = np.sort(batch.frames)
+    different = int(np.count_nonzero(ordered[1:] != ordered[:-1])) + (len(ordered) > 0)
+    json_bytes = sum(Path(source).stat().st_size for source in set(batch.sources))
+    print(f'{len(batch.entries)} animations ({len(plain)} on/off, {len(batch.levels)} '
+          f'grayscale, {len(batch.entries) - len(plain) - len(batch.levels)} generated '
+          f'or derived) from {len(set(batch.sources))} files')
+    print(f"{total['frames']} on/off frames, {different} different "
+          f"({100 * (1 - different / max(1, total['frames'])):.1f}% repeated somewhere), "
+          f"{total['repeats']} repeats of the frame before, "
+          f"{float(lit.mean()) if len(lit) else 0:.1f} LEDs lit on average")
+    print(f'{duplicates} duplicate animations (the same frames and settings as another)')
+    print(f"bytes: JSON {json_bytes}, frames {total['raw']}, repeats held {total['held']}, "
+          f"delta {total['delta']}, best of each {total['packed']} "
+          f"({total['packed'] / max(1, json_bytes):.1%} of the JSON)")
+    return 0
+
+
+def merge(batch, args):
+    # Animations with the same name as an earlier, different one get a
+    # number added, and whatever refers to them in their own file follows
+    folded = batch.fold()
+    kept = {}
+    # Per source file: name in that file -> name in the merged file
+    renamed = {}
+    taken = set()
+    chosen = {}
+    # Animations with frames first, so what refers to them can be compared
+    # by what it refers to once they have their merged names
+    order = sorted(range(len(batch.entries)),
+                   key=lambda i: any(key in batch.entries[i] for key in SPEC_KEYS))
+    for i in order:
+        names = renamed.setdefault(batch.files[i], {})
+        meta = dict(batch.entries[i])
+        if 'base' in meta:
+            meta['base'] = names.get(meta['base'], meta['base'])
+        if 'layers' in meta:
+            meta['layers'] = [names.get(layer, layer) for layer in meta['layers']]
+        name = meta['name']
+        key = batch.content_key(i, folded, meta)
+        if key in kept and not args.keep_duplicates:
+            names[name] = kept[key]
+            continue
+        new_name = name
+        n = 1
+        while new_name in taken:
+            n += 1
+            new_name = f'{name} {n}'
+        taken.add(new_name)
+        names[name] = new_name
+        kept.setdefault(key, new_name)
+        meta['name'] = new_name
+        chosen[i] = meta
+
+    merged = []
+    for i in sorted(chosen):
+        entry = batch.to_json(i, args.write_order)
+        entry.update(chosen[i])
+        merged.append(entry)
+    args.output.write_text(json.dumps(merged))
+    print(f'Merged {len(batch.entries)} animations into {len(merged)} '
+          f'({len(batch.entries) - len(merged)} duplicates dropped) → {args.output}')
+    return 0
+
+
+def reorder(batch, args):
+    target = ANIMATOR if args.order == CUBE else CUBE
+    if args.output and len(set(batch.sources)) > 1:
+        sys.exit('-o only works with one file')
+    for source in dict.fromkeys(batch.sources):
+        entries = [batch.to_json(i, target) for i in range(len(batch.entries))
+                   if batch.sources[i] == source]
+        out = args.output if args.output else Path(source).with_suffix(f'.{target}.json')
+        out.write_text(json.dumps(entries))
+        print(f'{source} → {out} (LED 1 as bit {0 if target == ANIMATOR else 26})')
+    return 0
+
+
+def pack(batch, args):
+    folded = batch.fold()
+    animations = batch.animations(folded)
+    library = {anim.name: anim for anim in animations}
+    problems = []
+    for anim in animations:
+        try:
+            check_spec(anim, library)
+        except ValueError as e:
+            problems.append(f'{anim.name!r}: {e}')
+    if problems:
+        sys.exit('\n'.join(problems))
+    if args.delta:
+        delta, delta_start, delta_end = batch.delta_streams()
+        for i in batch.plain():
+            anim = animations[i]
+            data = delta[delta_start[i]:delta_end[i]]
+            if len(data) + 4 < anim.nbytes:
+                animations[i] = Animation(anim.name, anim.framerate, bytearray(data.tobytes()),
+                                          int(batch.holds_of(i).sum()), delta=True,
+                                          timing=anim.timing)
+    if args.library:
+        write_library(args.library, animations)
+        print(f'Added {len(animations)} animations to {args.library}')
+        return 0
+    with open(args.output, 'wb') as f:
+        write_binary(f, animations)
+    print(f'Packed {len(animations)} animations → {args.output} '
+          f'({args.output.stat().st_size} bytes)')
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--order', choices=(CUBE, ANIMATOR), default=CUBE,
+                        help='bit order of the files read (default: cube, as exported)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name, command, help in (
+            ('check', check, 'find problems in the files'),
+            ('stats', stats, 'report repetition and packed sizes'),
+            ('merge', merge, 'combine the files into one, dropping duplicates'),
+            ('reorder', reorder, 'rewrite the files in the other bit order'),
+            ('pack', pack, 'write animations.bin or a library directory')):
+        sub = commands.add_parser(name, help=help)
+        sub.add_argument('json', type=Path, nargs='+', help='animations.json files')
+        sub.set_defaults(run=command)
+        if name == 'stats':
+            sub.add_argument('--animations', action='store_true',
+                             help='a line for every animation too')
+        elif name == 'merge':
+            sub.add_argument('-o', '--output', type=Path, required=True)
+            sub.add_argument('--keep-duplicates', action='store_true',
+                             help='keep animations that are the same as an earlier one')
+            sub.add_argument('--write-order', choices=(CUBE, ANIMATOR), default=CUBE)
+        elif name == 'reorder':
+            sub.add_argument('-o', '--output', type=Path,
+                             help='output file (default: NAME.animator.json or NAME.cube.json)')
+        elif name == 'pack':
+            sub.add_argument('-o', '--output', type=Path, default=Path('animations.bin'))
+            sub.add_argument('--delta', action='store_true',
+                             help='delta encode animations where that makes them smaller')
+            sub.add_argument('--library', type=Path, metavar='DIR',
+                             help='add each animation to the library directory DIR instead')
+    args = parser.parse_args()
+
+    batch = Batch.load(args.json, args.order)
+    if batch.problems and args.run is not check:
+        sys.exit('\n'.join(batch.problems))
+    sys.exit(args.run(batch, args))
+
+
+if __name__ == '__main__':
+    main()
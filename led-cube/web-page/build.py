@@ -1,40 +1,319 @@
 #!/usr/bin/env python3
 """
 Bundle index.html + SVG assets into a single self-contained HTML file.
-Output: index-bundle.html
+Output: index-bundle.html, with index-bundle.html.gz and .br alongside for
+web servers that can send precompressed files.
 
 Strategy:
-  - Logo:         replace src="lw-white.svg" with a base64 data URI.
-  - Cube SVG:     inject a fetch() shim before </head> that intercepts
-                  fetch('led-cube-base.svg') and returns the inlined SVG.
-                  The existing JS is left completely untouched.
+  - Logo:         minify lw-white.svg and replace src="lw-white.svg" with
+                  a data URI.
+  - Cube SVG:     minify led-cube-base.svg and inject a fetch() shim before
+                  </head> that intercepts fetch('led-cube-base.svg') and
+                  returns it. The existing JS is left working as it is.
+  - CSS and JS:   strip comments and indentation from the <style> and
+                  <script> blocks.
+
+Minifying keeps everything the page relies on: the SVG's inkscape:label
+attributes (how the page finds the LEDs) and line breaks in the JS, so
+nothing changes meaning without its semicolons. build-manifest.json
+records a hash of every input, so running it again with nothing changed
+just prints the size report.
+
+    python3 build.py
+    python3 build.py --force
 """
 
-import base64
+import argparse
+import gzip
+import hashlib
+import json
+import re
+import sys
 from pathlib import Path
+from urllib.parse import quote
+from xml.dom import minidom
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+src = Path(__file__).resolve().parent
+
+OUTPUT = 'index-bundle.html'
+MANIFEST = 'build-manifest.json'
+INPUTS = ('index.html', 'lw-white.svg', 'led-cube-base.svg', 'build.py')
+
+# Decimal places kept in SVG coordinates: the cube is drawn in mm, so 0.001 mm
+PRECISION = 3
+
+# Most each part of the page may add to it once gzipped, in bytes: the whole
+# bundle has to load quickly over a busy camp Wi-Fi
+BUDGETS = {
+    'logo': 2_500,
+    'CSS': 2_000,
+    'JS': 4_500,
+    'cube SVG': 3_000,
+    'HTML': 2_000,
+    OUTPUT: 14_000,
+}
+
+# Elements that only matter to the editors the SVGs were drawn in
+EDITOR_ONLY = ('metadata', 'title', 'desc', 'sodipodi:namedview', 'inkscape:path-effect')
+# Attributes holding numbers, or lists of them, that can be rounded
+NUMERIC = {'d', 'points', 'transform', 'gradientTransform', 'patternTransform', 'style',
+           'x', 'y', 'x1', 'y1', 'x2', 'y2', 'cx', 'cy', 'fx', 'fy', 'r', 'rx', 'ry',
+           'width', 'height', 'offset', 'stroke-width', 'opacity', 'fill-opacity',
+           'stroke-opacity', 'stop-opacity', 'stroke-miterlimit'}
+NUMBER = re.compile(r'-?(?:\d+\.\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+
+# ── SVG ───────────────────────────────────────────────────────────────────
+def round_numbers(text):
+    """Round every decimal in text to PRECISION places, written as briefly as possible."""
+    def short(match):
+        value = round(float(match.group()), PRECISION)
+        s = f'{value:.{PRECISION}f}'.rstrip('0').rstrip('.')
+        if s in ('-0', ''):
+            return '0'
+        return s.replace('0.', '.', 1) if s.startswith(('0.', '-0.')) else s
+    return NUMBER.sub(short, text)
+
+
+def minify_svg(text):
+    """Inkscape SVG without editor data, comments, whitespace or long decimals."""
+    doc = minidom.parseString(text.encode())
+    root = doc.documentElement
+    referenced = set(re.findall(r'url\(#([^)]+)\)|href="#([^"]+)"', text))
+    referenced = {a or b for a, b in referenced}
+
+    def clean(node):
+        for child in list(node.childNodes):
+            if child.nodeType == child.ELEMENT_NODE:
+                # Hidden layers too: the page never shows them
+                if child.tagName in EDITOR_ONLY or \
+                        'display:none' in child.getAttribute('style').replace(' ', ''):
+                    node.removeChild(child)
+                else:
+                    clean(child)
+            elif child.nodeType == child.TEXT_NODE:
+                if not child.data.strip() and node.tagName not in ('text', 'tspan'):
+                    node.removeChild(child)
+            elif child.nodeType != child.CDATA_SECTION_NODE:
+                node.removeChild(child)
+        if node.nodeType != node.ELEMENT_NODE:
+            return
+        for name, value in list(node.attributes.items()):
+            prefix = name.split(':', 1)[0] if ':' in name else ''
+            if name == 'inkscape:label' and node.tagName == 'path':
+                continue
+            if prefix in ('inkscape', 'sodipodi') or \
+                    (name == 'id' and value not in referenced) or \
+                    (prefix == 'xmlns' and name not in ('xmlns:xlink', 'xmlns:inkscape')):
+                node.removeAttribute(name)
+            elif name == 'style':
+                rules = [r.strip() for r in value.split(';')]
+                rules = [re.sub(r'\s*:\s*', ':', r) for r in rules
+                         if r and not r.startswith('-inkscape')]
+                node.setAttribute(name, round_numbers(';'.join(rules)))
+            elif name in NUMERIC:
+                value = re.sub(r'\s*,\s*', ',', ' '.join(value.split()))
+                if name == 'd':
+                    # Path commands need no spaces around them
+                    value = re.sub(r' ?([A-Za-z]) ?', r'\1', value)
+                node.setAttribute(name, round_numbers(value))
+        if node.tagName in ('defs', 'g') and not node.childNodes:
+            node.parentNode.removeChild(node)
+
+    clean(doc)
+    if root.hasAttribute('xmlns:xlink') and 'xlink:href' not in root.toxml():
+        root.removeAttribute('xmlns:xlink')
+    if root.hasAttribute('xmlns:inkscape') and 'inkscape:' not in root.toxml().replace(
+            'xmlns:inkscape', ''):
+        root.removeAttribute('xmlns:inkscape')
+    for name in ('xml:space', 'version'):
+        if root.hasAttribute(name):
+            root.removeAttribute(name)
+    return root.toxml()
+
+
+# ── CSS and JS ────────────────────────────────────────────────────────────
+def minify_css(css):
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    # Spaces before a colon can matter (a :hover), spaces after it never do
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r':\s+', ':', css)
+    return css.replace(';}', '}').strip()
+
+
+WORD = re.compile(r'[\w$]')
+# After these a / starts a regular expression rather than dividing
+REGEX_AFTER = set('(,=:[!&|?{};+-*%<>~^') | {
+    '', 'return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'new', 'delete',
+    'void', 'throw', 'instanceof', 'yield', 'await'}
+# A line break next to one of these can go without changing what the code means
+JOINS_AFTER = set('{;,([:=+-*%&|?<>!~^')
+JOINS_BEFORE = set(')]},;.?:')
+
+
+def skip_string(js, i):
+    """Index just past the string or template literal starting at js[i]."""
+    quote_char = js[i]
+    i += 1
+    while js[i] != quote_char:
+        if js[i] == '\\':
+            i += 1
+        elif quote_char == '`' and js.startswith('${', i):
+            # The code inside ${...}, up to its closing brace
+            depth = 0
+            i += 1
+            while True:
+                if js[i] in '\'"`':
+                    i = skip_string(js, i) - 1
+                elif js[i] == '{':
+                    depth += 1
+                elif js[i] == '}':
+                    depth -= 1
+                    if depth == 0:
+                        break
+                i += 1
+        i += 1
+    return i + 1
+
+
+def skip_regex(js, i):
+    """Index just past the regular expression starting at js[i], or None if it isn't one."""
+    i += 1
+    in_class = False
+    while i < len(js) and js[i] != '\n':
+        c = js[i]
+        if c == '\\':
+            i += 1
+        elif c == '[':
+            in_class = True
+        elif c == ']':
+            in_class = False
+        elif c == '/' and not in_class:
+            i += 1
+            while i < len(js) and WORD.match(js[i]):
+                i += 1
+            return i
+        i += 1
+    return None
+
 
-src = Path(__file__).parent
+def minify_js(js):
+    """JS without comments, indentation or spaces it doesn't need.
 
-html = (src / 'index.html').read_text()
+    Strings, template literals and regular expressions are copied as they
+    are. Line breaks stay unless the characters either side make it plain
+    the statement carries on, so automatic semicolon insertion works
+    exactly as before.
+    """
+    out = []
+    last = ''       # last token, to tell a regex from a division
+    space = ''      # whitespace skipped since the last token: '', ' ' or '\n'
+    i = 0
+    while i < len(js):
+        c = js[i]
+        if c in ' \t\r\n':
+            space = '\n' if c == '\n' or space == '\n' else ' '
+            i += 1
+            continue
+        if js.startswith('//', i):
+            i = js.find('\n', i)
+            i = len(js) if i < 0 else i
+            continue
+        if js.startswith('/*', i):
+            end = js.index('*/', i + 2) + 2
+            if '\n' in js[i:end]:
+                space = '\n'
+            elif not space:
+                space = ' '
+            i = end
+            continue
 
-# ── Logo ──────────────────────────────────────────────────────────────────
-logo_b64 = base64.b64encode((src / 'lw-white.svg').read_bytes()).decode()
-html = html.replace(
-    'src="lw-white.svg"',
-    f'src="data:image/svg+xml;base64,{logo_b64}"',
-)
+        if c in '\'"`':
+            end = skip_string(js, i)
+        elif c == '/' and last in REGEX_AFTER and skip_regex(js, i):
+            end = skip_regex(js, i)
+        elif WORD.match(c):
+            end = i + 1
+            while end < len(js) and WORD.match(js[end]):
+                end += 1
+        else:
+            end = i + 1
+        token = js[i:end]
 
-# ── Cube SVG: fetch() shim ────────────────────────────────────────────────
-cube_svg = (src / 'led-cube-base.svg').read_text()
-cube_svg_js = (
-    cube_svg
-    .replace('\\', '\\\\')   # must be first
-    .replace('`',  '\\`')
-    .replace('${', '\\${')
-)
+        if out and space:
+            prev = out[-1][-1]
+            # After a postfix ++ or -- the line break ends the statement
+            postfix = prev in '+-' and len(out) > 1 and out[-2] == prev
+            if space == '\n' and (postfix or not (prev in JOINS_AFTER or c in JOINS_BEFORE)):
+                out.append('\n')
+            elif (WORD.match(prev) and WORD.match(c)) or \
+                    (prev in '+-' and c == prev) or (prev == '/' and c == '/'):
+                out.append(' ')
+        out.append(token)
+        last = token if WORD.match(c) or len(token) == 1 else 'literal'
+        space = ''
+        i = end
+    return ''.join(out)
 
-shim = f"""\
-<script>
+
+def minify_blocks(html, tag, minify):
+    """Minify the contents of every <tag> block in html; returns the new html and the minified parts."""
+    parts = []
+
+    def replace(match):
+        parts.append(minify(match.group(2)))
+        return match.group(1) + parts[-1] + match.group(3)
+    html = re.sub(rf'(<{tag}[^>]*>)(.*?)(</{tag}>)', replace, html, flags=re.S)
+    return html, ''.join(parts)
+
+
+# ── Bundle ────────────────────────────────────────────────────────────────
+def bundle():
+    """The bundled page, and each part of it by name, for the size report."""
+    html = (src / 'index.html').read_text()
+    sources = {}
+    parts = {}
+
+    # ── Logo ──────────────────────────────────────────────────────────────
+    logo = (src / 'lw-white.svg').read_text()
+    sources['logo'] = logo
+    # URL-encoded rather than base64, which is a third bigger and compresses worse
+    logo_svg = minify_svg(logo)
+    if "'" not in logo_svg:
+        # Single quotes needn't be escaped inside src="..."
+        logo_svg = logo_svg.replace('"', "'")
+    logo_uri = 'data:image/svg+xml,' + quote(logo_svg, safe=" =:/;,'()-._~!*@$+?")
+    parts['logo'] = logo_uri
+    html = html.replace('src="lw-white.svg"', f'src="{logo_uri}"')
+
+    # ── CSS and JS ────────────────────────────────────────────────────────
+    sources['CSS'] = ''.join(re.findall(r'<style[^>]*>(.*?)</style>', html, flags=re.S))
+    sources['JS'] = ''.join(re.findall(r'<script[^>]*>(.*?)</script>', html, flags=re.S))
+    # Whitespace in the page itself collapses to one space when it's shown,
+    # so a line break and indent can become just the line break
+    html = re.sub(r'(<(script|style)[^>]*>.*?</\2>)|\n\s+',
+                  lambda m: m.group(1) or '\n', html, flags=re.S)
+    html, parts['CSS'] = minify_blocks(html, 'style', minify_css)
+    html, parts['JS'] = minify_blocks(html, 'script', minify_js)
+
+    # ── Cube SVG: fetch() shim ────────────────────────────────────────────
+    cube_svg = (src / 'led-cube-base.svg').read_text()
+    sources['cube SVG'] = cube_svg
+    cube_svg_js = (
+        minify_svg(cube_svg)
+        .replace('\\', '\\\\')   # must be first
+        .replace('`',  '\\`')
+        .replace('${', '\\${')
+    )
+    parts['cube SVG'] = cube_svg_js
+
+    shim = minify_js(f"""\
 (function () {{
     var _svg = `{cube_svg_js}`;
     var _fetch = window.fetch;
@@ -44,12 +323,86 @@ shim = f"""\
         return _fetch.apply(this, arguments);
     }};
 }})();
-</script>
-"""
+""")
+    html = html.replace('</head>', f'<script>{shim}</script>\n</head>', 1)
+
+    # The page's own markup is what's left of each
+    page = (src / 'index.html').read_text()
+    sources['HTML'] = page.replace(sources['CSS'], '').replace(sources['JS'], '')
+    parts['HTML'] = html
+    for name in ('logo', 'CSS', 'JS', 'cube SVG'):
+        parts['HTML'] = parts['HTML'].replace(parts[name], '', 1)
+    sources[OUTPUT] = page + logo + cube_svg
+    parts[OUTPUT] = html
+    return html, sources, parts
+
+
+def gz(data):
+    # mtime=0 so the same page always compresses to the same bytes
+    return gzip.compress(data, 9, mtime=0)
+
+
+def report(sizes):
+    """Print each part's size, before and after, against its budget; True if all fit."""
+    print(f"{'':<20} {'source':>8} {'minified':>9} {'gzip':>7} {'brotli':>7} {'budget':>7}")
+    fits = True
+    for name, (source, minified, gzipped, brotlied) in sizes.items():
+        budget = BUDGETS[name]
+        over = gzipped > budget
+        fits = fits and not over
+        brotlied = '-' if brotlied is None else f'{brotlied:,}'
+        print(f"{name:<20} {source:>8,} {minified:>9,} {gzipped:>7,} {brotlied:>7} {budget:>7,}"
+              + ('  OVER BUDGET' if over else ''))
+    print('sizes in bytes; budget: the most each part may come to gzipped')
+    return fits
+
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--force', action='store_true',
+                        help='build even if nothing has changed')
+    args = parser.parse_args()
+
+    manifest_path = src / MANIFEST
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+    inputs = {name: digest((src / name).read_bytes()) for name in INPUTS}
+    inputs['brotli'] = brotli is not None
+    outputs = manifest.get('outputs', {})
+    if not args.force and manifest.get('inputs') == inputs and outputs and all(
+            (src / name).exists() and digest((src / name).read_bytes()) == hashed
+            for name, hashed in outputs.items()):
+        print(f'{OUTPUT} is up to date')
+        sys.exit(0 if report(manifest['sizes']) else 1)
+
+    html, sources, parts = bundle()
+    sizes = {}
+    for name, part in parts.items():
+        data = part.encode()
+        sizes[name] = (len(sources[name].encode()), len(data), len(gz(data)),
+                       len(brotli.compress(data)) if brotli else None)
+
+    out = src / OUTPUT
+    data = html.encode()
+    files = {OUTPUT: data, f'{OUTPUT}.gz': gz(data)}
+    if brotli:
+        files[f'{OUTPUT}.br'] = brotli.compress(data, mode=brotli.MODE_TEXT)
+    else:
+        # Don't leave an old one to be served with the new page
+        (src / f'{OUTPUT}.br').unlink(missing_ok=True)
+        print('No brotli module, so no .br: pip install brotli')
+    for name, contents in files.items():
+        (src / name).write_bytes(contents)
+    manifest = {'inputs': inputs, 'outputs': {n: digest(c) for n, c in files.items()},
+                'sizes': sizes}
+    manifest_path.write_text(json.dumps(manifest, indent=1) + '\n')
+
+    print(f'Built → {out}')
+    sys.exit(0 if report(sizes) else 1)
 
-html = html.replace('</head>', shim + '</head>', 1)
 
-# ── Write output ──────────────────────────────────────────────────────────
-out = src / 'index-bundle.html'
-out.write_text(html)
-print(f'Built → {out}')
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Convert an animator JSON export into the cube's binary animation format.
+Output: animations.bin (next to the input unless -o is given)
+
+The cube loads animations.bin with a few readinto() calls instead of parsing
+JSON, which is the slowest part of its boot. Copy both files to CIRCUITPY:
+the cube falls back to animations.json if the binary is missing, invalid or
+older than the JSON.
+
+With --library DIR, each animation goes into its own file in DIR along with
+an index, for a cube carrying more animations than fit in its RAM: copy DIR
+to CIRCUITPY as animations/ and the cube loads each one only when it's
+picked.
+"""
+
+import argparse
+import json
+import re
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'code'))
+
+from lib.animfile import (FRAME_MASK, MAX_DEPTH, MAX_FRAME_HOLD,  # noqa: E402
+                          delta_animation, pack_animations, write_binary)
+from lib.library import FILE_NAME_SIZE, list_files, write_index  # noqa: E402
+from lib.timing import KEYS as TIMING_KEYS, Timing, merge  # noqa: E402
+from lib.transform import check_spec  # noqa: E402
+from lib.voxel import check_params  # noqa: E402
+
+
+def validate(raw):
+    """Return a list of problems with a parsed animations.json."""
+    problems = []
+    if not isinstance(raw, list) or not raw:
+        return ['expected a non-empty list of animations']
+    for i, anim in enumerate(raw):
+        where = f'animation {i} ({anim.get("name", "?")!r})'
+        if not isinstance(anim.get('name'), str):
+            problems.append(f'{where}: missing name')
+        if not isinstance(anim.get('framerate'), int) or not 1 <= anim['framerate'] <= 0xFFFF:
+            problems.append(f'{where}: framerate must be a whole number of frames per second')
+        depth = anim.get('depth', 1)
+        frames = anim.get('frames')
+        if any(key in anim for key in ('generator', 'base', 'composite')):
+            # Checked against the whole library once it's been packed
+            if 'generator' in anim:
+                try:
+                    check_params(anim['generator'], anim.get('params'))
+                except ValueError as e:
+                    problems.append(f'{where}: {e}')
+            elif 'params' in anim:
+                problems.append(f'{where}: only generators take params')
+        elif not isinstance(depth, int) or not 1 <= depth <= MAX_DEPTH:
+            problems.append(f'{where}: depth must be 1 to {MAX_DEPTH} bits per LED')
+        elif not isinstance(frames, list) or not frames:
+            problems.append(f'{where}: no frames')
+        elif depth == 1:
+            if any(not isinstance(f, int) or f & ~FRAME_MASK for f in frames):
+                problems.append(f'{where}: frames must be 27-bit integers')
+        elif any(not isinstance(f, list) or len(f) != 27
+                 or any(not isinstance(v, int) or not 0 <= v < 1 << depth for v in f)
+                 for f in frames):
+            problems.append(f'{where}: frames must be lists of 27 levels from 0 to {(1 << depth) - 1}')
+        holds = anim.get('holds')
+        if holds is not None and (
+                not isinstance(holds, list) or len(holds) != len(frames or ())
+                or any(not isinstance(h, int) or not 1 <= h <= MAX_FRAME_HOLD for h in holds)):
+            problems.append(f'{where}: holds must give each frame a whole number '
+                            f'of frame periods from 1 to {MAX_FRAME_HOLD}')
+        timing = anim.get('timing')
+        if timing is not None:
+            if not isinstance(timing, dict) or not timing or set(timing) - set(TIMING_KEYS):
+                problems.append(f'{where}: timing must be an object with any of '
+                                f'{", ".join(TIMING_KEYS)}')
+            else:
+                # Checked against the default profile: the cube's own
+                # timing.json may change what's possible
+                try:
+                    Timing(**merge(timing))
+                except ValueError as e:
+                    problems.append(f'{where}: timing: {e}')
+    return problems
+
+
+def file_name(anim, taken):
+    """A file name for anim's own file in a library directory."""
+    stem = re.sub(r'[^a-z0-9]+', '-', anim.name.lower()).strip('-') or 'animation'
+    stem = stem[:FILE_NAME_SIZE - len('.bin') - 4]
+    name = f'{stem}.bin'
+    n = 1
+    while name in taken:
+        n += 1
+        name = f'{stem}-{n}.bin'
+    taken.add(name)
+    return name
+
+
+def write_library(directory, animations):
+    """Write each animation to its own file in directory, then the index."""
+    directory.mkdir(parents=True, exist_ok=True)
+    taken = set(list_files(str(directory)))
+    for anim in animations:
+        with open(directory / file_name(anim, taken), 'wb') as f:
+            write_binary(f, [anim])
+    for problem in write_index(str(directory)):
+        print(f'{directory}/{problem}, left out of the index')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('json', type=Path, help='animations.json from the animator')
+    parser.add_argument('-o', '--output', type=Path, help='output file (default: animations.bin)')
+    parser.add_argument('--delta', action='store_true',
+                        help='delta/run-length encode animations where that makes them smaller')
+    parser.add_argument('--library', type=Path, metavar='DIR',
+                        help='add each animation to the library directory DIR instead')
+    args = parser.parse_args()
+
+    raw = json.loads(args.json.read_text())
+    problems = validate(raw)
+    if problems:
+        sys.exit('\n'.join(problems))
+
+    animations = pack_animations(raw)
+    library = {anim.name: anim for anim in animations}
+    for anim in animations:
+        try:
+            check_spec(anim, library)
+        except ValueError as e:
+            problems.append(f'{anim.name!r}: {e}')
+    if problems:
+        sys.exit('\n'.join(problems))
+
+    if args.delta:
+        for i, anim in enumerate(animations):
+            encoded = delta_animation(anim)
+            if encoded is not None:
+                print(f'{anim.name}: {anim.nbytes} → {encoded.nbytes} bytes delta-encoded')
+                animations[i] = encoded
+    if args.library:
+        write_library(args.library, animations)
+        print(f'Added {len(animations)} animations to {args.library}')
+        return
+
+    out = args.output or args.json.with_name('animations.bin')
+    with open(out, 'wb') as f:
+        write_binary(f, animations)
+
+    frames = sum(a.num_frames for a in animations)
+    print(f'Converted {len(animations)} animations ({frames} frames) → {out} '
+          f'({out.stat().st_size} bytes, JSON was {args.json.stat().st_size})')
+
+
+if __name__ == '__main__':
+    main()
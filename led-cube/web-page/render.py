@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""
+Render animations.json files to animated GIFs and sprite sheets.
+Every animation becomes NAME.gif, playing at its own framerate, and
+NAME.png, a sheet of its frames in order, showing the cube from above and
+to one side as the animator numbers it: LED 1 at the back left of the
+bottom layer. Animations made from a generator or other animations are
+rendered for --seconds of play.
+
+Animations are rendered in parallel, one per process. renders.json in the
+output directory records what every file was rendered from, so running it
+again only renders animations that have changed. Needs NumPy and Pillow
+(pip install numpy pillow).
+
+    python3 web-page/render.py animations.json -o renders
+    python3 web-page/render.py submissions/*.json -o renders --size 48
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+try:
+    import numpy as np
+    from PIL import Image, ImageDraw
+except ImportError:
+    sys.exit('render.py needs NumPy and Pillow: pip install numpy pillow')
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'code'))
+
+from convert import validate  # noqa: E402
+from lib.animfile import pack_animations  # noqa: E402
+from lib.transform import Composite, TransformSource, check_spec, transform_for  # noqa: E402
+from lib.voxel import Procedural  # noqa: E402
+
+# Bump when the pictures change, so cached renders are redone
+RENDER_VERSION = 1
+
+BACKGROUND = (0x0d, 0x11, 0x17)
+WIRE = (0x30, 0x36, 0x3d)
+# The animator's colours for a lit and an unlit LED
+ON = (0xff, 0x33, 0x33)
+OFF = (0x3d, 0x08, 0x08)
+
+# Screen steps, in LED spacings, for one LED along each axis: left to right,
+# back to front and up a layer. Not quite isometric, so that no LED hides
+# another (in a true isometric view the corners of the cube line up).
+AXES = np.array([[0.9, 0.2], [-0.7, 0.42], [0.0, -1.0]])
+RADIUS = 0.17
+# Pixels are worked out at this many times the size, then averaged down
+SUPERSAMPLE = 4
+
+# GIF frame times are in hundredths of a second, and browsers slow down
+# frames shorter than 20 ms, so faster frames are dropped to keep time
+GIF_TICK_MS = 10
+GIF_MIN_MS = 20
+
+# Frames on a sprite sheet, at most; longer animations show their first ones
+MAX_SHEET_FRAMES = 1024
+
+MANIFEST = 'renders.json'
+
+
+################################################
+# Frames
+################################################
+
+class Looped:
+    """Frame source playing on/off frames, with their holds, over and over."""
+
+    num_frames = 0
+
+    def __init__(self, frames, holds):
+        self.frames = frames
+        self.holds = holds
+        self.index = 0
+        self.left = 0
+
+    def next_frame(self):
+        if self.left == 0:
+            self.left = int(self.holds[self.index])
+            self.index = (self.index + 1) % len(self.frames)
+        self.left -= 1
+        return int(self.frames[self.index - 1])
+
+
+def finite(anim, library):
+    """True if anim repeats after a whole number of frames: not a generator or composite."""
+    spec = anim.spec
+    return spec is None or ('base' in spec and finite(library[spec['base']], library))
+
+
+def loop(anim, library):
+    """Bit-planes, an (n, depth) array, and holds for one loop of a finite animation."""
+    if anim.spec is None:
+        planes = np.array(anim.frames, dtype=np.uint32).reshape(-1, anim.depth)
+        holds = np.ones(len(planes), dtype=np.int64) if anim.holds is None \
+            else np.array(anim.holds, dtype=np.int64)
+        return planes, holds
+    planes, holds = loop(library[anim.spec['base']], library)
+    apply = transform_for(anim.spec.get('transform', {})).apply
+    transformed = np.array([apply(int(plane)) for plane in planes.ravel()], dtype=np.uint32)
+    return transformed.reshape(planes.shape), holds
+
+
+def source_for(anim, library):
+    """Frame source for any animation, like code.py's, from the top bit-plane."""
+    spec = anim.spec
+    if spec is None:
+        planes, holds = loop(anim, library)
+        return Looped(planes[:, -1], holds)
+    if 'generator' in spec:
+        return Procedural(spec['generator'], spec.get('params'))
+    if 'base' in spec:
+        return TransformSource(source_for(library[spec['base']], library),
+                               transform_for(spec.get('transform', {})))
+    layers = [library[name] for name in spec['layers']]
+    return Composite(spec['composite'], [source_for(a, library) for a in layers],
+                     [a.framerate for a in layers], anim.framerate)
+
+
+def sequence(anim, library, seconds):
+    """Bit-planes and holds to render: one loop, or `seconds` of an endless animation."""
+    if finite(anim, library):
+        return loop(anim, library)
+    # Generators draw on random, so the same animation renders the same each time
+    random.seed(0)
+    source = source_for(anim, library)
+    count = max(1, round(seconds * anim.framerate))
+    frames = np.array([source.next_frame() for _ in range(count)], dtype=np.uint32)
+    # Runs of the same frame become one held frame
+    starts = np.flatnonzero(np.diff(frames, prepend=frames[0] ^ 1))
+    return frames[starts, None], np.diff(np.append(starts, len(frames)))
+
+
+def brightness(planes):
+    """Every LED's brightness from 0 to 1, an (n, 27) array in animator order.
+
+    Bit b of a plane is LED 27 - b, so reversing the bits gives LED 1 first.
+    """
+    depth = planes.shape[1]
+    bits = (planes[:, :, None] >> np.arange(26, -1, -1, dtype=np.uint32)) & 1
+    levels = (bits << np.arange(depth, dtype=np.uint32)[:, None]).sum(axis=1)
+    return levels.astype(np.float32) / ((1 << depth) - 1)
+
+
+################################################
+# Pictures
+################################################
+
+class Canvas:
+    """What every LED covers in the picture, for drawing frames all at once.
+
+    `coverage` has, for each LED, how much of every pixel it covers; the
+    rest of a pixel shows `backdrop`, the wiring on the background.
+    """
+
+    def __init__(self, size):
+        # LED n - 1 is in layer p // 9, row (p % 9) // 3 from the back, column p % 3
+        p = np.arange(27)
+        grid = np.stack([p % 3, (p % 9) // 3, p // 9], axis=1)
+        centres = grid @ AXES
+        corner = centres.min(axis=0) - RADIUS - 0.25
+        extent = centres.max(axis=0) + RADIUS + 0.25 - corner
+        self.width, self.height = (int(e) for e in np.ceil(extent * size))
+        centres = (centres - corner) * size * SUPERSAMPLE
+
+        big = (self.width * SUPERSAMPLE, self.height * SUPERSAMPLE)
+        wires = Image.new('RGB', big, BACKGROUND)
+        draw = ImageDraw.Draw(wires)
+        for i in range(27):
+            for step in (1, 3, 9):
+                # Along each axis to the next LED, if there is one
+                if (i // step) % 3 < 2:
+                    draw.line([tuple(centres[i]), tuple(centres[i + step])], fill=WIRE,
+                              width=max(1, round(size * SUPERSAMPLE / 32)))
+        self.backdrop = self.shrink(np.asarray(wires, dtype=np.float32))
+
+        y, x = np.mgrid[0:big[1], 0:big[0]] + 0.5
+        r = RADIUS * size * SUPERSAMPLE
+        discs = np.stack([(x - cx) ** 2 + (y - cy) ** 2 <= r * r for cx, cy in centres])
+        self.coverage = self.shrink(discs.astype(np.float32)).reshape(27, -1)
+        rest = 1 - self.coverage.sum(axis=0)
+        self.base = self.backdrop.reshape(-1, 3) * rest[:, None] \
+            + np.outer(self.coverage.sum(axis=0), OFF)
+
+    def shrink(self, pixels):
+        """Average SUPERSAMPLE x SUPERSAMPLE blocks of the last two (or three) axes."""
+        rgb = pixels.shape[-1] == 3
+        shape = pixels.shape[:-3 if rgb else -2] \
+            + (self.height, SUPERSAMPLE, self.width, SUPERSAMPLE) + ((3,) if rgb else ())
+        axes = (-4, -2) if rgb else (-3, -1)
+        return pixels.reshape(shape).mean(axis=axes)
+
+    def draw(self, lit):
+        """Pictures of frames from their LEDs' brightness, an (n, height, width, 3) array."""
+        glow = lit @ self.coverage
+        pixels = self.base + glow[:, :, None] * (np.array(ON, dtype=np.float32) - OFF)
+        return np.rint(pixels).astype(np.uint8).reshape(len(lit), self.height, self.width, 3)
+
+
+def gif_timing(holds, framerate):
+    """Which frames a GIF shows, and for how many ms each.
+
+    Frame ends are rounded to the GIF's 10 ms steps from the start, so the
+    animation keeps time however long it runs; a frame that would get less
+    than 20 ms is dropped in favour of the one after it.
+    """
+    ticks = np.rint(np.cumsum(holds) * 1000 / framerate / GIF_TICK_MS).astype(np.int64)
+    ends = ticks * GIF_TICK_MS
+    shown = []
+    durations = []
+    start = 0
+    for i, end in enumerate(ends):
+        if end - start >= GIF_MIN_MS:
+            shown.append(i)
+            durations.append(int(end - start))
+            start = end
+    if not shown:
+        return [len(holds) - 1], [max(GIF_MIN_MS, int(ends[-1]))]
+    durations[-1] += int(ends[-1] - start)
+    return shown, durations
+
+
+def sheet(pictures, columns):
+    """Pictures in rows of `columns`, with a gap between them."""
+    n, height, width, _ = pictures.shape
+    columns = min(columns, n)
+    rows = -(-n // columns)
+    gap = max(1, width // 16)
+    out = np.empty((rows * (height + gap) + gap, columns * (width + gap) + gap, 3), dtype=np.uint8)
+    out[:] = WIRE
+    for i, picture in enumerate(pictures):
+        row, column = divmod(i, columns)
+        y = gap + row * (height + gap)
+        x = gap + column * (width + gap)
+        out[y:y + height, x:x + width] = picture
+    return Image.fromarray(out)
+
+
+_canvases = {}
+
+
+def render(anim, library, settings, gif, png):
+    """Write anim's GIF and sprite sheet; a line for the report."""
+    started = time.perf_counter()
+    size = settings['size']
+    if size not in _canvases:
+        _canvases[size] = Canvas(size)
+    canvas = _canvases[size]
+
+    planes, holds = sequence(anim, library, settings['seconds'])
+    shown, durations = gif_timing(holds, anim.framerate)
+    pictures = canvas.draw(brightness(planes))
+
+    # One palette for every frame, worked out once from all of them together
+    _, height, width, _ = pictures.shape
+    stack = Image.fromarray(pictures[shown].reshape(-1, width, 3)).quantize(
+        method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+    frames = [stack.crop((0, i * height, width, (i + 1) * height)) for i in range(len(shown))]
+    frames[0].save(gif, save_all=True, append_images=frames[1:], duration=durations,
+                   loop=0, disposal=1)
+    sheet(pictures[:MAX_SHEET_FRAMES], settings['columns']).quantize(
+        palette=stack, dither=Image.Dither.NONE).save(png)
+
+    played = int(holds.sum()) / anim.framerate
+    note = f', sheet has the first {MAX_SHEET_FRAMES}' if len(planes) > MAX_SHEET_FRAMES else ''
+    dropped = len(planes) - len(shown)
+    note += f', {dropped} frames too short for a GIF' if dropped else ''
+    return (f'{anim.name}: {len(planes)} frames, {played:.2f} s at {anim.framerate} fps'
+            f'{note} ({time.perf_counter() - started:.2f} s)')
+
+
+################################################
+# Batches
+################################################
+
+def content_hash(entry, entries, settings):
+    """Hash of everything an animation's pictures depend on.
+
+    That's its own entry, those of any animations it's made from, and the
+    render settings; the name only matters for the file the pictures go in.
+    """
+    used = {}
+    todo = [entry]
+    while todo:
+        e = todo.pop()
+        if e['name'] in used:
+            continue
+        used[e['name']] = {k: v for k, v in e.items() if e is not entry or k != 'name'}
+        todo += [entries[n] for n in [e.get('base')] + e.get('layers', []) if n in entries]
+    text = json.dumps([RENDER_VERSION, settings, sorted(used.items())], sort_keys=True,
+                      separators=(',', ':'))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def file_stem(name):
+    """A file name for an animation: its name with anything awkward replaced."""
+    return re.sub(r'[^\w.-]+', '-', name).strip('-.') or 'animation'
+
+
+def load(path):
+    """Animations in a file, by name, with their JSON entries; exits if it has problems."""
+    raw = json.loads(path.read_text())
+    problems = validate(raw)
+    if problems:
+        sys.exit('\n'.join(f'{path}: {p}' for p in problems))
+    entries = {entry['name']: entry for entry in raw}
+    library = {anim.name: anim for anim in pack_animations(list(raw))}
+    for anim in library.values():
+        try:
+            check_spec(anim, library)
+        except ValueError as e:
+            problems.append(f'{path}: {anim.name!r}: {e}')
+    if problems:
+        sys.exit('\n'.join(problems))
+    return entries, library
+
+
+def used_by(anim, library):
+    """anim and every animation it's made from, by name: all a worker needs."""
+    used = {}
+    todo = [anim]
+    while todo:
+        a = todo.pop()
+        if a.name not in used:
+            used[a.name] = a
+            if a.spec is not None:
+                todo += [library[n] for n in [a.spec.get('base')] + a.spec.get('layers', [])
+                         if n in library]
+    return used
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('json', type=Path, nargs='+', help='animations.json files')
+    parser.add_argument('-o', '--output', type=Path, default=Path('renders'),
+                        help='directory for the pictures (default: renders)')
+    parser.add_argument('--size', type=int, default=32,
+                        help='pixels from one LED to the next (default: 32)')
+    parser.add_argument('--seconds', type=float, default=10,
+                        help='how long to render endless animations for (default: 10)')
+    parser.add_argument('--columns', type=int, default=16,
+                        help='frames across a sprite sheet (default: 16)')
+    parser.add_argument('--name', action='append',
+                        help='only render this animation (can be given more than once)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='processes to render in (default: one per CPU)')
+    parser.add_argument('--force', action='store_true', help='render everything again')
+    args = parser.parse_args()
+
+    settings = {'size': args.size, 'seconds': args.seconds, 'columns': args.columns}
+    args.output.mkdir(parents=True, exist_ok=True)
+    manifest_path = args.output / MANIFEST
+    manifest = {} if args.force or not manifest_path.exists() \
+        else json.loads(manifest_path.read_text())
+
+    # Animations from more than one file go in a directory per file
+    tasks = []
+    cached = 0
+    for path in args.json:
+        entries, library = load(path)
+        directory = args.output / path.stem if len(args.json) > 1 else args.output
+        directory.mkdir(exist_ok=True)
+        taken = set()
+        for name, anim in library.items():
+            stem = file_stem(name)
+            while stem in taken:
+                stem += '_'
+            taken.add(stem)
+            if args.name and name not in args.name:
+                continue
+            gif = directory / f'{stem}.gif'
+            png = directory / f'{stem}.png'
+            key = str(gif.relative_to(args.output))
+            # How long endless animations run for doesn't change the others
+            used = settings if not finite(anim, library) \
+                else {k: v for k, v in settings.items() if k != 'seconds'}
+            digest = content_hash(entries[name], entries, used)
+            if manifest.get(key, {}).get('hash') == digest and gif.exists() and png.exists():
+                cached += 1
+                continue
+            manifest[key] = {'name': name, 'source': str(path), 'hash': digest,
+                             'sheet': str(png.relative_to(args.output))}
+            tasks.append((key, anim, used_by(anim, library), gif, png))
+
+    started = time.perf_counter()
+    failed = []
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {pool.submit(render, anim, used, settings, gif, png): key
+                   for key, anim, used, gif, png in tasks}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                print(future.result())
+            except Exception as e:
+                # Report it and carry on with the rest
+                print(f'{manifest[key]["name"]}: failed: {e}', file=sys.stderr)
+                failed.append(key)
+                del manifest[key]
+    manifest_path.write_text(json.dumps(manifest, indent=1, sort_keys=True) + '\n')
+
+    print(f'Rendered {len(tasks) - len(failed)} animations in '
+          f'{time.perf_counter() - started:.1f} s; {cached} unchanged')
+    if failed:
+        sys.exit(f'{len(failed)} failed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Stream animation frames live to the LED cube over USB.
+Plays an animation from animations.json, or a procedural generator, on the
+cube straight from the computer: no copying to CIRCUITPY, no reload.
+
+The cube's second serial port (turned on by boot.py) is the one to use, e.g.
+/dev/ttyACM1 on Linux, /dev/cu.usbmodem...3 on a Mac or the higher-numbered
+COM port on Windows (pyserial needed there). --pty streams to a simulated
+cube on a pseudo-terminal instead, to try it out without one.
+
+When it stops it reports the round-trip latency from sending each frame to
+the cube reporting it on the LEDs, and how many frames were dropped.
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'code'))
+
+from lib.animfile import pack_animations  # noqa: E402
+from lib.livestream import (ACK, FRAME, FRAME_SIZE, MAX_FPS,  # noqa: E402
+                            PacketReader, Receiver, pack_into)
+from lib.voxel import GENERATORS  # noqa: E402
+
+# The simulated cube's refresh period, the same as the real one's
+REFRESH_S = 1 / 98.1
+
+
+def open_port(path):
+    """Open a serial port for non-blocking reads and writes."""
+    try:
+        import serial
+    except ImportError:
+        import tty
+        fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        tty.setraw(fd)
+        return RawPort(fd)
+    return serial.Serial(path, timeout=0)
+
+
+class RawPort:
+    """Just enough of a pyserial Serial on a POSIX file descriptor."""
+
+    def __init__(self, fd):
+        self.file = io.FileIO(fd, 'r+b')
+
+    def readinto(self, buf):
+        return self.file.readinto(buf) or 0
+
+    def write(self, data):
+        try:
+            return self.file.write(data)
+        except BlockingIOError:
+            return 0
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.file.close()
+
+
+class SimulatedCube:
+    """The cube's end of a live stream on the other side of a pty.
+
+    Runs the same Receiver as the cube. A queued frame reaches the LEDs at
+    the end of the refresh that's under way, as it does through rp2pio.
+    """
+
+    def __init__(self):
+        import tty
+        self.master, slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(slave)
+        self.path = os.ttyname(slave)
+        self.slave = slave
+        os.set_blocking(self.master, False)
+        self.port = RawPort(self.master)
+        self.start = time.monotonic()
+        self.swap_at = 0
+        self.receiver = Receiver(self.port, self.show, self.busy)
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def show(self, frame):
+        if self.busy():
+            return False
+        now = time.monotonic() - self.start
+        self.swap_at = (now // REFRESH_S + 1) * REFRESH_S
+        return True
+
+    def busy(self):
+        return time.monotonic() - self.start < self.swap_at
+
+    def run(self):
+        while self.running:
+            self.receiver.poll()
+            time.sleep(0.001)
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        self.port.close()
+        os.close(self.slave)
+
+
+def frame_source(args):
+    """Framerate and an endless iterator of frames for the command line."""
+    if args.generator:
+        if args.generator not in GENERATORS:
+            sys.exit(f'no generator called {args.generator!r}: '
+                     f'try {", ".join(GENERATORS)}')
+        return args.fps or 8, GENERATORS[args.generator](**json.loads(args.params))
+
+    animations = pack_animations(json.loads(args.json.read_text()))
+    if args.name:
+        matches = [a for a in animations if a.name == args.name]
+        if not matches:
+            sys.exit(f'no animation called {args.name!r}')
+        anim = matches[0]
+    else:
+        anim = animations[0]
+    framerate = args.fps or anim.framerate
+    if anim.spec is not None:
+        if 'generator' not in anim.spec:
+            sys.exit(f'{anim.name!r} is made from other animations: play it on the cube')
+        return framerate, GENERATORS[anim.spec['generator']](**anim.spec.get('params', {}))
+    # Grayscale animations are streamed as their most significant bit-plane,
+    # and a frame held for several frame periods is sent that many times
+    planes = anim.frames[anim.depth - 1::anim.depth]
+    holds = anim.holds if anim.holds is not None else [1] * len(planes)
+
+    def loop():
+        while True:
+            for plane, hold in zip(planes, holds):
+                for _ in range(hold):
+                    yield plane
+    return framerate, loop()
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.lost = 0
+        self.coalesced = 0
+        self.sent = 0
+        self.late_sends = 0
+
+    def add_ack(self, ack, now_us):
+        _, seq, stamp, lost, coalesced, _ = ack
+        self.latencies.append(((now_us - stamp) & 0xFFFFFFFF) / 1000)
+        self.lost = lost
+        self.coalesced = coalesced
+
+    def report(self):
+        shown = len(self.latencies)
+        print(f'{self.sent} frames sent, {shown} shown, '
+              f'{self.sent - shown} dropped ({self.lost} lost in transit, '
+              f'{self.coalesced} replaced by a newer frame, '
+              f'{self.sent - shown - self.lost - self.coalesced} unacknowledged)')
+        if self.late_sends:
+            print(f'{self.late_sends} frames sent over a frame late by this computer')
+        if not shown:
+            return
+        ms = sorted(self.latencies)
+        print(f'send → on the LEDs → ack: min {ms[0]:.1f} ms, '
+              f'mean {sum(ms) / shown:.1f} ms, '
+              f'median {ms[shown // 2]:.1f} ms, '
+              f'p99 {ms[min(shown - 1, shown * 99 // 100)]:.1f} ms, '
+              f'max {ms[-1]:.1f} ms')
+
+
+def stream(port, framerate, frames, seconds):
+    """Send frames on absolute deadlines, collecting acks as they come."""
+    stats = Stats()
+    acks = PacketReader(ACK, 64)
+    packet = bytearray(FRAME_SIZE)
+    start_ns = time.monotonic_ns()
+    period_ns = 1_000_000_000 // framerate
+    deadline = start_ns
+    end = start_ns + int(seconds * 1e9) if seconds else None
+    seq = 0
+    try:
+        for frame in frames:
+            now = time.monotonic_ns()
+            if end is not None and now >= end:
+                break
+            if now - deadline > period_ns:
+                stats.late_sends += 1
+            now_us = (now - start_ns) // 1000
+            pack_into(FRAME, packet, seq, frame & 0x7FFFFFF, now_us & 0xFFFFFFFF)
+            port.write(packet)
+            port.flush()
+            stats.sent += 1
+            seq = (seq + 1) & 0xFFFF or 1
+            deadline += period_ns
+            while True:
+                now = time.monotonic_ns()
+                for ack in acks.read(port):
+                    stats.add_ack(ack, (now - start_ns) // 1000)
+                if now >= deadline:
+                    break
+                time.sleep(min(0.001, (deadline - now) / 1e9))
+    except KeyboardInterrupt:
+        pass
+    # Give the last few frames time to reach the LEDs and be acknowledged
+    wait_until = time.monotonic_ns() + 200_000_000
+    while time.monotonic_ns() < wait_until:
+        for ack in acks.read(port):
+            stats.add_ack(ack, (time.monotonic_ns() - start_ns) // 1000)
+        time.sleep(0.001)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('json', type=Path, nargs='?', help='animations.json from the animator')
+    parser.add_argument('--name', help='animation to play (default: the first)')
+    parser.add_argument('--generator', help='stream a procedural generator instead, e.g. rain')
+    parser.add_argument('--params', default='{}', help='generator parameters as JSON')
+    parser.add_argument('--fps', type=int, help='override the framerate')
+    parser.add_argument('--seconds', type=float, help='stop after this long (default: Ctrl-C)')
+    where = parser.add_mutually_exclusive_group(required=True)
+    where.add_argument('--port', help="the cube's data serial port")
+    where.add_argument('--pty', action='store_true', help='stream to a simulated cube')
+    args = parser.parse_args()
+    if not args.json and not args.generator:
+        parser.error('give an animations.json or a --generator')
+
+    framerate, frames = frame_source(args)
+    if not 1 <= framerate <= MAX_FPS:
+        sys.exit(f'framerate must be 1 to {MAX_FPS}, the cube\'s refresh rate')
+
+    cube = None
+    if args.pty:
+        cube = SimulatedCube()
+        args.port = cube.path
+        print(f'simulated cube on {cube.path}')
+    port = open_port(args.port)
+    print(f'streaming at {framerate} fps to {args.port}' +
+          ('' if args.seconds else ', Ctrl-C to stop'))
+    try:
+        stats = stream(port, framerate, frames, args.seconds)
+    finally:
+        port.close()
+        if cube is not None:
+            cube.close()
+    stats.report()
+
+
+if __name__ == '__main__':
+    main()
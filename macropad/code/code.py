@@ -16,7 +16,9 @@ https://github.com/livewires/electronics
 import digitalio as io
 import board
 import time
+import keypad
 import rotaryio
+import supervisor
 from adafruit_hid.keycode import Keycode
 
 import usb_hid
@@ -81,6 +83,20 @@ class Leds():
             
 
 class Buttons():
+    """
+    The buttons are scanned and debounced in the background by keypad, which
+    queues an event, with the time it happened, for every press and release.
+    So a press is never missed or doubled by switch bounce, however busy the
+    main loop is.
+    """
+    # How often the buttons are scanned, and how many scans in a row a
+    # button has to read the same before a press or release counts. Switch
+    # contacts chatter for under a millisecond at a time while they bounce,
+    # so this is 3-4 ms from pressing to the event. Fewer scans send some
+    # presses twice.
+    SCAN_INTERVAL = 0.001
+    DEBOUNCE_SCANS = 3
+
     def __init__(self):
         pin_nums = [
             board.GP6,  # 1
@@ -94,35 +110,36 @@ class Buttons():
             board.GP5,  # Next Page
             board.GP2,  # Encoder push
         ]
-        self.buttons = [io.DigitalInOut(i) for i in pin_nums]
-        for b in self.buttons:
-            b.direction = io.Direction.INPUT
-            b.pull = io.Pull.UP
-            
-        self.last_values = self.get_all()
-            
-    def get_all(self):
-        # Converts the inputs to an integer with 1 set if the button is pressed
-        # Note inputs come in logically inverted (a press means the bit is 0!)
-        return sum([int(not b.value) << i for i, b in enumerate(self.buttons)])
-    
-    def get_changes(self):
-        ''' Returns a tuple of (all changes bits, rising edges that have occurred,
-        falling edges that have occurred)'''
-        new_values = self.get_all()
-        changes = new_values ^ self.last_values
-        r = changes & new_values
-        f = changes & ~new_values
-        self.last_values = new_values
-        return changes, r, f
-    
+        # Pressing a button connects its pin to ground
+        self.keys = keypad.Keys(pin_nums, value_when_pressed=False, pull=True,
+                                interval=self.SCAN_INTERVAL,
+                                debounce_threshold=self.DEBOUNCE_SCANS)
+        self.count = len(pin_nums)
+        # Reused for every event, so reading them doesn't allocate
+        self.event = keypad.Event()
+
+    def get_event(self):
+        ''' Returns the next press or release, or None if there isn't one.
+        The same Event object comes back every time, so use it before
+        calling this again.'''
+        if self.keys.events.get_into(self.event):
+            return self.event
+        return None
+
+    def overflowed(self):
+        ''' True if events have been lost because the queue filled up. The
+        queue is cleared, and the buttons currently held get reported again
+        as new presses.'''
+        if not self.keys.events.overflowed:
+            return False
+        self.keys.events.clear()
+        self.keys.reset()
+        return True
+
     def __len__(self):
-        return len(self.buttons)
-    
-    def edges_to_list(self, edges):
-        return [i for i in range(len(self.buttons)) if (edges & (1 << i))]
-    
-    
+        return self.count
+
+
 class Encoder():
     def __init__(self):
         self.encoder = rotaryio.IncrementalEncoder(board.GP4, board.GP3)
@@ -329,32 +346,91 @@ time.sleep(0.3)
 
 dm.show_page(pm.current_page)
 
+# When there's nothing to do, the loop sleeps this long (in seconds) before
+# looking again, rather than spinning. Button events wait in the queue, so
+# it only adds at most this much to how long a press takes to be sent.
+IDLE_SLEEP = 0.001
+
+# Set TIMING to True to print, every TIMING_PERIOD_MS, how long button
+# presses and releases took from the switch to being sent (and the screen updated), and
+# how much of the time the main loop was busy rather than asleep. Thonny
+# shows the lines in its Shell.
+TIMING = False
+TIMING_PERIOD_MS = 10000
+
+TICKS_PERIOD = 1 << 29  # supervisor.ticks_ms() wraps around at this
+
+
+class Timing():
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.start_ms = supervisor.ticks_ms()
+        self.start_ns = time.monotonic_ns()
+        self.presses = 0
+        self.total_ms = 0
+        self.worst_ms = 0
+        self.loops = 0
+        self.busy_ns = 0
+
+    def handled(self, timestamp):
+        # How long since keypad saw the press or release
+        ms = (supervisor.ticks_ms() - timestamp) % TICKS_PERIOD
+        self.presses += 1
+        self.total_ms += ms
+        self.worst_ms = max(self.worst_ms, ms)
+
+    def loop(self, busy_ns):
+        self.loops += 1
+        self.busy_ns += busy_ns
+        if (supervisor.ticks_ms() - self.start_ms) % TICKS_PERIOD < TIMING_PERIOD_MS:
+            return
+        elapsed_ns = time.monotonic_ns() - self.start_ns
+        average = self.total_ms / self.presses if self.presses else 0
+        print("{} presses/releases, {:.1f} ms on average, {} ms at worst; {} loops, "
+              "{:.0f} us each, busy {:.1f}% of the time".format(
+                  self.presses, average, self.worst_ms, self.loops,
+                  self.busy_ns / self.loops / 1000, 100 * self.busy_ns / elapsed_ns))
+        self.reset()
+
+
+timing = Timing() if TIMING else None
+
 try:
     while True:
         try:
-            _, pushed, released = buttons.get_changes()
-            pushed = buttons.edges_to_list(pushed)
-            # Ignore releasing the encoder and next page buttons
-            released = buttons.edges_to_list(released & 0xFF)
-            
-            if 8 in pushed:
-                # Next page button pressed
-                pm.next_page()
-                leds.show(pm.current_index)
-                dm.show_page(pm.current_page)
-                pushed.remove(8)
-                
-            if 9 in pushed:
-                # Encoder pressed
-                cctl.send(rotary_press_function)
-                pushed.remove(9)
-                
-            for k in pushed:
-                pm.press(k)
-                
-            for k in released:
-                pm.release(k)
-            
+            if TIMING:
+                start_ns = time.monotonic_ns()
+            busy = False
+
+            if buttons.overflowed():
+                # Some releases may have been lost: let go of everything,
+                # and the buttons still held will be pressed again
+                kbd.release_all()
+
+            event = buttons.get_event()
+            while event is not None:
+                busy = True
+                k = event.key_number
+                if event.pressed:
+                    if k == 8:
+                        # Next page button pressed
+                        pm.next_page()
+                        leds.show(pm.current_index)
+                        dm.show_page(pm.current_page)
+                    elif k == 9:
+                        # Encoder pressed
+                        cctl.send(rotary_press_function)
+                    else:
+                        pm.press(k)
+                elif k < 8:
+                    # Ignore releasing the encoder and next page buttons
+                    pm.release(k)
+                if TIMING:
+                    timing.handled(event.timestamp)
+                event = buttons.get_event()
+
             # Handle encoder changes
             d = encoder.get_delta()
             while d:
@@ -364,6 +440,12 @@ try:
                 if d < 0:
                     cctl.send(ConsumerControlCode.VOLUME_DECREMENT)
                     d += 1
+                busy = True
+
+            if TIMING:
+                timing.loop(time.monotonic_ns() - start_ns)
+            if not busy:
+                time.sleep(IDLE_SLEEP)
         
         # Catch everything except a keyboard interrupt (which is how
         # requests from Thonny come in)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Benchmark how fast the simulated macropad gets presses to the computer.
+
+One simulate.py run per scenario, each in its own Python so nothing
+carries over, and a table of the latencies for each kind of action in it:
+from the switch closing to the computer getting the first report (or the
+new page being on the OLED), and from it opening to the keys being let
+go. Runs are deterministic, so a change in any column is a change in
+code.py (or lib/), not noise.
+
+Presses land at different points of the scan, poll and main loop cycles,
+so each scenario spaces them unevenly to get a spread of latencies rather
+than the same one again and again.
+
+    python3 sim/bench.py
+    python3 sim/bench.py --only bounce macro --compare HEAD~1
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+SIM = Path(__file__).resolve().parent
+CODE = SIM.parent / 'code'
+REPO = SIM.parent.parent
+
+# Presses in each scenario, starting once the macropad has booted
+PRESSES = 20
+START_MS = 2000
+# Not a multiple of any of the scan, poll or loop periods
+SPACING_MS = 473
+
+
+# What the default page's chord keys hold down
+CHORDS = {'1': ['CONTROL', 'A'], '5': ['CONTROL', 'Z'], '6': ['CONTROL', 'X'],
+          '7': ['CONTROL', 'C'], '8': ['CONTROL', 'V']}
+
+
+def presses(key, label, *, held=100, bounce=0, offset=0, spacing=SPACING_MS, count=PRESSES):
+    actions = [{'key': key, 'label': label, 'at': START_MS + offset + i * spacing,
+                'held': held, 'bounce': bounce} for i in range(count)]
+    if label.startswith('chord'):
+        for action in actions:
+            action['keys'] = CHORDS[key]
+    return actions
+
+
+def mixed():
+    """Everything, at random, as someone using it might."""
+    rng = random.Random(0)
+    actions = []
+    at = START_MS
+    for _ in range(3 * PRESSES):
+        at += rng.randrange(150, 700)
+        kind = rng.choice(['chord', 'chord', 'string', 'page', 'knob', 'spin'])
+        if kind == 'spin':
+            actions.append({'spin': rng.choice([-1, 1]) * rng.randrange(1, 8), 'label': 'spin',
+                            'at': at, 'step_ms': rng.randrange(10, 40)})
+            continue
+        key = {'chord': str(rng.choice([1, 5, 6, 7, 8])), 'string': '4',
+               'page': 'next', 'knob': 'knob'}[kind]
+        held = rng.randrange(40, 300)
+        actions.append({'key': key, 'label': kind, 'at': at, 'held': held,
+                        'bounce': rng.uniform(0, 5)})
+        at += held
+        if kind == 'chord':
+            actions[-1]['keys'] = CHORDS[key]
+        if kind == 'page':
+            # On round to the first page again, as the other keys are for that
+            for _ in range(2):
+                at += 400
+                actions.append(dict(actions[-1], at=at))
+    return actions
+
+
+# name: the actions, with the labels they're reported by. Keys are the
+# default "Text Utilities" page's: 1 is Ctrl+A, 3 runs a function that opens
+# a command prompt, and 4 types a signature.
+SCENARIOS = {
+    'keys': presses('1', 'chord'),
+    'bounce': presses('1', 'chord', bounce=5),
+    'held': presses('1', 'chord', held=400, spacing=2 * SPACING_MS),
+    # Page through all three pages, pressing a key while the OLED redraws
+    'page': (presses('next', 'page', spacing=2 * SPACING_MS)
+             + presses('1', 'key while redrawing', offset=30, spacing=2 * SPACING_MS)),
+    'macro': (presses('4', 'string', spacing=2 * SPACING_MS)
+              + presses('3', 'function', offset=SPACING_MS, spacing=2 * SPACING_MS)
+              + presses('5', 'chord during macro', offset=SPACING_MS + 60,
+                        spacing=2 * SPACING_MS)),
+    'knob': presses('knob', 'knob', bounce=2),
+    'spin': [{'spin': 10 if i % 2 else -10, 'label': 'spin', 'at': START_MS + i * SPACING_MS,
+              'step_ms': 10 + i} for i in range(PRESSES)],
+    'mixed': mixed(),
+}
+
+
+def simulate(script, code):
+    command = [sys.executable, str(SIM / 'simulate.py'), '--json', '--quiet',
+               '--script', str(script), '--code', str(code)]
+    # Same hash order every run, so sets and dicts iterate the same way too
+    env = dict(os.environ, PYTHONHASHSEED='0')
+    result = subprocess.run(command, capture_output=True, text=True, env=env)
+    if not result.stdout:
+        raise SystemExit(result.stderr)
+    return json.loads(result.stdout)
+
+
+def checkout(rev, tmp):
+    """macropad/code as it was at rev, in tmp."""
+    archive = subprocess.run(['git', '-C', str(REPO), 'archive', rev, 'macropad/code'],
+                             capture_output=True, check=True).stdout
+    subprocess.run(['tar', '-x', '-C', str(tmp)], input=archive, check=True)
+    return Path(tmp) / 'macropad' / 'code'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--only', nargs='+', choices=SCENARIOS, help='scenarios to run')
+    parser.add_argument('--compare', metavar='REV',
+                        help="run them on this git revision's code.py too")
+    parser.add_argument('--json', action='store_true', help='print the reports as JSON')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        codes = {'tree': CODE}
+        if args.compare:
+            codes[args.compare] = checkout(args.compare, tmp)
+        reports = {}
+        if not args.json:
+            print(f"{'scenario':<8} {'action':<21} "
+                  + (f"{'code':<8} " if args.compare else '')
+                  + f"{'n':>3} {'miss':>4} {'extra':>5} {'mean':>6} {'median':>6} {'p95':>6} "
+                  f"{'max':>6} {'release':>7} {'busy %':>6} {'host s':>6}")
+        for name in args.only or SCENARIOS:
+            script = Path(tmp) / f'{name}.json'
+            script.write_text(json.dumps(SCENARIOS[name]))
+            runs = {code: simulate(script, path) for code, path in codes.items()}
+            reports[name] = runs
+            if args.json:
+                continue
+            for label in runs['tree']['labels']:
+                for code, report in runs.items():
+                    group = report['labels'][label]
+                    latency = group['latency_ms']
+                    release = group['release_ms']
+                    print(f"{name:<8} {label:<21} " + (f"{code:<8} " if args.compare else '')
+                          + f"{group['actions']:3} {group['missed']:4} {group['extra_presses']:5} "
+                          + ' '.join(f"{latency[stat]:6.1f}" if latency else f"{'n/a':>6}"
+                                     for stat in ('mean', 'median', 'p95', 'max'))
+                          + (f" {release['median']:7.1f}" if release else f" {'n/a':>7}")
+                          + f" {report['busy_percent']:6.1f} {report['host_seconds']:6.1f}"
+                          + (f"  {report['error']}" if report['error'] else ''))
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        print('ms from the switch to the first report (the OLED for a page); release: median ms '
+              'from letting go to the keys being up; extra: presses switch bounce added')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+"""Stand-in for CircuitPython's built-in adafruit_bus_device."""
@@ -0,0 +1,7 @@
+"""Stand-in for adafruit_bus_device.spi_device: the macropad has no SPI devices."""
+
+
+class SPIDevice:
+    def __init__(self, spi, chip_select=None, *, baudrate=100000, polarity=0, phase=0,
+                 extra_clocks=0):
+        raise NotImplementedError("SPI isn't simulated")
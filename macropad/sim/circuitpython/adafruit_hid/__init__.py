@@ -0,0 +1,12 @@
+"""
+Stand-in for the adafruit_hid library, whose .mpy files on the drive only
+CircuitPython can load. The same API, working the same way, in plain
+Python, so its lines are timed like the real library's.
+"""
+
+
+def find_device(devices, *, usage_page, usage, timeout=None):
+    for device in devices:
+        if device.usage_page == usage_page and device.usage == usage:
+            return device
+    raise ValueError("Could not find matching HID device.")
@@ -0,0 +1,64 @@
+"""Stand-in for adafruit_hid.keyboard_layout_base."""
+
+import time
+
+
+class KeyboardLayoutBase:
+    """Types text on a keyboard, using a layout's table of characters to keys.
+
+    In ASCII_TO_KEYCODE the top bit of a keycode means it's typed with
+    shift; characters in NEED_ALTGR are typed with AltGr, and those above
+    ASCII are found in HIGHER_ASCII.
+    """
+
+    SHIFT_FLAG = 0x80
+    ALTGR_FLAG = 0x80
+    SHIFT_CODE = 0xE1
+    RIGHT_ALT_CODE = 0xE6
+    ASCII_TO_KEYCODE = ()
+    NEED_ALTGR = ""
+    HIGHER_ASCII = {}
+    COMBINED_KEYS = {}
+
+    def __init__(self, keyboard):
+        self.keyboard = keyboard
+
+    def _write(self, keycode, altgr=False):
+        if altgr:
+            self.keyboard.press(self.RIGHT_ALT_CODE)
+        if keycode & self.SHIFT_FLAG:
+            keycode &= ~self.SHIFT_FLAG
+            self.keyboard.press(self.SHIFT_CODE)
+        self.keyboard.press(keycode)
+        self.keyboard.release_all()
+
+    def write(self, string, delay=None):
+        for char in string:
+            if char in self.COMBINED_KEYS:
+                # The dead key first, then the letter
+                combined = self.COMBINED_KEYS[char]
+                self._write(combined >> 8, combined & self.ALTGR_FLAG)
+                char = chr(combined & 0xFF & ~self.ALTGR_FLAG)
+            self._write(self._char_to_keycode(char), char in self.NEED_ALTGR)
+            if delay is not None:
+                time.sleep(delay)
+
+    def keycodes(self, char):
+        keycode = self._char_to_keycode(char)
+        codes = []
+        if char in self.NEED_ALTGR:
+            codes.append(self.RIGHT_ALT_CODE)
+        if keycode & self.SHIFT_FLAG:
+            codes.append(self.SHIFT_CODE)
+        codes.append(keycode & ~self.SHIFT_FLAG)
+        return tuple(codes)
+
+    def _char_to_keycode(self, char):
+        char_val = ord(char)
+        if char_val >= len(self.ASCII_TO_KEYCODE):
+            keycode = self.HIGHER_ASCII.get(char_val, 0)
+        else:
+            keycode = self.ASCII_TO_KEYCODE[char_val]
+        if keycode == 0:
+            raise ValueError(f"No keycode available for character {char!r} ({char_val}).")
+        return keycode
@@ -0,0 +1,80 @@
+"""Stand-in for adafruit_hid.keycode: USB HID keyboard usage IDs."""
+
+
+class Keycode:
+    ENTER = 0x28
+    RETURN = ENTER
+    ESCAPE = 0x29
+    BACKSPACE = 0x2A
+    TAB = 0x2B
+    SPACEBAR = 0x2C
+    SPACE = SPACEBAR
+    MINUS = 0x2D
+    EQUALS = 0x2E
+    LEFT_BRACKET = 0x2F
+    RIGHT_BRACKET = 0x30
+    BACKSLASH = 0x31
+    POUND = 0x32
+    SEMICOLON = 0x33
+    QUOTE = 0x34
+    GRAVE_ACCENT = 0x35
+    COMMA = 0x36
+    PERIOD = 0x37
+    FORWARD_SLASH = 0x38
+    CAPS_LOCK = 0x39
+    PRINT_SCREEN = 0x46
+    SCROLL_LOCK = 0x47
+    PAUSE = 0x48
+    INSERT = 0x49
+    HOME = 0x4A
+    PAGE_UP = 0x4B
+    DELETE = 0x4C
+    END = 0x4D
+    PAGE_DOWN = 0x4E
+    RIGHT_ARROW = 0x4F
+    LEFT_ARROW = 0x50
+    DOWN_ARROW = 0x51
+    UP_ARROW = 0x52
+    KEYPAD_NUMLOCK = 0x53
+    KEYPAD_FORWARD_SLASH = 0x54
+    KEYPAD_ASTERISK = 0x55
+    KEYPAD_MINUS = 0x56
+    KEYPAD_PLUS = 0x57
+    KEYPAD_ENTER = 0x58
+    KEYPAD_PERIOD = 0x63
+    KEYPAD_BACKSLASH = 0x64
+    APPLICATION = 0x65
+    POWER = 0x66
+    KEYPAD_EQUALS = 0x67
+    LEFT_CONTROL = 0xE0
+    CONTROL = LEFT_CONTROL
+    LEFT_SHIFT = 0xE1
+    SHIFT = LEFT_SHIFT
+    LEFT_ALT = 0xE2
+    ALT = LEFT_ALT
+    OPTION = ALT
+    LEFT_GUI = 0xE3
+    GUI = LEFT_GUI
+    WINDOWS = GUI
+    COMMAND = GUI
+    RIGHT_CONTROL = 0xE4
+    RIGHT_SHIFT = 0xE5
+    RIGHT_ALT = 0xE6
+    RIGHT_GUI = 0xE7
+
+    @classmethod
+    def modifier_bit(cls, keycode):
+        """The bit in a report's modifier byte for a modifier key, else 0."""
+        return 1 << (keycode - 0xE0) if cls.LEFT_CONTROL <= keycode <= cls.RIGHT_GUI else 0
+
+
+# A to Z, the number row, F1 to F24 and the keypad digits
+for _i, _letter in enumerate("ABCDEFGHIJKLMNOPQRSTUVWXYZ"):
+    setattr(Keycode, _letter, 0x04 + _i)
+for _i, _name in enumerate(("ONE", "TWO", "THREE", "FOUR", "FIVE", "SIX", "SEVEN", "EIGHT",
+                            "NINE", "ZERO")):
+    setattr(Keycode, _name, 0x1E + _i)
+    setattr(Keycode, "KEYPAD_" + _name, 0x59 + _i)
+for _i in range(12):
+    setattr(Keycode, f"F{_i + 1}", 0x3A + _i)
+    setattr(Keycode, f"F{_i + 13}", 0x68 + _i)
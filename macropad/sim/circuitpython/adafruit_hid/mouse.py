@@ -0,0 +1,47 @@
+"""Stand-in for adafruit_hid.mouse."""
+
+from . import find_device
+
+
+class Mouse:
+    LEFT_BUTTON = 1
+    RIGHT_BUTTON = 2
+    MIDDLE_BUTTON = 4
+
+    def __init__(self, devices, timeout=None):
+        self._mouse_device = find_device(devices, usage_page=0x1, usage=0x02)
+        self.report = bytearray(4)
+        self._send_no_move()
+
+    def press(self, buttons):
+        self.report[0] |= buttons
+        self._send_no_move()
+
+    def release(self, buttons):
+        self.report[0] &= ~buttons
+        self._send_no_move()
+
+    def release_all(self):
+        self.report[0] = 0
+        self._send_no_move()
+
+    def click(self, buttons):
+        self.press(buttons)
+        self.release(buttons)
+
+    def move(self, x=0, y=0, wheel=0):
+        while x or y or wheel:
+            dx = min(127, max(-127, x))
+            dy = min(127, max(-127, y))
+            dwheel = min(127, max(-127, wheel))
+            self.report[1] = dx & 0xFF
+            self.report[2] = dy & 0xFF
+            self.report[3] = dwheel & 0xFF
+            self._mouse_device.send_report(self.report)
+            x -= dx
+            y -= dy
+            wheel -= dwheel
+
+    def _send_no_move(self):
+        self.report[1] = self.report[2] = self.report[3] = 0
+        self._mouse_device.send_report(self.report)
@@ -0,0 +1,62 @@
+"""Stand-in for CircuitPython's busio: I2C writes take as long as on the wire.
+
+A write that's a whole OLED frame (the SSD1306 driver sends its buffer in
+one go) is recorded in hardware.displays when it finishes.
+"""
+
+import hardware
+
+# Bytes in a write that make it a frame for the 128x32 OLED, and more
+FRAME_BYTES = 128 * 32 // 8
+
+
+class I2C:
+    def __init__(self, scl, sda, *, frequency=100_000, timeout=255):
+        self.frequency = frequency
+        self.locked = False
+
+    def try_lock(self):
+        hardware.clock.call()
+        if self.locked:
+            return False
+        self.locked = True
+        return True
+
+    def unlock(self):
+        self.locked = False
+
+    def scan(self):
+        return [0x3C]
+
+    def writeto(self, address, buffer, *, start=0, end=None):
+        hardware.clock.call()
+        n = len(buffer[start:end])
+        # Start, the address byte and n data bytes (8 bits and an ack each), stop
+        bits = 2 + 9 * (n + 1)
+        hardware.clock.spend(bits * 1_000_000_000 // self.frequency)
+        if n >= FRAME_BYTES:
+            hardware.displays.append(hardware.clock.now)
+
+    def readfrom_into(self, address, buffer, *, start=0, end=None):
+        self.writeto(address, buffer, start=start, end=end)
+
+    def writeto_then_readfrom(self, address, out_buffer, in_buffer, *, out_start=0,
+                              out_end=None, in_start=0, in_end=None):
+        self.writeto(address, out_buffer, start=out_start, end=out_end)
+        self.writeto(address, in_buffer, start=in_start, end=in_end)
+
+    def deinit(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.deinit()
+
+
+class SPI:
+    """Only here for adafruit_ssd1306's type hints: the OLED is on I2C."""
+
+    def __init__(self, clock, MOSI=None, MISO=None):
+        raise NotImplementedError("the simulated macropad has no SPI")
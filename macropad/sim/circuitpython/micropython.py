@@ -0,0 +1,5 @@
+"""Stand-in for CircuitPython's micropython module."""
+
+
+def const(value):
+    return value
@@ -0,0 +1,29 @@
+"""Stand-in for CircuitPython's rotaryio: the encoder turns as scripted."""
+
+import hardware
+
+
+class IncrementalEncoder:
+    """Counts the scripted detents; the hardware decodes them as they happen."""
+
+    def __init__(self, pin_a, pin_b, divisor=4):
+        self.offset = hardware.script.position(hardware.clock.now)
+
+    @property
+    def position(self):
+        hardware.clock.call()
+        return hardware.script.position(hardware.clock.now) - self.offset
+
+    @position.setter
+    def position(self, value):
+        hardware.clock.call()
+        self.offset = hardware.script.position(hardware.clock.now) - value
+
+    def deinit(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.deinit()
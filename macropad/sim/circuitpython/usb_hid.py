@@ -0,0 +1,39 @@
+"""Stand-in for CircuitPython's usb_hid: reports go to hardware.usb."""
+
+import hardware
+
+
+class Device:
+    def __init__(self, name, usage_page, usage, report_length):
+        self.name = name
+        self.usage_page = usage_page
+        self.usage = usage
+        self.report_length = report_length
+        self.last_received_report = None
+
+    def send_report(self, report, report_id=None):
+        hardware.clock.call()
+        if len(report) != self.report_length:
+            raise ValueError(f"Buffer length must be {self.report_length}")
+        hardware.usb.send(self.name, report)
+
+    def get_last_received_report(self, report_id=None):
+        return self.last_received_report
+
+    def __repr__(self):
+        return f"<Device {self.name}>"
+
+
+Device.KEYBOARD = Device("keyboard", 0x01, 0x06, 8)
+Device.MOUSE = Device("mouse", 0x01, 0x02, 4)
+Device.CONSUMER_CONTROL = Device("consumer", 0x0C, 0x01, 2)
+
+devices = (Device.KEYBOARD, Device.MOUSE, Device.CONSUMER_CONTROL)
+
+
+def enable(devices, boot_device=0):
+    pass
+
+
+def disable():
+    pass
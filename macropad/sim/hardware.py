@@ -0,0 +1,96 @@
+"""
+The simulated macropad's shared state: a virtual clock, the button presses
+and encoder turns scripted for a run, and what came out of it: the USB HID
+reports the computer received, and the times the OLED finished redrawing.
+
+The clock and the buttons are the ones every Pico project's simulator
+has, from pico-sim/picosim.py, as are the stand-ins for board, digitalio,
+keypad and supervisor; the macropad's own stand-ins in circuitpython/ work
+from these too. Nothing takes real time. The clock moves on when code.py
+sleeps, while it waits on the I2C bus or for the computer to collect a USB
+report, by CALL_NS for each call into a built-in module (keypad,
+digitalio, ...), and by LINE_NS for every line of Python run on the drive
+or in adafruit_hid, standing in for how slow CircuitPython is. So a run
+gives the same results every time, however fast or busy the computer is.
+"""
+
+import bisect
+import sys
+from pathlib import Path
+
+PICO_SIM = Path(__file__).resolve().parent.parent.parent / 'pico-sim'
+sys.path.insert(0, str(PICO_SIM))
+
+import picosim  # noqa: E402
+from picosim import Clock, SimulationDone, start_tracing, stop_tracing  # noqa: E402, F401
+
+# Clock advance per call into a built-in module, and per line of Python
+CALL_NS = 5_000
+LINE_NS = 4_000
+# The computer collects a report from each HID device this often
+POLL_MS = 8
+# What gc.mem_free() says: about what a Pico has free after loading
+MEM_FREE = 100_000
+
+clock = None
+script = None
+usb = None
+displays = []
+
+
+class Script(picosim.Script):
+    """What happens to the macropad from outside during a run.
+
+    presses maps a pin name ("GP6") to (press_ns, release_ns, bounce_ns)
+    for each press, as for picosim.Script. turns is (at_ns, steps) for
+    every detent of the encoder, steps being +1 clockwise and -1 back.
+    """
+
+    def __init__(self, presses=None, turns=()):
+        super().__init__(presses)
+        self.turns = sorted(turns)
+        self.turn_times = [at for at, _ in self.turns]
+        self.positions = []
+        position = 0
+        for _, steps in self.turns:
+            position += steps
+            self.positions.append(position)
+
+    def position(self, ns):
+        """Where the encoder has been turned to by ns, in detents."""
+        k = bisect.bisect_right(self.turn_times, ns)
+        return self.positions[k - 1] if k else 0
+
+
+class USB:
+    """The computer's end of the USB HID devices.
+
+    Each device has room for one report. The computer collects it at the
+    next poll, every POLL_MS; a device sending another before then waits
+    for it to go, as CircuitPython's does. `reports` is (ns, device name,
+    report bytes) for every report collected.
+    """
+
+    def __init__(self, poll_ns):
+        self.poll_ns = poll_ns
+        self.reports = []
+        self.collect_ns = {}
+
+    def send(self, name, report):
+        waiting = self.collect_ns.get(name, 0)
+        if waiting > clock.now:
+            clock.advance_to(waiting)
+        collect = (clock.now // self.poll_ns + 1) * self.poll_ns
+        self.collect_ns[name] = collect
+        if collect < clock.end_ns:
+            self.reports.append((collect, name, bytes(report)))
+
+
+def install(new_clock, new_script, poll_ms=POLL_MS):
+    """Make time, gc and random behave as they do on the macropad."""
+    global clock, script, usb
+    clock = new_clock
+    script = new_script
+    usb = USB(int(poll_ms * 1_000_000))
+    displays.clear()
+    picosim.install(clock, script, MEM_FREE)
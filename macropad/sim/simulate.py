@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+"""
+Run the macropad's code.py on a computer against simulated hardware.
+
+code.py runs as it is (bar a repeated `global` CPython won't compile), on
+a copy of macropad/code as its CIRCUITPY drive, with stand-ins for
+rotaryio, busio, usb_hid and adafruit_hid (in circuitpython/) and board,
+digitalio, keypad and supervisor (shared with the cube's simulator, in
+pico-sim/circuitpython/). Buttons are pressed, bounce and the knob is turned as
+scripted, and every USB HID report the computer collects is recorded with
+the time it got it, as is every time the OLED finished a redraw. Time is
+virtual (see hardware.py), so a run gives the same results every time.
+
+At the end it reports, for each press, how long it took to reach the
+computer: from the switch closing to the first report (or, for the next
+page button, to the new page being on the OLED), from opening to the keys
+being let go, and any extra presses that switch bounce turned it into.
+
+    python3 sim/simulate.py --press 1@2000 --press next@3000:200 --spin 4000:5
+    python3 sim/simulate.py --press 1@2000 --holds 1=CONTROL+A --bounce 5 --set IDLE_SLEEP=0
+    python3 sim/simulate.py --script presses.json --bounce 5 --reports reports.csv
+"""
+
+import argparse
+import contextlib
+import csv
+import json
+import os
+import re
+import runpy
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SIM = Path(__file__).resolve().parent
+sys.path.insert(0, str(SIM))
+
+import hardware  # noqa: E402
+
+CODE = SIM.parent / 'code'
+# The pins the buttons are on, by the names used here for them
+PINS = {
+    '1': 'GP6', '2': 'GP7', '3': 'GP8', '4': 'GP9',
+    '5': 'GP17', '6': 'GP16', '7': 'GP15', '8': 'GP14',
+    'next': 'GP5', 'knob': 'GP2',
+}
+# A press with no length given is a short one
+PRESS_MS = 100
+# Time between the detents of a spin with no speed given
+STEP_MS = 20
+# How long after the last action a run goes on for, to see it through
+TAIL_MS = 2000
+
+
+class Console:
+    """stdout for the macropad: each line stamped with the virtual time."""
+
+    def __init__(self, out, quiet=False):
+        self.out = out
+        self.quiet = quiet
+        self.at_start = True
+
+    def write(self, text):
+        if self.quiet:
+            return len(text)
+        for line in text.splitlines(keepends=True):
+            if self.at_start:
+                self.out.write(f'[{hardware.clock.now / 1e9:8.3f}] ')
+            self.out.write(line)
+            self.at_start = line.endswith('\n')
+        return len(text)
+
+    def flush(self):
+        self.out.flush()
+
+
+################################################
+# THE SCRIPT — what's done to the macropad, and when
+################################################
+
+def parse_press(text, bounce):
+    """KEY@MS[:HELD_MS] as an action."""
+    key, _, when = text.partition('@')
+    at, _, held = when.partition(':')
+    if key not in PINS or not at:
+        raise SystemExit(f'--press {text}: expected KEY@MS[:HELD_MS], KEY one of {", ".join(PINS)}')
+    return {'key': key, 'at': float(at), 'held': float(held or PRESS_MS), 'bounce': bounce}
+
+
+def keycodes(names):
+    """Keycode names (or numbers) as (modifier bits, other keycodes)."""
+    from circuitpython.adafruit_hid.keycode import Keycode
+    modifiers = 0
+    codes = []
+    for name in names:
+        code = name if isinstance(name, int) else getattr(Keycode, str(name).upper(), None)
+        if code is None:
+            raise SystemExit(f'no Keycode.{name}')
+        if Keycode.modifier_bit(code):
+            modifiers |= Keycode.modifier_bit(code)
+        else:
+            codes.append(code)
+    return modifiers, tuple(codes)
+
+
+def parse_spin(text):
+    """MS:STEPS[:STEP_MS] as an action."""
+    at, steps, step_ms = (text.split(':') + [STEP_MS])[:3]
+    return {'spin': int(steps), 'at': float(at), 'step_ms': float(step_ms)}
+
+
+def load_actions(args):
+    """Every action for the run, from --script and the command line, in time order.
+
+    An action is {"key": KEY, "at": MS, "held": MS, "bounce": MS} for a
+    press, or {"spin": STEPS, "at": MS, "step_ms": MS} for turning the knob,
+    negative STEPS being anticlockwise. Either can have a "label" to group
+    it by in the report, instead of the key or "spin". A press can have
+    "keys", the Keycodes it holds down (["CONTROL", "A"]), for it to be
+    told apart from anything else being typed, and timed letting go;
+    --holds gives them for every press of a key.
+    """
+    holds = {}
+    for entry in args.holds:
+        key, _, names = entry.partition('=')
+        holds[key] = names.split('+')
+    actions = json.loads(args.script.read_text()) if args.script else []
+    actions += [parse_press(press, args.bounce) for press in args.press]
+    actions += [parse_spin(spin) for spin in args.spin]
+    for action in actions:
+        if 'key' in action:
+            action['key'] = str(action['key'])
+            if action['key'] not in PINS:
+                raise SystemExit(f'no key {action["key"]!r}: keys are {", ".join(PINS)}')
+            action.setdefault('held', PRESS_MS)
+            action.setdefault('bounce', args.bounce)
+            if action['key'] in holds:
+                action.setdefault('keys', holds[action['key']])
+            if 'keys' in action:
+                action['keys'] = keycodes(action['keys'])
+        else:
+            action.setdefault('step_ms', STEP_MS)
+        action.setdefault('label', action.get('key') or 'spin')
+    return sorted(actions, key=lambda action: action['at'])
+
+
+def make_script(actions):
+    presses = {}
+    turns = []
+    for action in actions:
+        at = int(action['at'] * 1e6)
+        if 'key' in action:
+            pin_presses = presses.setdefault(PINS[action['key']], [])
+            if pin_presses and at < pin_presses[-1][1] + pin_presses[-1][2]:
+                raise SystemExit(f'key {action["key"]} is pressed at {action["at"]} ms '
+                                 'before it has been let go')
+            pin_presses.append((at, at + int(action['held'] * 1e6), int(action['bounce'] * 1e6)))
+        else:
+            step = 1 if action['spin'] > 0 else -1
+            turns += [(at + int(i * action['step_ms'] * 1e6), step)
+                      for i in range(abs(action['spin']))]
+    return hardware.Script(presses, turns)
+
+
+################################################
+# RUNNING
+################################################
+
+def repeated_globals(source):
+    """source with `global` lines that repeat one earlier in the function made `pass`.
+
+    CircuitPython allows them, but CPython won't compile a function that
+    declares a name global after using it.
+    """
+    lines = source.splitlines(keepends=True)
+    declared = set()
+    for k, line in enumerate(lines):
+        stripped = line.lstrip()
+        if stripped.startswith('def '):
+            declared = set()
+        elif stripped.startswith('global '):
+            names = {name.strip() for name in stripped[len('global '):].split('#')[0].split(',')}
+            if names <= declared:
+                lines[k] = line[:len(line) - len(stripped)] + 'pass\n'
+            declared |= names
+    return ''.join(lines)
+
+
+def make_drive(drive, args):
+    """Copy code/ to drive, with the run's own keys.py and settings.
+
+    The .mpy files are left behind, as CPython can't load them: the
+    stand-ins in circuitpython/ take their place.
+    """
+    shutil.copytree(args.code, drive, ignore=shutil.ignore_patterns('*.mpy', '__pycache__'))
+    if args.keys:
+        shutil.copy(args.keys, drive / 'keys.py')
+    code_py = drive / 'code.py'
+    source = repeated_globals(code_py.read_text())
+    for setting in args.set:
+        name, _, value = setting.partition('=')
+        source, n = re.subn(rf'^{name} = .*$', f'{name} = {value}', source, count=1,
+                            flags=re.MULTILINE)
+        if not n:
+            raise SystemExit(f'code.py has no setting {name}')
+    code_py.write_text(source)
+
+
+def run(args, actions):
+    """Run code.py on the simulated macropad until time is up."""
+    if args.seconds:
+        end_ms = args.seconds * 1000
+    else:
+        end_ms = TAIL_MS + max([action['at'] + action.get('held', 0)
+                                + action.get('step_ms', 0) * abs(action.get('spin', 0))
+                                for action in actions], default=0)
+    clock = hardware.Clock(int(end_ms * 1e6), int(args.call_us * 1000), int(args.line_us * 1000))
+    hardware.install(clock, make_script(actions), args.poll_ms)
+
+    error = None
+    with tempfile.TemporaryDirectory() as tmp:
+        drive = Path(tmp) / 'CIRCUITPY'
+        make_drive(drive, args)
+        cwd = os.getcwd()
+        os.chdir(drive)
+        # The stand-ins come before lib/, so adafruit_hid is theirs
+        sys.path[:0] = [str(drive), str(SIM / 'circuitpython'),
+                        str(hardware.PICO_SIM / 'circuitpython'), str(drive / 'lib')]
+        console = Console(sys.stderr if args.json else sys.stdout, args.quiet)
+        host_start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(console):
+                # Python on the drive and in adafruit_hid runs at CircuitPython speed
+                hardware.start_tracing(drive, SIM / 'circuitpython' / 'adafruit_hid')
+                runpy.run_path(str(drive / 'code.py'), run_name='__main__')
+            error = 'code.py finished'
+        except hardware.SimulationDone:
+            pass
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            error = f'{type(e).__name__}: {e}'
+        finally:
+            hardware.stop_tracing()
+            host_s = time.perf_counter() - host_start
+            os.chdir(cwd)
+    return clock, host_s, error
+
+
+################################################
+# ANALYSIS — from the reports back to the presses
+################################################
+
+def keys_down(report):
+    """Whether a report has any key, modifier or control held."""
+    return any(report)
+
+
+def holds(report, keys):
+    """Whether a keyboard report has all of keys, (modifier bits, keycodes), down."""
+    modifiers, codes = keys
+    return report[0] & modifiers == modifiers and all(code in report[2:] for code in codes)
+
+
+def spread(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return {'mean': statistics.fmean(values), 'min': ordered[0],
+            'median': statistics.median(values),
+            'p95': ordered[min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))],
+            'max': ordered[-1]}
+
+
+def device(action):
+    """What a press shows up on."""
+    if 'key' not in action:
+        return 'consumer'
+    return {'next': 'display', 'knob': 'consumer'}.get(action['key'], 'keyboard')
+
+
+def windows(actions, end_ns):
+    """When to stop looking for what came of each action, in ns.
+
+    That's when the next action that would show up the same way starts:
+    the next on the same device, and for keys with keys to look for, the
+    next that has them too.
+    """
+    ends = []
+    for k, action in enumerate(actions):
+        ends.append(next((int(later['at'] * 1e6) for later in actions[k + 1:]
+                          if device(later) == device(action)
+                          and ('keys' in later) == ('keys' in action)), end_ns))
+    return ends
+
+
+def outcome(action, until_ns, reports, displays):
+    """What came of one press, up to until_ns."""
+    start = int(action['at'] * 1e6)
+    end = start + int(action['held'] * 1e6)
+    result = {'label': action['label'], 'at_ms': action['at'], 'latency_ms': None,
+              'release_ms': None, 'last_ms': None, 'extra_presses': 0}
+    if device(action) == 'display':
+        frames = [ns for ns in displays if start <= ns < until_ns]
+        if frames:
+            result['latency_ms'] = (frames[0] - start) / 1e6
+        result['extra_presses'] = max(0, len(frames) - 1)
+        return result
+
+    sent = [(ns, report) for ns, name, report in reports
+            if name == device(action) and start <= ns < until_ns]
+    if device(action) == 'consumer':
+        if sent:
+            result['latency_ms'] = (sent[0][0] - start) / 1e6
+        result['extra_presses'] = max(0, sum(keys_down(report) for _, report in sent) - 1)
+        return result
+
+    if 'keys' not in action:
+        # Typing or a macro: when it started and when it finished
+        if sent:
+            result['latency_ms'] = (sent[0][0] - start) / 1e6
+            result['last_ms'] = (sent[-1][0] - start) / 1e6
+        return result
+
+    # Keys held down until it's let go: when they went down (and how often),
+    # and when they came up after it was let go
+    keys = action['keys']
+    downs = [ns for k, (ns, report) in enumerate(sent)
+             if holds(report, keys) and not (k and holds(sent[k - 1][1], keys))]
+    if downs:
+        result['latency_ms'] = (downs[0] - start) / 1e6
+        result['extra_presses'] = len(downs) - 1
+        up = next((ns for ns, report in sent if ns > end and not holds(report, keys)), None)
+        if up is not None:
+            result['release_ms'] = (up - end) / 1e6
+    return result
+
+
+def spin_outcomes(action, until_ns, reports):
+    """What came of each detent of a spin."""
+    start = int(action['at'] * 1e6)
+    step_ns = int(action['step_ms'] * 1e6)
+    steps = abs(action['spin'])
+    sent = [ns for ns, name, report in reports
+            if name == 'consumer' and start <= ns < until_ns and keys_down(report)]
+    results = []
+    for i in range(steps):
+        # Each detent's report is the first one not already taken by the ones before it
+        at = start + i * step_ns
+        ns = sent[i] if i < len(sent) else None
+        results.append({'label': action['label'], 'at_ms': at / 1e6,
+                        'latency_ms': (ns - at) / 1e6 if ns is not None and ns >= at else None,
+                        'release_ms': None, 'last_ms': None, 'extra_presses': 0})
+    results[-1]['extra_presses'] = max(0, len(sent) - steps)
+    return results
+
+
+def busy_percent(clock, from_ns):
+    """How much of the time from from_ns code.py wasn't asleep."""
+    slept = sum(min(end, clock.now) - max(start, from_ns)
+                for start, end in clock.sleeps if end > from_ns)
+    span = clock.now - from_ns
+    return 100 * (span - slept) / span if span > 0 else None
+
+
+def analyse(actions, clock):
+    reports = hardware.usb.reports
+    displays = hardware.displays
+    first = int(actions[0]['at'] * 1e6) if actions else clock.now
+    # Booting ends with the first page going up on the OLED
+    booted = max([ns for ns in displays if ns <= first], default=0)
+    results = []
+    for action, until in zip(actions, windows(actions, clock.now)):
+        if 'key' in action:
+            results.append(outcome(action, until, reports, displays))
+        else:
+            results.extend(spin_outcomes(action, until, reports))
+
+    labels = {}
+    for result in results:
+        group = labels.setdefault(result['label'], {'actions': 0, 'missed': 0, 'latency_ms': [],
+                                                    'release_ms': [], 'last_ms': [],
+                                                    'extra_presses': 0})
+        group['actions'] += 1
+        if result['latency_ms'] is None:
+            group['missed'] += 1
+        group['extra_presses'] += result['extra_presses']
+        for name in ('latency_ms', 'release_ms', 'last_ms'):
+            if result[name] is not None:
+                group[name].append(result[name])
+    for group in labels.values():
+        for name in ('latency_ms', 'release_ms', 'last_ms'):
+            group[name] = spread(group[name])
+
+    return {
+        'seconds': clock.now / 1e9,
+        'boot_ms': booted / 1e6,
+        'busy_percent': busy_percent(clock, booted),
+        'reports': len(reports),
+        'redraws': len(displays),
+        'labels': labels,
+        'actions': results,
+    }
+
+
+def write_reports(path):
+    """Every HID report the computer collected, as CSV."""
+    with open(path, 'w', newline='') as f:
+        out = csv.writer(f)
+        out.writerow(['ms', 'device', 'report'])
+        for ns, name, report in hardware.usb.reports:
+            out.writerow([f'{ns / 1e6:.3f}', name, report.hex(' ')])
+
+
+def print_report(report, host_s):
+    def ms(spread):
+        if spread is None:
+            return 'n/a'
+        return (f"mean {spread['mean']:.1f} median {spread['median']:.1f} "
+                f"p95 {spread['p95']:.1f} max {spread['max']:.1f}")
+
+    busy = report['busy_percent']
+    print(f"simulated {report['seconds']:.1f} s in {host_s:.1f} s; booted in "
+          f"{report['boot_ms']:.0f} ms, then busy "
+          + (f"{busy:.1f}%" if busy is not None else 'n/a'))
+    print(f"{report['reports']} HID reports, {report['redraws']} OLED redraws")
+    for label, group in report['labels'].items():
+        print(f"{label}: {group['actions']} actions"
+              + (f", {group['missed']} missed" if group['missed'] else '')
+              + (f", {group['extra_presses']} extra presses" if group['extra_presses'] else ''))
+        print(f"    press to report ms: {ms(group['latency_ms'])}")
+        if group['release_ms']:
+            print(f"    release to report ms: {ms(group['release_ms'])}")
+        if group['last_ms']:
+            print(f"    press to last report ms: {ms(group['last_ms'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float,
+                        help=f'virtual seconds to run for (default: until {TAIL_MS} ms after '
+                        'the last action)')
+    parser.add_argument('--code', type=Path, default=CODE, help='the CIRCUITPY files to run')
+    parser.add_argument('--keys', type=Path, help='use this keys.py instead')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='change a setting in code.py, e.g. IDLE_SLEEP=0')
+    parser.add_argument('--press', action='append', default=[], metavar='KEY@MS[:HELD_MS]',
+                        help=f'press KEY ({", ".join(PINS)}) at MS for HELD_MS '
+                        f'(default {PRESS_MS})')
+    parser.add_argument('--holds', action='append', default=[], metavar='KEY=KEYCODE+...',
+                        help='what KEY holds down, e.g. 1=CONTROL+A, to time letting go of it')
+    parser.add_argument('--bounce', type=float, default=0,
+                        help='ms the switches bounce for on --press and release')
+    parser.add_argument('--spin', action='append', default=[], metavar='MS:STEPS[:STEP_MS]',
+                        help=f'turn the knob STEPS detents from MS, one every STEP_MS '
+                        f'(default {STEP_MS})')
+    parser.add_argument('--script', type=Path, help='a JSON list of actions to do as well')
+    parser.add_argument('--poll-ms', type=float, default=hardware.POLL_MS,
+                        help='ms between the computer collecting reports')
+    parser.add_argument('--line-us', type=float, default=hardware.LINE_NS / 1000,
+                        help='µs a line of Python takes on the macropad')
+    parser.add_argument('--call-us', type=float, default=hardware.CALL_NS / 1000,
+                        help='µs a call into a built-in module takes')
+    parser.add_argument('--reports', type=Path, help='write the HID reports to this CSV')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('--quiet', action='store_true', help="hide the macropad's console")
+    args = parser.parse_args()
+
+    actions = load_actions(args)
+    clock, host_s, error = run(args, actions)
+    report = analyse(actions, clock)
+    report['host_seconds'] = host_s
+    report['error'] = error
+    if args.reports:
+        write_reports(args.reports)
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print_report(report, host_s)
+    if error:
+        raise SystemExit(f'stopped early: {error}')
+
+
+if __name__ == '__main__':
+    main()
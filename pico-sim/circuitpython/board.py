@@ -0,0 +1,16 @@
+"""Stand-in for CircuitPython's board module on a Raspberry Pi Pico."""
+
+
+class Pin:
+    def __init__(self, name, number):
+        self.name = name
+        self.number = number
+
+    def __repr__(self):
+        return f"board.{self.name}"
+
+
+for _number in range(29):
+    globals()[f"GP{_number}"] = Pin(f"GP{_number}", _number)
+for _name, _number in (("LED", 25), ("A0", 26), ("A1", 27), ("A2", 28)):
+    globals()[_name] = globals()[f"GP{_number}"]
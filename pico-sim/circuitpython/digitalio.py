@@ -0,0 +1,60 @@
+"""Stand-in for CircuitPython's digitalio: inputs read the scripted switches."""
+
+import picosim
+
+
+class Direction:
+    INPUT = "input"
+    OUTPUT = "output"
+
+
+class Pull:
+    UP = "up"
+    DOWN = "down"
+
+
+class DriveMode:
+    PUSH_PULL = "push_pull"
+    OPEN_DRAIN = "open_drain"
+
+
+class DigitalInOut:
+    """A pin with a switch to ground on it, as scripted, when it's an input."""
+
+    def __init__(self, pin):
+        self.pin = pin
+        self.direction = Direction.INPUT
+        self.pull = None
+        self.drive_mode = DriveMode.PUSH_PULL
+        self.output = False
+
+    def switch_to_input(self, pull=None):
+        self.direction = Direction.INPUT
+        self.pull = pull
+
+    def switch_to_output(self, value=False, drive_mode=DriveMode.PUSH_PULL):
+        self.direction = Direction.OUTPUT
+        self.output = value
+        self.drive_mode = drive_mode
+
+    @property
+    def value(self):
+        picosim.clock.call()
+        if self.direction == Direction.OUTPUT:
+            return self.output
+        pressed = picosim.script.pressed(self.pin.name, picosim.clock.now)
+        return not pressed if self.pull == Pull.UP else pressed
+
+    @value.setter
+    def value(self, value):
+        picosim.clock.call()
+        self.output = value
+
+    def deinit(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.deinit()
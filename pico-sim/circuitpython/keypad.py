@@ -0,0 +1,126 @@
+"""Stand-in for CircuitPython's keypad: scans the scripted switches.
+
+Scanning happens in the background on the real thing; here the scans due
+since the last look are caught up on whenever the queue is looked at, with
+each event stamped with the time of the scan that made it.
+"""
+
+import picosim
+
+
+class Event:
+    def __init__(self, key_number=0, pressed=True):
+        self.key_number = key_number
+        self.pressed = pressed
+        self.released = not pressed
+        self.timestamp = 0
+
+    def __repr__(self):
+        return f"<Event: key_number {self.key_number} {'pressed' if self.pressed else 'released'}>"
+
+
+class EventQueue:
+    def __init__(self, scanner, max_events):
+        self.scanner = scanner
+        self.max_events = max_events
+        self.events = []
+        self._overflowed = False
+
+    def put(self, key_number, pressed, timestamp):
+        if len(self.events) >= self.max_events:
+            self._overflowed = True
+            return
+        self.events.append((key_number, pressed, timestamp))
+
+    def get_into(self, event):
+        self.scanner.catch_up()
+        if not self.events:
+            return False
+        event.key_number, event.pressed, event.timestamp = self.events.pop(0)
+        event.released = not event.pressed
+        return True
+
+    def get(self):
+        event = Event()
+        return event if self.get_into(event) else None
+
+    def clear(self):
+        self.scanner.catch_up()
+        self.events.clear()
+        self._overflowed = False
+
+    @property
+    def overflowed(self):
+        self.scanner.catch_up()
+        return self._overflowed
+
+    def __len__(self):
+        self.scanner.catch_up()
+        return len(self.events)
+
+    def __bool__(self):
+        return len(self) > 0
+
+
+class Keys:
+    """One switch per pin, scanned every interval.
+
+    A key changes state once it has read the other way on debounce_threshold
+    scans in a row.
+    """
+
+    def __init__(self, pins, *, value_when_pressed, pull=True, interval=0.02,
+                 max_events=64, debounce_threshold=1):
+        picosim.clock.call()
+        self.pins = [pin.name for pin in pins]
+        self.key_count = len(pins)
+        self.interval_ns = max(1, round(interval * 1e9))
+        self.threshold = debounce_threshold
+        self.next_scan = picosim.clock.now
+        self.reset()
+        self.events = EventQueue(self, max_events)
+
+    def reset(self):
+        """Forget the keys' states: ones held down get pressed events again."""
+        self.states = [False] * self.key_count
+        self.counts = [0] * self.key_count
+
+    def scan(self, at_ns):
+        timestamp = (at_ns // 1_000_000) % (1 << 29)
+        for k, pin in enumerate(self.pins):
+            pressed = picosim.script.pressed(pin, at_ns)
+            if pressed == self.states[k]:
+                self.counts[k] = 0
+                continue
+            self.counts[k] += 1
+            if self.counts[k] >= self.threshold:
+                self.states[k] = pressed
+                self.counts[k] = 0
+                self.events.put(k, pressed, timestamp)
+
+    def catch_up(self):
+        picosim.clock.call()
+        now = picosim.clock.now
+        while self.next_scan <= now:
+            if not any(self.counts) and self.states == [
+                    picosim.script.pressed(pin, self.next_scan) for pin in self.pins]:
+                # Nothing will change until a switch next does: skip to it
+                edge = picosim.script.next_edge(self.next_scan)
+                if edge is None or edge > now:
+                    last = now - (now - self.next_scan) % self.interval_ns
+                    self.next_scan = last + self.interval_ns
+                    break
+                scans = -(-(edge - self.next_scan) // self.interval_ns)
+                self.next_scan += scans * self.interval_ns
+                continue
+            self.scan(self.next_scan)
+            self.next_scan += self.interval_ns
+
+    def deinit(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.deinit()
@@ -0,0 +1,20 @@
+"""Stand-in for CircuitPython's supervisor."""
+
+import picosim
+
+
+class Runtime:
+    autoreload = True
+    serial_connected = True
+
+    @property
+    def serial_bytes_available(self):
+        return picosim.script.serial_available()
+
+
+runtime = Runtime()
+
+
+def ticks_ms():
+    picosim.clock.call()
+    return picosim.clock.ticks_ms()
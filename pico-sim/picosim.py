@@ -0,0 +1,190 @@
+"""
+What the simulators of the Pico projects (led-cube/sim and macropad/sim)
+share: a virtual clock, the switches and serial console input scripted for
+a run, and installing them in place of time, gc, random and sys.stdin.
+
+The stand-in CircuitPython modules in circuitpython/ here (board,
+digitalio, keypad and supervisor) work from these; each project's sim
+adds its own in its own circuitpython/, and its hardware.py builds on
+this. Nothing takes real time. The clock moves on when code.py sleeps, by
+the clock's call_ns for each call into a built-in module (reading the
+clock, keypad, digitalio, ...), and by its line_ns for every line of
+Python traced (see start_tracing). So a run gives the same results every
+time, however fast or busy the computer is.
+"""
+
+import bisect
+import gc
+import random
+import sys
+import time
+
+# Switch contacts chatter this many times, evenly over the bounce time,
+# before they settle
+CHATTERS = 3
+
+clock = None
+script = None
+
+
+class SimulationDone(BaseException):
+    """The virtual clock reached the end of the run.
+
+    A BaseException, so code.py's own error handling lets it through.
+    """
+
+
+class Clock:
+    """Virtual time in ns since the simulated Pico was powered up.
+
+    Each time it moves on, every function in `listeners` is called with the
+    new time, for hardware that runs by itself to catch up. `sleeps` is
+    (start, end) for every time.sleep() code.py made, so the rest of the
+    time it was busy.
+    """
+
+    def __init__(self, end_ns, call_ns, line_ns=0):
+        self.now = 0
+        self.end_ns = end_ns
+        self.call_ns = call_ns
+        self.line_ns = line_ns
+        self.listeners = []
+        self.sleeps = []
+
+    def advance_to(self, ns):
+        """Move time on, bringing every listener up to date."""
+        done = ns >= self.end_ns
+        self.now = min(max(ns, self.now), self.end_ns)
+        for listener in self.listeners:
+            listener(self.now)
+        if done:
+            raise SimulationDone
+
+    def spend(self, ns):
+        self.advance_to(self.now + ns)
+
+    def call(self):
+        """A call into a built-in module."""
+        self.advance_to(self.now + self.call_ns)
+
+    def monotonic_ns(self):
+        self.call()
+        return self.now
+
+    def monotonic(self):
+        return self.monotonic_ns() / 1e9
+
+    def sleep(self, seconds):
+        # CircuitPython sleeps whole milliseconds and wakes on a 1 ms tick,
+        # so up to 1 ms late
+        ms = int(seconds * 1000)
+        start = self.now
+        try:
+            self.advance_to((self.now // 1_000_000 + ms + 1) * 1_000_000)
+        finally:
+            self.sleeps.append((start, self.now))
+
+    def ticks_ms(self):
+        return (self.now // 1_000_000) % (1 << 29)
+
+    def trace(self, frame, event, arg):
+        """sys.settrace() hook: line_ns for every line run in `traced` files."""
+        if frame.f_code.co_filename.startswith(self.traced):
+            return self.trace_lines
+        return None
+
+    def trace_lines(self, frame, event, arg):
+        if event == 'line':
+            self.advance_to(self.now + self.line_ns)
+        return self.trace_lines
+
+
+class Script:
+    """What happens to the Pico from outside during a run.
+
+    presses maps a pin name ("GP6") to (press_ns, release_ns, bounce_ns)
+    for each press of the switch to ground on it; while a switch bounces
+    its contacts open and close CHATTERS times before settling. typed is
+    (at_ms, text) pairs typed on the serial console.
+    """
+
+    def __init__(self, presses=None, typed=()):
+        self.edges = {}
+        for pin_name, pin_presses in (presses or {}).items():
+            edges = []
+            for start, end, bounce in sorted(pin_presses):
+                for at, pressed in ((start, True), (end, False)):
+                    for i in range(2 * CHATTERS + 1 if bounce else 1):
+                        edges.append((at + bounce * i // (2 * CHATTERS),
+                                      pressed == (i % 2 == 0)))
+            self.edges[pin_name] = edges
+        self.times = {name: [at for at, _ in edges] for name, edges in self.edges.items()}
+        self.typed = sorted(typed)
+        self.input = ''
+
+    def pressed(self, pin_name, ns):
+        """Whether a pin's switch is closed at ns."""
+        k = bisect.bisect_right(self.times.get(pin_name, ()), ns)
+        return k > 0 and self.edges[pin_name][k - 1][1]
+
+    def next_edge(self, ns):
+        """The first time after ns that any switch opens or closes, or None."""
+        nexts = [times[k] for times in self.times.values()
+                 for k in [bisect.bisect_right(times, ns)] if k < len(times)]
+        return min(nexts) if nexts else None
+
+    def serial_available(self):
+        now_ms = clock.now // 1_000_000
+        while self.typed and self.typed[0][0] <= now_ms:
+            self.input += self.typed.pop(0)[1]
+        return len(self.input)
+
+    def read(self, n):
+        """Read n characters from the console, waiting for them if need be."""
+        while self.serial_available() < n:
+            # Nothing more will ever be typed: wait out the rest of the run
+            at_ms = self.typed[0][0] if self.typed else clock.end_ns // 1_000_000
+            clock.advance_to(at_ms * 1_000_000)
+        text, self.input = self.input[:n], self.input[n:]
+        return text
+
+
+class Stdin:
+    """sys.stdin for code.py: the scripted console input."""
+
+    def read(self, n=1):
+        return script.read(n)
+
+    def readline(self):
+        text = ''
+        while not text.endswith('\n'):
+            text += script.read(1)
+        return text
+
+
+def install(new_clock, new_script, mem_free):
+    """Make time, gc, random and sys.stdin behave as they do on a Pico.
+
+    mem_free is what gc.mem_free() says: about what the Pico has free
+    after loading.
+    """
+    global clock, script
+    clock = new_clock
+    script = new_script
+    time.monotonic_ns = clock.monotonic_ns
+    time.monotonic = clock.monotonic
+    time.sleep = clock.sleep
+    gc.mem_free = lambda: mem_free
+    gc.mem_alloc = lambda: 0
+    random.seed(0)
+    sys.stdin = Stdin()
+
+
+def start_tracing(*paths):
+    """Charge the clock's line_ns for every line run in files under any of paths."""
+    clock.traced = tuple(str(p) for p in paths)
+    sys.settrace(clock.trace)
+
+
+def stop_tracing():
+    sys.settrace(None)